@@ -1,30 +1,93 @@
+import re
 import sys
+import time
+from contextlib import ExitStack, nullcontext
+from dataclasses import dataclass
+from multiprocessing.pool import ThreadPool
 from os import PathLike
 from pathlib import Path
+from queue import Queue
 from tempfile import TemporaryDirectory
+from typing import TYPE_CHECKING, Any, Generator
 
 from rich import print as rprint
 from rich.markup import escape
-from rich.progress import (
-    BarColumn,
-    Progress,
-    SpinnerColumn,
-    TaskProgressColumn,
-    TextColumn,
-    TimeRemainingColumn,
-)
 
-from .background import PaintMsg
-from .ffmpeg import FFMpegHWTest, FFMpegProgress, VideoInfo, get_ffmpeg
+from .background import ALPHA_FILE, BACKGROUND_FILE, PaintMsg, cached_paint_msg
+from .cache import AssetCache, RotationCache, file_identity
+from .ffmpeg import (
+    FFMpegCapabilities,
+    FFMpegError,
+    FFMpegProgress,
+    VideoInfo,
+    audio_copy,
+    concat_videos,
+    get_ffmpeg,
+    raw_image_input,
+)
 from .log import log
-from .rotation_calc import RotationCalc
-from .utils import FPSColumn, ask_confirm
+from .profiling import StageProfiler
+from .rotation_calc import (
+    EXTRACT_PROFILES,
+    ExtractSegment,
+    RotationCalc,
+    angles_to_intervals,
+    format_cmd,
+)
+from .track import read_track, store_track
+
+# 进度条、PIL 与界面只在用到时导入，命令行启动时不必加载
+if TYPE_CHECKING:
+    from rich.progress import Progress
 
 if sys.version_info < (3, 10):
     raise ImportError("RotaenoStablizer requires Python 3.10 or higher. "
                       f"Now you are on Python {sys.version}")
 
 
+def parse_bool(value: str) -> bool:
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# OutputVariant.from_spec 中各选项的解析函数
+VARIANT_OPTIONS = {
+    "circle_crop": parse_bool,
+    "auto_crop": parse_bool,
+    "display_all": parse_bool,
+    "height": int,
+    "encoder": str.strip,
+    "bitrate": str.strip,
+}
+# 只在后面紧跟 "key=" 的逗号处切分，输出路径中的逗号（如 Windows 路径）保持原样；
+# 未知的 key 仍会切分出来并报错，而不是被当作路径的一部分
+variant_separator = re.compile(r",(?=\s*[A-Za-z_][\w-]*\s*=)")
+
+
+@dataclass
+class OutputVariant:
+    """输出规格，为 None 的项沿用 Rotaeno 实例（布局、高度）或 run（编码器、码率）的设置"""
+    output_video: str | PathLike
+    circle_crop: bool | None = None
+    auto_crop: bool | None = None
+    display_all: bool | None = None
+    height: int | None = None
+    encoder: str | None = None
+    bitrate: str | None = None
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "OutputVariant":
+        """解析 "输出路径,key=value,..." 形式的规格，如 "out_720.mp4,height=720,display_all=false" """
+        output_video, *options = variant_separator.split(spec)
+        kwargs = {}
+        for option in options:
+            key, _, value = option.partition("=")
+            key = key.strip().replace("-", "_")
+            if key not in VARIANT_OPTIONS:
+                raise ValueError(f"Unknown variant option: {key}")
+            kwargs[key] = VARIANT_OPTIONS[key](value)
+        return cls(Path(output_video), **kwargs)
+
+
 class Rotaeno:
 
     def __init__(self,
@@ -34,7 +97,19 @@ class Rotaeno:
                  auto_crop: bool = True,
                  display_all: bool = True,
                  height: int | None = None,
-                 background: str | PathLike | None = None):
+                 background: str | PathLike | None = None,
+                 extract_segments: int | None = None,
+                 cache_dir: str | PathLike | None = None,
+                 rotation_cache_size: int = 512,
+                 asset_cache_size: int = 64,
+                 cache_content_hash: bool = False,
+                 cmd_tolerance: float = 0.,
+                 engine: str = "ffmpeg",
+                 profile: bool = False,
+                 profile_capture: str | None = None,
+                 render_segments: int = 1,
+                 scratch_dir: str | PathLike | None = None,
+                 extract_profile: str = "accurate"):
         """__init__，用于创建实例，需传入输出视频的部分信息
 
         Args:
@@ -45,6 +120,18 @@ class Rotaeno:
             display_all (bool, optional): 是否适当缩小视频以保证所有都能看到，开启后视频比例会变为 1:1. Defaults to True.
             height (int | None, optional): 输出视频高度，如为 None，则将由软件自行设置. Defaults to None.
             background (PathLike | None, optional): 背景，默认为纯黑背景. Defaults to None.
+            extract_segments (int | None, optional): 旋转提取的并行段数，None 或 0 则为 CPU 核心数. Defaults to None.
+            cache_dir (str | PathLike | None, optional): 缓存目录，None 则为系统缓存目录. Defaults to None.
+            rotation_cache_size (int, optional): 旋转数据缓存上限（MB）. Defaults to 512.
+            asset_cache_size (int, optional): 背景与遮罩图片缓存上限（MB）. Defaults to 64.
+            cache_content_hash (bool, optional): 缓存键是否包含输入视频的内容抽样哈希. Defaults to False.
+            cmd_tolerance (float, optional): 合并相邻旋转指令时允许的角度误差（度），0 为只合并完全相同的角度. Defaults to 0.
+            engine (str, optional): 渲染引擎，"ffmpeg" 为 ffmpeg 滤镜渲染，"python" 为单次解码的 Python 渲染. Defaults to "ffmpeg".
+            profile (bool, optional): 记录各阶段的耗时与资源占用，并在输出文件旁保存为 .profile.json. Defaults to False.
+            profile_capture (str | None, optional): 同时采集 Python 热点，"cprofile" 或 "viztracer". Defaults to None.
+            render_segments (int, optional): 视频按关键帧分段并行渲染的段数，1 为不分段，0 为 CPU 核心数. Defaults to 1.
+            scratch_dir (str | PathLike | None, optional): 临时文件（背景、遮罩、旋转指令等）的位置，None 为系统临时目录. Defaults to None.
+            extract_profile (str, optional): 旋转提取配置，"accurate" 为完整解码，"fast" 使用经过校验的解码捷径. Defaults to "accurate".
         """
 
         self.rotation_version = rotation_version
@@ -54,6 +141,23 @@ class Rotaeno:
         self.display_all = display_all
         self.height = height if height != 0 else None
         self.background = background
+        self.extract_segments = extract_segments
+        self.cache_dir = cache_dir
+        self.rotation_cache_size = rotation_cache_size
+        self.asset_cache_size = asset_cache_size
+        self.cache_content_hash = cache_content_hash
+        self.cmd_tolerance = cmd_tolerance
+        if engine not in ["ffmpeg", "python"]:
+            raise ValueError(f"Unsupport engine: {engine}")
+        self.engine = engine
+        self.profiler = StageProfiler(profile, profile_capture)
+        self.render_segments = render_segments
+        self.scratch_dir = scratch_dir
+        if extract_profile not in EXTRACT_PROFILES:
+            raise ValueError(f"Unsupport extract profile: {extract_profile}")
+        self.extract_profile = extract_profile
+        # 上一次 infomation_get 的 (键, 结果)，供 reuse_info 沿用
+        self.last_info: tuple[tuple, tuple] | None = None
 
     def generate_ffmpeg_cmd(self,
                             input_video: str | PathLike,
@@ -66,15 +170,30 @@ class Rotaeno:
                             bitrate: str | None = None,
                             encoder: str | None = None,
                             decoder: str | None = None,
-                            mask_output : bool = True):
+                            mask_output : bool = True,
+                            combined_mask: str | PathLike | None = None,
+                            segment: ExtractSegment | None = None):
+        """生成渲染命令
+
+        combined_mask 不为 None 时（仅在 mask_output 为 False 时有效），旋转后的画面会被 split，
+        在同一个 ffmpeg 进程中同时输出视频与掩码（掩码取自旋转后画面的 alpha 通道）。
+        segment 不为 None 时（仅在 mask_output 为 False 时有效）只渲染该段的画面，不含音频，
+        时间戳从 0 开始，供之后无损拼接。
+        """
         commands = [get_ffmpeg()]
 
         if not mask_output:
             if decoder is not None:
                 commands += ["-c:v", decoder]
+            if segment is not None:
+                # 与旋转提取相同：保留原时间戳，使 fps 采样以及 sendcmd 的时间与整段渲染一致
+                commands += ["-copyts", "-start_at_zero", "-noaccurate_seek"]
+                if segment.seek is not None:
+                    commands += ["-ss", f"{segment.seek + 1e-6:.6f}"]
             commands += ["-i", input_video]
 
-        commands += ["-i", alpha, "-i", background]
+        commands += raw_image_input(alpha, paint_msg.video_crop, "gray")
+        commands += raw_image_input(background, paint_msg.output_size, "rgb24")
         sendcmd_path = Path(sendcmd_path).as_posix().replace(":", r"\:")
 
         video_process = ""
@@ -82,6 +201,11 @@ class Rotaeno:
             video_process += "[0:v]"
             if self.fps:
                 video_process += f"fps={self.fps},"
+            if segment is not None:
+                video_process += f"trim=start_pts={segment.start}"
+                if segment.end is not None:
+                    video_process += f":end_pts={segment.end}"
+                video_process += ","
             if paint_msg.video_resize != input_video_info.size:
                 video_process += (
                     "scale="
@@ -95,35 +219,199 @@ class Rotaeno:
         else:
             video_process += f"[0:v]format=rgba,loop=loop=-1:size=1:start=0,trim=duration={input_video_info.duration}[masked];"
 
+        combined = not mask_output and combined_mask is not None
+
         video_process += (f"[masked]sendcmd=f='{sendcmd_path}'"
-                          f",rotate=c=black@0:ow={paint_msg.video_crop[0]}:oh=ow[rotated];")
+                          f",rotate=c=black@0:ow={paint_msg.video_crop[0]}:oh=ow")
+        if segment is not None:
+            # sendcmd 使用原时间戳，旋转之后再从 0 开始，与背景叠加的方式和整段渲染相同
+            video_process += ",setpts=PTS-STARTPTS"
+        video_process += "[rotated];"
+
+        if combined:
+            video_process += ("[rotated]split=2[rotated][rotated_mask];"
+                              "[rotated_mask]alphaextract[mask];")
 
         if not mask_output:
-            video_process += "[2:v][rotated]overlay[output]"
+            # overlay 沿用第一个输入（背景图片）的时间基 1/25 与帧时长，会合并相邻帧的时间戳，
+            # 导致 -r 输出时丢帧补帧，先把背景转为输出帧率
+            video_process += f"[2:v]fps={self.fps}[background];[background][rotated]overlay[output]"
 
         commands += ["-filter_complex", video_process]
+
+        def output_options():
+            options = []
+            if self.fps:
+                options += [
+                    "-r",
+                    str(self.fps if self.fps is not None else input_video_info.fps)
+                ]
+            if encoder is not None:
+                options += ["-c:v", encoder]
+            if bitrate is not None:
+                options += ["-b:v", bitrate]
+            return options
+
         commands += ["-map", "[rotated]" if mask_output else "[output]"]
 
-        if not mask_output:
+        if not mask_output and segment is None:
             commands += ["-map", "0:a"]
 
-        if self.fps:
-            commands += [
-                "-r",
-                str(self.fps if self.fps is not None else input_video_info.fps)
-            ]
-        if encoder is not None:
-            commands += ["-c:v", encoder]
-        if bitrate is not None:
-            commands += ["-b:v", bitrate]
+        commands += output_options()
 
-        if not mask_output:
+        if segment is not None:
+            if segment.end is not None:
+                commands += ["-frames:v", str(segment.end - segment.start)]
+        elif not mask_output:
             commands += ["-c:a", "copy"]
 
-        commands += [output_video, "-y"]
+        commands += [output_video]
+
+        if combined:
+            commands += ["-map", "[mask]", *output_options(), combined_mask]
+
+        commands += ["-y"]
+
+        return commands
+
+    def generate_variants_cmd(self,
+                              input_video: str | PathLike,
+                              variants: list[tuple[OutputVariant, PaintMsg, Path, Path, Path]],
+                              input_video_info: VideoInfo,
+                              bitrate: str | None = None,
+                              encoder: str | None = None,
+                              decoder: str | None = None):
+        """生成多规格渲染命令：输入只解码一次，split 后每个规格独立缩放、旋转、合成并编码
+
+        variants 中每项为 (规格, 绘制信息, 背景路径, 遮罩路径, sendcmd 路径)，
+        第 i 项的 sendcmd 文件需以 rotate@v{i} 为指令目标，各分支的 rotate 互不干扰。
+        """
+        commands = [get_ffmpeg()]
+        if decoder is not None:
+            commands += ["-c:v", decoder]
+        commands += ["-i", input_video]
+        for _, paint_msg, background, alpha, _ in variants:
+            commands += raw_image_input(alpha, paint_msg.video_crop, "gray")
+            commands += raw_image_input(background, paint_msg.output_size, "rgb24")
+
+        video_process = "[0:v]"
+        if self.fps:
+            video_process += f"fps={self.fps},"
+        video_process += f"split={len(variants)}"
+        video_process += "".join(f"[source{i}]" for i in range(len(variants))) + ";"
+
+        for i, (_, paint_msg, _, _, sendcmd_path) in enumerate(variants):
+            alpha_index, background_index = 2 * i + 1, 2 * i + 2
+            sendcmd_path = Path(sendcmd_path).as_posix().replace(":", r"\:")
+            scale_crop = []
+            if paint_msg.video_resize != input_video_info.size:
+                scale_crop.append(
+                    f"scale={paint_msg.video_resize[0]}:{paint_msg.video_resize[1]}")
+            if paint_msg.video_crop != paint_msg.video_resize:
+                scale_crop.append(f"crop={paint_msg.video_crop[0]}:{paint_msg.video_crop[1]}")
+            video_process += f"[source{i}]{','.join(scale_crop) or 'null'}[padded{i}];"
+            video_process += f"[padded{i}][{alpha_index}:v]alphamerge[masked{i}];"
+            video_process += (f"[masked{i}]sendcmd=f='{sendcmd_path}'"
+                              f",rotate@v{i}=c=black@0:ow={paint_msg.video_crop[0]}:oh=ow"
+                              f"[rotated{i}];")
+            video_process += (f"[{background_index}:v]fps={self.fps}[background{i}];"
+                              f"[background{i}][rotated{i}]overlay[output{i}];")
+
+        commands += ["-filter_complex", video_process[:-1]]
+
+        for i, (variant, _, _, _, _) in enumerate(variants):
+            commands += ["-map", f"[output{i}]", "-map", "0:a"]
+            if self.fps:
+                commands += ["-r", str(self.fps)]
+            variant_encoder = variant.encoder or encoder
+            variant_bitrate = variant.bitrate or bitrate
+            if variant_encoder is not None:
+                commands += ["-c:v", variant_encoder]
+            if variant_bitrate is not None:
+                commands += ["-b:v", variant_bitrate]
+            commands += ["-c:a", "copy", variant.output_video]
+
+        commands += ["-y"]
 
         return commands
 
+    def variant_paint_msg(self, input_video_info: VideoInfo,
+                          variant: OutputVariant) -> PaintMsg:
+        def pick(value, default):
+            return default if value is None else value
+
+        return cached_paint_msg(input_video_info.height, input_video_info.width,
+                                pick(variant.height, self.height) or None, self.background,
+                                pick(variant.circle_crop, self.circle_crop),
+                                pick(variant.auto_crop, self.auto_crop),
+                                pick(variant.display_all, self.display_all), self.cache_dir)
+
+    def render_segmented(self, segment_inputs: list[tuple[ExtractSegment, Path]],
+                         output_video: Path, temp_dir: Path,
+                         **cmd_kwargs) -> Generator[int, Any, None]:
+        """分段并行渲染，用 concat 分离器无损拼接后只复制一次音频，返回已渲染的总帧数
+
+        segment_inputs 中每项为 (分段, 只包含该段指令的 sendcmd 路径)，
+        其余参数与 generate_ffmpeg_cmd 相同。
+        """
+        parts = [
+            temp_dir / f"segment_{i}{output_video.suffix}" for i in range(len(segment_inputs))
+        ]
+        commands = [
+            self.generate_ffmpeg_cmd(output_video=part,
+                                     sendcmd_path=sendcmd_path,
+                                     mask_output=False,
+                                     segment=segment,
+                                     **cmd_kwargs)
+            for part, (segment, sendcmd_path) in zip(parts, segment_inputs)
+        ]
+        for cmd in commands:
+            log.debug("Running Commands: [bold green]" + escape(" ".join(map(str, cmd))),
+                      extra={"markup": True})
+
+        updates: Queue[tuple[int, int | BaseException | None]] = Queue()
+
+        def render(i: int):
+            try:
+                for p in FFMpegProgress(commands[i]).process():
+                    updates.put((i, p))
+                updates.put((i, None))
+            except BaseException as e:
+                updates.put((i, e))
+
+        done = [0] * len(commands)
+        running = len(commands)
+        error = None
+        with ThreadPool(len(commands)) as pool:
+            pool.map_async(render, range(len(commands)))
+            while running:
+                i, update = updates.get()
+                if update is None:
+                    running -= 1
+                elif isinstance(update, BaseException):
+                    running -= 1
+                    error = error or update
+                else:
+                    done[i] = update
+                    yield sum(done)
+        if error is not None:
+            raise error
+
+        concat_videos(parts, output_video)
+        audio_copy(cmd_kwargs["input_video"], output_video)
+
+    def save_assets(self,
+                    paint_msg: PaintMsg,
+                    background: Path,
+                    alpha: Path,
+                    use_cache: bool = True):
+        """保存背景与遮罩图片，相同布局的素材从缓存中复制"""
+        if use_cache:
+            AssetCache(self.cache_dir, self.asset_cache_size << 20).save(
+                paint_msg, background, alpha)
+        else:
+            paint_msg.save_raw(background, alpha)
+
     def infomation_get(
         self,
         input_video: str | PathLike,
@@ -131,10 +419,27 @@ class Rotaeno:
         using_hardware_acc: bool = True,
         decoder: str | None = None,
         encoder: str | None = None,
+        use_cache: bool = True,
+        reuse_info: bool = False,
     ):
+        """探测视频、绘制背景与遮罩并写入 temp_dir、选择编解码器
+
+        reuse_info 为 True 时，若输入视频（身份不变）与编解码参数都与上一次相同，
+        沿用上一次的结果，只把素材写入 temp_dir。
+        """
+        info_key = (tuple(file_identity(input_video).values()), using_hardware_acc, decoder,
+                    encoder)
+        if reuse_info and self.last_info is not None and self.last_info[0] == info_key:
+            input_video_info, paint_msg, encoder, decoder = self.last_info[1]
+            self.save_assets(paint_msg, temp_dir / BACKGROUND_FILE, temp_dir / ALPHA_FILE,
+                             use_cache)
+            return input_video_info, paint_msg, encoder, decoder
 
         # Get Video Info
-        input_video_info = VideoInfo(input_video)
+        with self.profiler.stage("probe"):
+            input_video_info = VideoInfo(input_video,
+                                         cache_root=self.cache_dir,
+                                         disk_cache=use_cache)
         if self.fps is None:
             common_fps = [24, 25, 29.97, 30, 48, 50, 59.94, 60, 120, 144, 180, 240]
             if input_video_info.fps not in common_fps:
@@ -146,23 +451,31 @@ class Rotaeno:
             else:
                 self.fps = input_video_info.fps
 
-        paint_msg = PaintMsg.from_video_info(input_video_info.height,
-                                             input_video_info.width, self.height,
-                                             self.background, self.circle_crop,
-                                             self.auto_crop, self.display_all)
+        with self.profiler.stage("paint"):
+            paint_msg = cached_paint_msg(input_video_info.height, input_video_info.width,
+                                         self.height, self.background, self.circle_crop,
+                                         self.auto_crop, self.display_all, self.cache_dir)
 
-        paint_msg.background.save(str(temp_dir / "background.png"))
-        paint_msg.image_alpha.save(str(temp_dir / "image_alpha.png"))
+            self.save_assets(paint_msg, temp_dir / BACKGROUND_FILE,
+                             temp_dir / ALPHA_FILE, use_cache)
 
         # About coder
         if (using_hardware_acc and (encoder is None or decoder is None)):
-            support_encoder, support_decoder = (FFMpegHWTest().run(
-                input_video_info.codec))
+            with self.profiler.stage("hw_test"):
+                support_encoder, support_decoder = FFMpegCapabilities.shared(
+                    self.cache_dir, use_cache).hw_codecs(input_video_info.codec)
             if encoder is None:
+                if not support_encoder:
+                    raise FFMpegError(
+                        f"No available encoder for {input_video_info.codec}")
                 encoder = support_encoder[0]
             if decoder is None:
+                if not support_decoder:
+                    raise FFMpegError(
+                        f"No available decoder for {input_video_info.codec}")
                 decoder = support_decoder[0]
 
+        self.last_info = (info_key, (input_video_info, paint_msg, encoder, decoder))
         return input_video_info, paint_msg, encoder, decoder
 
     def run(self,
@@ -174,69 +487,244 @@ class Rotaeno:
             decoder: str | None = None,
             encoder: str | None = None,
             bitrate: str | None = None,
-            ensure_rewrite: bool = False):
+            ensure_rewrite: bool = False,
+            use_cache: bool = True,
+            input_track: str | PathLike | None = None,
+            output_track: str | PathLike | None = None,
+            variants: list[OutputVariant] | None = None,
+            progress: "Progress | None" = None,
+            reuse_info: bool = False):
+        """运行
+
+        variants 不为空时，output_video 与各规格共用一次解码和同一条旋转轨道，
+        在一个 ffmpeg 进程中输出全部规格。
+        传入 progress 时（如批量处理），进度条加到该实例上，任务名以输入文件名开头。
+        reuse_info 为 True 时沿用本实例上一次对同一视频的探测、绘制与编解码器选择结果
+        （如批量处理中提取与渲染两级之间）。
+        """
 
         input_video = Path(input_video)
         if output_video is not None:
             output_video = Path(output_video)
 
+        if output_track is not None:
+            output_track = Path(output_track)
+
+        variants = [
+            OutputVariant(**{**vars(v), "output_video": Path(v.output_video)})
+            for v in variants or []
+        ]
+
         if not ensure_rewrite:
-            checklist = [output_video, output_cmd, output_mask]
+            checklist = [output_video, output_cmd, output_mask, output_track]
+            checklist += [v.output_video for v in variants]
             existlist = [c for c in checklist if c is not None and c.exists()]
             if existlist:
+                from .utils import ask_confirm
+
                 rprint(f"输出文件已存在：{', '.join(map(str, existlist))}")
                 if not ask_confirm("是否覆盖"):
                     return
 
-        progress = Progress(SpinnerColumn(),
-                            TextColumn("[progress.description]{task.description}"),
-                            BarColumn(), TaskProgressColumn(), FPSColumn(),
-                            TimeRemainingColumn(elapsed_when_finished=True))
-
-
-        task1 = progress.add_task("Preprocessing...", total=1)
-        task2 = progress.add_task("Create Rotation Command")
+        shared_progress = progress is not None
+        if progress is None:
+            from rich.progress import (
+                BarColumn,
+                Progress,
+                SpinnerColumn,
+                TaskProgressColumn,
+                TextColumn,
+                TimeRemainingColumn,
+            )
+
+            from .utils import FPSColumn
+
+            progress = Progress(SpinnerColumn(),
+                                TextColumn("[progress.description]{task.description}"),
+                                BarColumn(), TaskProgressColumn(), FPSColumn(),
+                                TimeRemainingColumn(elapsed_when_finished=True))
+        prefix = f"{input_video.name}: " if shared_progress else ""
+
+        task1 = progress.add_task(prefix + "Preprocessing...", total=1)
+        task2 = progress.add_task(prefix + "Create Rotation Command")
+        if output_video is not None or variants:
+            task_video = progress.add_task(prefix + "Running Video Generate")
         if output_video is not None:
-            task_video = progress.add_task("Running Video Generate")
             output_video = Path(output_video)
         if output_mask is not None:
-            task_mask = progress.add_task("Running Mask Generate")
+            task_mask = progress.add_task(prefix + "Running Mask Generate")
             output_mask = Path(output_mask)
         if output_cmd is not None:
             output_cmd = Path(output_cmd)
 
-        with TemporaryDirectory(dir=".") as temp_dir_str, progress:
+        rotation_blocks = None
+        if input_track is not None:
+            track_info, rotation_blocks = read_track(input_track)
+            if self.fps is None:
+                self.fps = track_info.fps
+            elif self.fps != track_info.fps:
+                raise ValueError(f"Track fps ({track_info.fps}) mismatch with "
+                                 f"output fps ({self.fps})")
+            log.info(f"Use rotation track {input_track} ({track_info.frames} frames)")
+
+        # 报告保存在第一个输出文件旁
+        report_base = next(
+            Path(p) for p in [
+                output_video, *(v.output_video for v in variants), output_mask, output_cmd,
+                output_track, input_video
+            ] if p is not None)
+        report_path = report_base.with_name(report_base.stem + ".profile.json")
+        self.profiler.reset()
+
+        with (TemporaryDirectory(dir=self.scratch_dir) as temp_dir_str,
+              nullcontext() if shared_progress else progress,
+              self.profiler.capture_hot_paths(report_path), self.profiler.stage("total")):
             temp_dir = Path(temp_dir_str)
             log.debug(f"Create temp dir: {temp_dir}")
 
             input_video_info, paint_msg, encoder, decoder = self.infomation_get(
-                input_video, temp_dir, using_hardware_acc, decoder, encoder)
+                input_video, temp_dir, using_hardware_acc, decoder, encoder, use_cache,
+                reuse_info)
             progress.advance(task1)
 
             # Write Rotation
             assert self.fps is not None
-            rotation_calc = RotationCalc(self.rotation_version)
+            rotation_calc = RotationCalc(self.rotation_version,
+                                         segments=self.extract_segments,
+                                         profile=self.extract_profile,
+                                         cache_dir=self.cache_dir,
+                                         use_cache=use_cache)
             total_frame = int(input_video_info.duration * self.fps)
-            rotation_cmd = [
-                line for line in progress.track(rotation_calc.export_cmd(
-                    input_video, self.fps, decoder),
-                                                task_id=task2,
-                                                total=total_frame)
-            ]
+            rotation_cache = None
+            # 已从旋转轨道读取角度时不会提取，无需缓存
+            if use_cache and rotation_blocks is None:
+                rotation_cache = RotationCache(self.cache_dir,
+                                               self.rotation_cache_size << 20,
+                                               self.cache_content_hash)
+                # fast 配置的结果不会被 accurate 提取读到；所用捷径在提取后才确定，存为旁注
+                cache_key = rotation_cache.key(input_video, self.fps, self.rotation_version,
+                                               rotation_calc.area, rotation_calc.profile)
+
+            # Python 引擎在渲染的同时从画面中取得旋转角度
+            rendered = (self.engine == "python"
+                        and (output_video is not None or output_mask is not None))
+            if rendered:
+                render_tasks = []
+                if output_video is not None:
+                    render_tasks.append(task_video)
+                if output_mask is not None:
+                    render_tasks.append(task_mask)
+                for task in render_tasks:
+                    progress.update(task, total=total_frame)
+                from .engine import FrameRenderer
+
+                renderer = FrameRenderer(rotation_calc, paint_msg, input_video_info,
+                                         self.fps)
+                render_blocks = renderer.render(input_video, output_video, output_mask,
+                                                encoder, decoder, bitrate)
+                if rotation_cache is not None:
+                    render_blocks = rotation_cache.store(cache_key, render_blocks,
+                                                         lambda: {"shortcuts": []})
+                # 角度边渲染边写入临时轨道，供后续生成指令，内存占用与视频长度无关
+                render_track = temp_dir / "rotation.rtrk"
+                with self.profiler.stage("render") as record:
+                    rendered_frames = 0
+                    for block in store_track(render_track, render_blocks, self.fps,
+                                             self.rotation_version, "<f8"):
+                        rendered_frames += len(block)
+                        for task in render_tasks:
+                            progress.advance(task, len(block))
+                    record.frames = rendered_frames
+                _, rotation_blocks = read_track(render_track)
+
+            if rotation_blocks is None and rotation_cache is not None:
+                rotation_blocks = rotation_cache.load(cache_key)
+                if rotation_blocks is not None:
+                    meta = rotation_cache.load_meta(cache_key) or {}
+                    log.info("Use cached rotation data")
+                    log.debug(f"Cached extraction shortcuts: {meta.get('shortcuts')}")
+                else:
+                    rotation_blocks = rotation_cache.store(
+                        cache_key,
+                        rotation_calc.export_blocks(input_video, self.fps, decoder),
+                        lambda: {
+                            "shortcuts":
+                            list(rotation_calc.resolve_shortcuts(input_video, self.fps,
+                                                                 decoder))
+                        })
+            if rotation_blocks is None:
+                rotation_blocks = rotation_calc.export_blocks(input_video, self.fps, decoder)
+            if output_track is not None:
+                rotation_blocks = store_track(output_track, rotation_blocks, self.fps,
+                                              self.rotation_version)
+            rotate_data_path = (output_cmd if output_cmd is not None else temp_dir /
+                                "rotation.ffmpeg.cmd")
+            # 多规格输出：python 引擎已渲染的 output_video 之外，其余规格由 ffmpeg 一次渲染
+            if variants and output_video is not None and not rendered:
+                variants.insert(0, OutputVariant(output_video))
+            variant_cmds = [(temp_dir / f"rotation_v{i}.ffmpeg.cmd", f"rotate@v{i}")
+                            for i in range(len(variants))]
+
+            # 分段并行渲染：按关键帧分段，每段只写入与其重叠的指令
+            render_segments = []
+            if (self.render_segments != 1 and output_video is not None and not rendered
+                    and not variants):
+                render_segments = RotationCalc(
+                    self.rotation_version,
+                    segments=self.render_segments,
+                    cache_dir=self.cache_dir,
+                    use_cache=use_cache).plan_segments(input_video, self.fps)
+                if render_segments:
+                    log.info(f"Render in {len(render_segments)} segments")
+            segment_cmds = [temp_dir / f"rotation_s{i}.ffmpeg.cmd"
+                            for i in range(len(render_segments))]
+
+            progress.update(task2, total=total_frame)
+            frame_count = command_count = 0
+            write_time = 0.
+            # 边计算边写入，内存占用与视频长度无关
+            with ExitStack() as stack:
+                record = stack.enter_context(self.profiler.stage("rotation"))
+                # (文件, 指令目标, 分段)，分段为 None 表示写入全部指令
+                cmd_files: list[tuple[Any, str, ExtractSegment | None]] = [
+                    (path.open("w", encoding="utf-8", buffering=1 << 20), target, None)
+                    for path, target in [(rotate_data_path, "rotate")] + variant_cmds
+                ]
+                cmd_files += [(path.open("w", encoding="utf-8", buffering=1 << 20), "rotate",
+                               segment)
+                              for path, segment in zip(segment_cmds, render_segments)]
+                written = [False] * len(cmd_files)
+                for f, _, _ in cmd_files:
+                    stack.enter_context(f)
+                for (start, end), rotate, count in angles_to_intervals(
+                        rotation_blocks, self.fps, self.cmd_tolerance):
+                    write_start = time.perf_counter()
+                    for i, (f, target, segment) in enumerate(cmd_files):
+                        if segment is not None and not segment.touches(frame_count, count):
+                            continue
+                        if written[i]:
+                            f.write("\n")
+                        f.write(format_cmd(start, end, rotate, target))
+                        written[i] = True
+                    write_time += time.perf_counter() - write_start
+                    command_count += 1
+                    frame_count += count
+                    progress.advance(task2, count)
+                record.frames = frame_count
+            self.profiler.add("sendcmd_write", write_time, frame_count)
 
             # total_frame is not truth frame, So updated as completed
             progress.update(task2, completed=total_frame)
-            total_frame = len(rotation_cmd)
-            rotate_data_path = (output_cmd if output_cmd is not None else temp_dir /
-                                "rotation.ffmpeg.cmd")
-            rotate_data_path.write_text("\n".join(rotation_cmd))
+            total_frame = frame_count
+            log.info(f"Rotation commands: {frame_count} frames -> {command_count} "
+                     f"commands ({frame_count / max(command_count, 1):.1f}x)")
 
             ffmpeg_cmd = self.generate_ffmpeg_cmd(
                 input_video=input_video,
                 output_video=(output_video if output_video is not None else
                               input_video.with_stem(input_video.stem + "_out")),
-                background=temp_dir / "background.png",
-                alpha=temp_dir / "image_alpha.png",
+                background=temp_dir / BACKGROUND_FILE,
+                alpha=temp_dir / ALPHA_FILE,
                 input_video_info=input_video_info,
                 paint_msg=paint_msg,
                 sendcmd_path=rotate_data_path,
@@ -251,23 +739,91 @@ class Rotaeno:
                         escape(" ".join(map(str, ffmpeg_cmd))),
                         extra={"markup": True})
 
-            if output_video is not None:
+            if variants:
+                variant_inputs = []
+                for i, (variant, (cmd_path, _)) in enumerate(zip(variants, variant_cmds)):
+                    variant_msg = self.variant_paint_msg(input_video_info, variant)
+                    self.save_assets(variant_msg, temp_dir / f"background_v{i}.rgb",
+                                     temp_dir / f"image_alpha_v{i}.gray", use_cache)
+                    variant_inputs.append((variant, variant_msg,
+                                           temp_dir / f"background_v{i}.rgb",
+                                           temp_dir / f"image_alpha_v{i}.gray", cmd_path))
+                ffmpeg_cmd = self.generate_variants_cmd(input_video, variant_inputs,
+                                                        input_video_info, bitrate, encoder,
+                                                        decoder)
                 log.debug("Running Commands: [bold green]" +
                         escape(" ".join(map(str, ffmpeg_cmd))),
                         extra={"markup": True})
 
                 ff = FFMpegProgress(ffmpeg_cmd)
                 progress.update(task_video, total=total_frame)
-                for p in ff.process():
-                    progress.update(task_video, completed=p)
+                with self.profiler.stage("render") as record:
+                    for p in ff.process():
+                        progress.update(task_video, completed=p)
+                    record.frames = total_frame
                 progress.update(task_video, completed=total_frame)
 
-            if output_mask is not None:
+            if render_segments:
+                progress.update(task_video, total=total_frame)
+                with self.profiler.stage("render") as record:
+                    for p in self.render_segmented(list(zip(render_segments, segment_cmds)),
+                                                   output_video,
+                                                   temp_dir,
+                                                   input_video=input_video,
+                                                   background=temp_dir / BACKGROUND_FILE,
+                                                   alpha=temp_dir / ALPHA_FILE,
+                                                   input_video_info=input_video_info,
+                                                   paint_msg=paint_msg,
+                                                   bitrate=bitrate,
+                                                   encoder=encoder,
+                                                   decoder=decoder):
+                        progress.update(task_video, completed=p)
+                    record.frames = total_frame
+                progress.update(task_video, completed=total_frame)
+
+            # 同时需要视频与掩码时，只运行一个 ffmpeg 进程，旋转后 split 为两路输出
+            combined = (output_video is not None and output_mask is not None and not variants
+                        and not render_segments)
+            if (output_video is not None and not rendered and not variants
+                    and not render_segments):
+                render_tasks = [task_video]
+                if combined:
+                    ffmpeg_cmd = self.generate_ffmpeg_cmd(
+                        input_video=input_video,
+                        output_video=output_video,
+                        background=temp_dir / BACKGROUND_FILE,
+                        alpha=temp_dir / ALPHA_FILE,
+                        input_video_info=input_video_info,
+                        paint_msg=paint_msg,
+                        sendcmd_path=rotate_data_path,
+                        bitrate=bitrate,
+                        encoder=encoder,
+                        decoder=decoder,
+                        mask_output=False,
+                        combined_mask=output_mask)
+                    render_tasks.append(task_mask)
+
+                log.debug("Running Commands: [bold green]" +
+                        escape(" ".join(map(str, ffmpeg_cmd))),
+                        extra={"markup": True})
+
+                ff = FFMpegProgress(ffmpeg_cmd)
+                for task in render_tasks:
+                    progress.update(task, total=total_frame)
+                with self.profiler.stage("render") as record:
+                    for p in ff.process():
+                        for task in render_tasks:
+                            progress.update(task, completed=p)
+                    record.frames = total_frame
+                for task in render_tasks:
+                    progress.update(task, completed=total_frame)
+
+            if output_mask is not None and not rendered and not combined:
                 ffmpeg_cmd = self.generate_ffmpeg_cmd(
                     input_video=input_video,
                     output_video=output_mask,
-                    background=temp_dir / "background.png",
-                    alpha=temp_dir / "image_alpha.png",
+                    background=temp_dir / BACKGROUND_FILE,
+                    alpha=temp_dir / ALPHA_FILE,
                     input_video_info=input_video_info,
                     paint_msg=paint_msg,
                     sendcmd_path=rotate_data_path,
@@ -282,12 +838,16 @@ class Rotaeno:
 
                 ff = FFMpegProgress(ffmpeg_cmd)
                 progress.update(task_mask, total=total_frame)
-                for p in ff.process():
-                    progress.update(task_mask, completed=p)
+                with self.profiler.stage("render_mask") as record:
+                    for p in ff.process():
+                        progress.update(task_mask, completed=p)
+                    record.frames = total_frame
                 progress.update(task_mask, completed=total_frame)
 
             log.info("Task Finish")
 
+        self.profiler.save(report_path)
+
 if __name__ == "__main__":
     a = Rotaeno(
         background=
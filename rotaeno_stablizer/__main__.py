@@ -5,12 +5,12 @@ from pathlib import Path
 from rich import print as rprint
 from rich_argparse import RichHelpFormatter
 
-from rotaeno_stablizer import Rotaeno
+from rotaeno_stablizer import OutputVariant, Rotaeno
 
+from .cache import clear_cache
 from .config import config_data
-
-from .cli import ui as cli
-from .gui import main as gui
+from .ffmpeg import FFMpegCapabilities
+from .rotation_calc import EXTRACT_PROFILES
 
 
 class ArgumentDefaultsHelpFormatter(RichHelpFormatter):
@@ -80,6 +80,43 @@ if __name__ == "__main__":
                         type=str,
                         default=config_data["codec"]["bitrate"],
                         help="输出视频码率（不包含音频）")
+    parser.add_argument("--extract-segments",
+                        type=int,
+                        default=config_data["performance"]["extract_segments"],
+                        help="旋转提取的并行段数（0 为 CPU 核心数）")
+    parser.add_argument("--render-segments",
+                        type=int,
+                        default=config_data["performance"]["render_segments"],
+                        help="按关键帧分段并行渲染的段数（1 为不分段，0 为 CPU 核心数）")
+    parser.add_argument("--extract-profile",
+                        choices=EXTRACT_PROFILES,
+                        default=config_data["performance"]["extract_profile"],
+                        help="旋转提取配置：accurate 完整解码，fast 使用解码捷径（与 accurate 校验一致时才启用）")
+    parser.add_argument("--cmd-tolerance",
+                        type=float,
+                        default=config_data["performance"]["cmd_tolerance"],
+                        help="合并相邻旋转指令时允许的角度误差（度）")
+    parser.add_argument("--engine",
+                        choices=["ffmpeg", "python"],
+                        default=config_data["performance"]["engine"],
+                        help="渲染引擎：ffmpeg 滤镜渲染，或只解码一次的 python 渲染")
+    parser.add_argument("--cache",
+                        action=argparse.BooleanOptionalAction,
+                        default=config_data["performance"]["cache"],
+                        help="使用缓存的旋转数据（--no-cache 则重新计算）")
+    parser.add_argument("--clear-cache",
+                        action="store_true",
+                        help="运行前清空缓存")
+    parser.add_argument("--profile",
+                        action="store_true",
+                        help="记录各阶段耗时与资源占用，保存为输出文件旁的 .profile.json")
+    parser.add_argument("--profile-capture",
+                        choices=["cprofile", "viztracer"],
+                        default=None,
+                        help="同时采集 Python 热点（需配合 --profile）")
+    parser.add_argument("--refresh-ffmpeg-cache",
+                        action="store_true",
+                        help="重新探测 ffmpeg 的版本、滤镜与硬件编解码器")
     parser.add_argument("--loglevel",
                         type=str,
                         default=config_data["other"]["loglevel"],
@@ -105,6 +142,19 @@ if __name__ == "__main__":
                         default=None,
                         help="输出旋转路径，默认为输出文件 + '_rotate.cmd'"
     )
+    parser.add_argument("--track-path",
+                        type=str,
+                        default=None,
+                        help="保存旋转轨道（.rtrk）的路径，可供之后跳过旋转计算")
+    parser.add_argument("--track",
+                        type=str,
+                        default=None,
+                        help="使用已有的旋转轨道（.rtrk），跳过旋转计算")
+    parser.add_argument("--variant",
+                        type=OutputVariant.from_spec,
+                        action="append",
+                        default=None,
+                        help="额外输出规格，可多次指定，如 out_720.mp4,height=720,display_all=false")
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--cli",
                        action="store_true",
@@ -120,13 +170,23 @@ if __name__ == "__main__":
                        help="是否展示非官方警告")
     parser.add_argument("input_video", type=str, default=None, nargs='?')
     args = parser.parse_args()
+    if args.clear_cache:
+        clear_cache(config_data["performance"]["cache_dir"])
+    if args.refresh_ffmpeg_cache:
+        FFMpegCapabilities(config_data["performance"]["cache_dir"] or None).refresh()
     if args.help:
         parser.print_help()
+    elif args.input_video is None and (args.clear_cache or args.refresh_ffmpeg_cache):
+        # 只处理缓存，不启动界面
+        pass
     elif args.input_video is None:
         # TODO: auto downgrade to cli when no have display
+        # 界面按需导入，只用命令行时不需要安装 gui 依赖
         if args.cli:
+            from .cli import ui as cli
             cli()
         else:
+            from .gui import main as gui
             gui(args)
     else:
         input_video = Path(args.input_video)
@@ -160,7 +220,19 @@ if __name__ == "__main__":
                           auto_crop=args.auto_crop,
                           display_all=args.display_all,
                           background=args.background,
-                          height=args.height)
+                          height=args.height,
+                          extract_segments=args.extract_segments,
+                          cache_dir=config_data["performance"]["cache_dir"] or None,
+                          rotation_cache_size=config_data["performance"]["rotation_cache_size"],
+                          asset_cache_size=config_data["performance"]["asset_cache_size"],
+                          scratch_dir=config_data["performance"]["scratch_dir"] or None,
+                          cache_content_hash=config_data["performance"]["cache_content_hash"],
+                          cmd_tolerance=args.cmd_tolerance,
+                          engine=args.engine,
+                          extract_profile=args.extract_profile,
+                          render_segments=args.render_segments,
+                          profile=args.profile,
+                          profile_capture=args.profile_capture)
 
         rotaeno.run(input_video=input_video,
                     output_video=output_video,
@@ -169,4 +241,8 @@ if __name__ == "__main__":
                     encoder=args.encoder if args.encoder else None,
                     decoder=args.decoder if args.encoder else None,
                     bitrate=args.bitrate,
+                    use_cache=args.cache,
+                    input_track=args.track,
+                    output_track=args.track_path,
+                    variants=args.variant,
                     )
@@ -1,10 +1,17 @@
 import math
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
 from os import PathLike
+from pathlib import Path
+from typing import TYPE_CHECKING
 
-from PIL import Image, ImageDraw, ImageEnhance
+if TYPE_CHECKING:
+    from PIL import Image
 
-from .utils import get_picture
+
+# 静态素材以未压缩的原始像素交给 ffmpeg（背景为 rgb24，遮罩为 gray）
+BACKGROUND_FILE = "background.rgb"
+ALPHA_FILE = "image_alpha.gray"
 
 
 def ceil_even(num: tuple[float, float]) -> tuple[int, int]:
@@ -21,14 +28,42 @@ class PaintMsg:
     circle_radius: float
     circle_thickness: float
     resize_ratio: float
-    cover: Image.Image | None
-    background: Image.Image = field(init=False)
-    image_alpha: Image.Image
+    cover_path: str | PathLike | None = None
+    cache_root: str | PathLike | None = None
+
+    # 图片在第一次使用时才生成，素材缓存命中时完全不需要绘制
+    @cached_property
+    def background(self) -> "Image.Image":
+        return self.generate_background()
+
+    @cached_property
+    def image_alpha(self) -> "Image.Image":
+        return self.generate_alpha()
+
+    @cached_property
+    def cover_identity(self) -> str | None:
+        """封面内容的哈希，作为背景缓存的键"""
+        from .cache import cover_identity
+
+        return cover_identity(self.cover_path, self.cache_root)
 
-    def __post_init__(self):
-        self.background = self.generate_background()
+    def generate_alpha(self):
+        from PIL import Image, ImageDraw
+
+        alpha_image = Image.new("L", (self.video_crop[0] * 2, self.video_crop[1] * 2))
+        ImageDraw.Draw(alpha_image).circle(self.video_crop, self.video_crop[0], "white")
+        return alpha_image.resize(self.video_crop)
+
+    def save_raw(self, background: str | PathLike, alpha: str | PathLike):
+        """保存背景与遮罩的原始像素"""
+        Path(background).write_bytes(self.background.tobytes())
+        Path(alpha).write_bytes(self.image_alpha.tobytes())
 
     def generate_background(self):
+        from PIL import Image, ImageDraw, ImageEnhance
+
+        from .utils import get_picture
+
         width, height = self.output_size
         r = self.circle_radius
         thickness = self.circle_thickness
@@ -38,8 +73,8 @@ class PaintMsg:
         image = Image.new("RGB", (width, height))
         convert_x = int((width - r * 2) / 2)
         convert_y = int((height - r * 2) / 2)
-        if self.cover is not None:
-            cover_resized = self.cover.resize((int(r * 2), int(r * 2)))
+        cover_resized = get_picture(self.cover_path, int(r * 2), self.cache_root)
+        if cover_resized is not None:
             cover_resized = ImageEnhance.Brightness(cover_resized).enhance(brightness)
             image.paste(cover_resized, (convert_x, convert_y))
 
@@ -62,7 +97,8 @@ class PaintMsg:
                         cover: str | PathLike | None = None,
                         circle_crop: bool = False,
                         auto_crop: bool = True,
-                        display_all: bool = True):
+                        display_all: bool = True,
+                        cache_root: str | PathLike | None = None):
         aspect_ratio = 16 / 9
 
         if auto_crop:
@@ -110,18 +146,43 @@ class PaintMsg:
         video_crop = ceil_even(video_crop)
         output_size = ceil_even(output_size)
 
-        alpha_image = Image.new("L", (video_crop[0] * 2, video_crop[1] * 2))
-        ImageDraw.Draw(alpha_image).circle(video_crop, video_crop[0], "white")
-        alpha_image = alpha_image.resize(video_crop)
-
         return cls(video_resize=video_resize,
                    video_crop=video_crop,
                    output_size=output_size,
                    circle_radius=circle_radius,
                    circle_thickness=circle_thickness,
                    resize_ratio=resize_ratio,
-                   cover=get_picture(cover),
-                   image_alpha=alpha_image)
+                   cover_path=cover,
+                   cache_root=cache_root)
+
+
+def cached_paint_msg(height: int,
+                     width: int,
+                     output_height_want: int | None = None,
+                     cover: str | PathLike | None = None,
+                     circle_crop: bool = False,
+                     auto_crop: bool = True,
+                     display_all: bool = True,
+                     cache_root: str | PathLike | None = None) -> PaintMsg:
+    """进程内复用参数与封面内容都相同的绘制结果，长时间运行时不必为每个任务重新绘制背景
+
+    封面文件被修改或远程封面更新后内容哈希改变，会重新绘制，不会沿用旧的图片。
+    """
+    from .cache import cover_identity
+
+    return _paint_msg(height, width, output_height_want, cover, circle_crop, auto_crop,
+                      display_all, cache_root, cover_identity(cover, cache_root))
+
+
+@lru_cache(maxsize=16)
+def _paint_msg(height: int, width: int, output_height_want: int | None,
+               cover: str | PathLike | None, circle_crop: bool, auto_crop: bool,
+               display_all: bool, cache_root: str | PathLike | None,
+               cover_identity: str | None) -> PaintMsg:
+    paint_msg = PaintMsg.from_video_info(height, width, output_height_want, cover,
+                                         circle_crop, auto_crop, display_all, cache_root)
+    paint_msg.cover_identity = cover_identity
+    return paint_msg
 
 
 if __name__ == "__main__":
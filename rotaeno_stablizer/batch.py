@@ -0,0 +1,233 @@
+"""批量处理
+
+旋转提取（只解码）与渲染（解码 + 编码）分为两级流水线：
+提取线程池先行处理后面的视频，渲染线程池同时渲染已提取完的视频，
+两者的并发数分别限制。渲染沿用提取时的探测、绘制与编解码器选择结果。
+"""
+import argparse
+import copy
+import glob
+import logging
+import os
+import time
+from dataclasses import dataclass
+from multiprocessing.pool import ThreadPool
+from os import PathLike
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterable
+
+from rich import get_console
+from rich.progress import (
+    BarColumn,
+    Progress,
+    SpinnerColumn,
+    TaskProgressColumn,
+    TextColumn,
+    TimeRemainingColumn,
+)
+from rich.table import Table
+
+from . import Rotaeno
+from .config import config_data
+from .profiling import StageProfiler
+from .track import read_track_info
+from .utils import FPSColumn
+
+log = logging.getLogger("rich")
+
+
+@dataclass
+class BatchJob:
+    input_video: Path
+    output_video: Path
+    output_mask: Path | None = None
+    track: Path | None = None
+    frames: int = 0
+    extract_time: float = 0.
+    render_time: float = 0.
+    error: str | None = None
+
+
+def collect_inputs(items: Iterable[str | PathLike]) -> list[Path]:
+    """展开输入：视频路径、glob 通配符，或以 @ 开头的清单文件（每行一个路径或通配符，# 为注释）"""
+    inputs: list[Path] = []
+    for item in map(str, items):
+        if item.startswith("@"):
+            lines = Path(item[1:]).read_text(encoding="utf-8").splitlines()
+            inputs += collect_inputs(
+                line.strip() for line in lines if line.strip() and not line.startswith("#"))
+        elif glob.has_magic(item):
+            inputs += sorted(Path(p) for p in glob.glob(item, recursive=True))
+        else:
+            inputs.append(Path(item))
+    # 去重并保持顺序
+    return list(dict.fromkeys(inputs))
+
+
+class BatchRunner:
+
+    def __init__(self,
+                 rotaeno: Rotaeno,
+                 max_decoders: int = 2,
+                 max_encoders: int = 1,
+                 run_kwargs: dict | None = None) -> None:
+        """
+        Args:
+            rotaeno (Rotaeno): 作为模板的实例，每个任务使用它的副本
+            max_decoders (int, optional): 同时进行的旋转提取数，各提取平分模板实例的并行段数. Defaults to 2.
+            max_encoders (int, optional): 同时进行的渲染数. Defaults to 1.
+            run_kwargs (dict | None, optional): 传给 Rotaeno.run 的其他参数（编解码器、码率等）. Defaults to None.
+        """
+        self.rotaeno = rotaeno
+        self.max_decoders = max(max_decoders, 1)
+        self.max_encoders = max(max_encoders, 1)
+        self.run_kwargs = run_kwargs or {}
+
+    def job_rotaeno(self) -> Rotaeno:
+        rotaeno = copy.copy(self.rotaeno)
+        # 各任务的帧率与统计互相独立，并发时不采集 Python 热点
+        rotaeno.profiler = StageProfiler(self.rotaeno.profiler.enabled)
+        # 同时进行的提取平分并行段数，解码进程总数不超过单个任务时的段数
+        segments = self.rotaeno.extract_segments or os.cpu_count() or 1
+        rotaeno.extract_segments = max(segments // self.max_decoders, 1)
+        return rotaeno
+
+    def extract(self, job: BatchJob, rotaeno: Rotaeno, progress: Progress) -> BatchJob:
+        start = time.perf_counter()
+        try:
+            rotaeno.run(job.input_video,
+                        output_track=job.track,
+                        ensure_rewrite=True,
+                        progress=progress,
+                        **self.run_kwargs)
+            job.frames = read_track_info(job.track).frames
+        except Exception as e:
+            log.exception(f"Extraction failed: {job.input_video}")
+            job.error = str(e)
+        job.extract_time = time.perf_counter() - start
+        return job
+
+    def render(self, job: BatchJob, rotaeno: Rotaeno, progress: Progress) -> BatchJob:
+        start = time.perf_counter()
+        try:
+            rotaeno.run(job.input_video,
+                        output_video=job.output_video,
+                        output_mask=job.output_mask,
+                        ensure_rewrite=True,
+                        input_track=job.track,
+                        progress=progress,
+                        reuse_info=True,
+                        **self.run_kwargs)
+        except Exception as e:
+            log.exception(f"Render failed: {job.input_video}")
+            job.error = str(e)
+        job.render_time = time.perf_counter() - start
+        return job
+
+    def run(self, jobs: list[BatchJob]) -> list[BatchJob]:
+        progress = Progress(SpinnerColumn(),
+                            TextColumn("[progress.description]{task.description}"),
+                            BarColumn(), TaskProgressColumn(), FPSColumn(),
+                            TimeRemainingColumn(elapsed_when_finished=True))
+        rotaenos = [self.job_rotaeno() for _ in jobs]
+
+        with (TemporaryDirectory(dir=self.rotaeno.scratch_dir) as temp_dir_str, progress,
+              ThreadPool(self.max_decoders) as extract_pool,
+              ThreadPool(self.max_encoders) as render_pool):
+            for i, job in enumerate(jobs):
+                job.track = Path(temp_dir_str) / f"{i}.rtrk"
+
+            # 提取按顺序先行，完成一个就交给渲染线程池，与后续的提取重叠
+            renders = []
+            for job, rotaeno in zip(
+                    extract_pool.imap(lambda args: self.extract(*args, progress),
+                                      zip(jobs, rotaenos)), rotaenos):
+                if job.error is None:
+                    renders.append(render_pool.apply_async(self.render,
+                                                           (job, rotaeno, progress)))
+            for result in renders:
+                result.wait()
+
+        return jobs
+
+
+def rotaeno_from_config(background: str | PathLike | None = None) -> Rotaeno:
+    """按 config.toml 的设置创建实例"""
+    return Rotaeno(rotation_version=config_data["video"]["rotation_version"],
+                   circle_crop=config_data["video"]["circle_crop"],
+                   auto_crop=config_data["video"]["auto_crop"],
+                   display_all=config_data["video"]["display_all"],
+                   background=background or None,
+                   height=config_data["video"]["height"],
+                   extract_segments=config_data["performance"]["extract_segments"],
+                   cache_dir=config_data["performance"]["cache_dir"] or None,
+                   rotation_cache_size=config_data["performance"]["rotation_cache_size"],
+                   asset_cache_size=config_data["performance"]["asset_cache_size"],
+                   scratch_dir=config_data["performance"]["scratch_dir"] or None,
+                   cache_content_hash=config_data["performance"]["cache_content_hash"],
+                   cmd_tolerance=config_data["performance"]["cmd_tolerance"],
+                   engine=config_data["performance"]["engine"],
+                   extract_profile=config_data["performance"]["extract_profile"],
+                   render_segments=config_data["performance"]["render_segments"])
+
+
+def run_kwargs_from_config() -> dict:
+    """按 config.toml 的设置给出 Rotaeno.run 的编解码参数"""
+    return {
+        "encoder": config_data["codec"]["encoder"] or None,
+        "decoder": config_data["codec"]["decoder"] or None,
+        "bitrate": config_data["codec"]["bitrate"],
+        "use_cache": config_data["performance"]["cache"]
+    }
+
+
+def summary_table(jobs: list[BatchJob]) -> Table:
+    table = Table(title="Batch Summary")
+    table.add_column("Input")
+    table.add_column("Status")
+    table.add_column("Frames", justify="right")
+    table.add_column("Extract", justify="right")
+    table.add_column("Render", justify="right")
+    table.add_column("Render FPS", justify="right")
+    for job in jobs:
+        render_fps = job.frames / job.render_time if job.render_time else 0
+        table.add_row(str(job.input_video),
+                      "[green]OK" if job.error is None else f"[red]{job.error[:40]}",
+                      str(job.frames), f"{job.extract_time:.1f}s", f"{job.render_time:.1f}s",
+                      f"{render_fps:.1f}")
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotaeno batch")
+    parser.add_argument("inputs", nargs="+", help="视频路径、通配符，或 @清单文件")
+    parser.add_argument("-d", "--output-dir", type=str, default=None,
+                        help="输出目录，默认为输入视频所在目录")
+    parser.add_argument("-bg", "--background", type=str, default=None, help="歌曲封面照片路径")
+    parser.add_argument("--mask-output", action="store_true", help="同时输出掩码")
+    parser.add_argument("--decoders", type=int, default=2, help="同时进行的旋转提取数")
+    parser.add_argument("--encoders", type=int, default=1, help="同时进行的渲染数")
+    parser.add_argument("--overwrite", action="store_true", help="覆盖已存在的输出")
+    args = parser.parse_args()
+
+    jobs = []
+    for input_video in collect_inputs(args.inputs):
+        output_dir = Path(args.output_dir) if args.output_dir else input_video.parent
+        output_video = output_dir / f"{input_video.stem}_out{input_video.suffix}"
+        output_mask = (output_dir / f"{input_video.stem}_mask{input_video.suffix}"
+                       if args.mask_output else None)
+        if not args.overwrite and output_video.exists():
+            log.info(f"Skip {input_video}: {output_video} exists")
+            continue
+        jobs.append(BatchJob(input_video, output_video, output_mask))
+    if not jobs:
+        return
+
+    runner = BatchRunner(rotaeno_from_config(args.background), args.decoders, args.encoders,
+                         run_kwargs_from_config())
+    get_console().print(summary_table(runner.run(jobs)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+"""基准测试
+
+用 ffmpeg lavfi 在本地生成合成录像：中间为 testsrc2 画面，四角按已知的序列编码旋转角度
+（V2 为 12 位二进制，V1 为参考色与取样色），覆盖多种分辨率、帧率与时长。
+测量旋转提取速度与解码精度、各布局的渲染速度以及峰值内存，结果保存为 JSON，
+compare 子命令对比两次结果并标出性能退化。
+
+每项测量在单独的子进程中进行，峰值内存互不影响。
+
+    python -m rotaeno_stablizer.benchmark run -o result.json
+    python -m rotaeno_stablizer.benchmark compare base.json result.json
+
+--extract-profile fast 测量 fast 提取配置，与 accurate 的结果对比即可确认角度一致。
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from os import PathLike
+from pathlib import Path
+
+import numpy as np
+from rich import get_console
+from rich.table import Table
+
+from .ffmpeg import FFMpegCapabilities, FFMpegError, get_ffmpeg
+from .profiling import StageProfiler
+from .rotation_calc import EXTRACT_PROFILES, RotationCalc
+
+log = logging.getLogger("rich")
+
+# 合成录像的格式版本，改变编码方式时递增，使旧的录像失效
+SYNTHETIC_VERSION = 1
+CORNER_SIZE = 16  # 四角色块边长，需大于 RotationCalc 的取样区域
+V2_STEP = 11  # V2 每帧前进的量化级数（与 4096 互质，遍历所有角度）
+V1_STEP = 3  # V1 每帧前进的取样色级数
+V1_LEVELS = 127  # V1 取样色在中心色两侧各 127 级
+
+DEFAULT_CASES = ["1280x720@30:10", "1920x1080@60:10", "2400x1080@60:10"]
+QUICK_CASES = ["854x480@30:4"]
+LAYOUTS = {
+    "default": {},
+    "no_circle_crop": {"circle_crop": False},
+    "no_display_all": {"display_all": False},
+    "no_auto_crop": {"auto_crop": False},
+}
+# 退化判断：指标、方向（1 越大越好，-1 越小越好）
+METRICS = {
+    "fps": 1,
+    "peak_rss": -1,
+    "children_peak_rss": -1,
+    "max_error": -1,
+    "frame_mismatch": -1
+}
+
+
+@dataclass(frozen=True)
+class BenchCase:
+    width: int
+    height: int
+    fps: int
+    duration: float
+
+    @classmethod
+    def from_spec(cls, spec: str) -> "BenchCase":
+        """解析 "宽x高@帧率:时长" 形式的规格，如 "1920x1080@60:10" """
+        match = re.fullmatch(r"(\d+)x(\d+)@(\d+):([\d.]+)", spec.strip())
+        if match is None:
+            raise ValueError(f"Invalid case spec: {spec}")
+        width, height, fps, duration = match.groups()
+        return cls(int(width), int(height), int(fps), float(duration))
+
+    @property
+    def name(self) -> str:
+        return f"{self.width}x{self.height}@{self.fps}:{self.duration:g}"
+
+    @property
+    def frames(self) -> int:
+        return round(self.fps * self.duration)
+
+
+def v2_codes(frames: int) -> np.ndarray:
+    """V2 每帧的量化角度（0~4095）"""
+    return np.arange(frames, dtype=np.int64) * V2_STEP % 4096
+
+
+def v1_levels(frames: int) -> np.ndarray:
+    """V1 每帧的取样色序号（0~253），前半为中心色到右参考色，后半为中心色到左参考色"""
+    return np.arange(frames, dtype=np.int64) * V1_STEP % (V1_LEVELS * 2)
+
+
+def expected_angles(version: int, frames: int) -> np.ndarray:
+    """合成录像每帧的旋转角度，与 RotationCalc 的输出同号"""
+    if version == 2:
+        return v2_codes(frames) / 4096 * -360
+    j = v1_levels(frames)
+    return -np.where(j <= V1_LEVELS, j / V1_LEVELS * 180,
+                     360 - (j - V1_LEVELS) / V1_LEVELS * 180)
+
+
+def angle_quantum(version: int) -> float:
+    """编码的最小角度间隔"""
+    return 360 / 4096 if version == 2 else 180 / V1_LEVELS
+
+
+def corner_sources(version: int) -> list[str]:
+    """四角（左上、右上、左下、右下）色块的 geq 表达式 (r, g, b)"""
+    if version == 2:
+        code = f"mod({V2_STEP}*N,4096)"
+        return [
+            ":".join(f"{ch}='255*mod(floor({code}/{2 ** (11 - 3 * corner - i)}),2)'"
+                     for i, ch in enumerate("rgb")) for corner in range(4)
+        ]
+    level = f"mod({V1_STEP}*N,{V1_LEVELS * 2})"
+    sample = f"if(lte({level},{V1_LEVELS}),128+{level},{V1_LEVELS * 2 + 1}-{level})"
+    center = 128
+    left, right = center - V1_LEVELS, center + V1_LEVELS
+    return [
+        f"r={left}:g={left}:b={left}",
+        f"r={right}:g={right}:b={right}",
+        f"r={center}:g={center}:b={center}",
+        f"r='{sample}':g='{sample}':b='{sample}'",
+    ]
+
+
+def synthetic_video_cmd(case: BenchCase, version: int, output: str | PathLike) -> list:
+    size = CORNER_SIZE
+    inputs = [f"testsrc2=s={case.width}x{case.height}:r={case.fps}:d={case.duration}"]
+    inputs += [
+        f"color=c=black:s={size}x{size}:r={case.fps}:d={case.duration},format=gbrp,geq={expr}"
+        for expr in corner_sources(version)
+    ]
+    cmd = [get_ffmpeg(), "-y", "-loglevel", "error"]
+    for source in inputs:
+        cmd += ["-f", "lavfi", "-i", source]
+    positions = ["0:0", f"W-{size}:0", f"0:H-{size}", f"W-{size}:H-{size}"]
+    graph = "[0:v]null[base0];" + ";".join(
+        f"[base{i}][{i + 1}:v]overlay={position}:eof_action=pass[base{i + 1}]"
+        for i, position in enumerate(positions))
+    # 真实录像都带有音轨，渲染时会复制音频，这里用静音代替
+    cmd += ["-f", "lavfi", "-i", f"anullsrc=r=48000:cl=stereo:d={case.duration}"]
+    cmd += [
+        "-filter_complex", graph, "-map", "[base4]", "-map", f"{len(inputs)}:a",
+        "-frames:v", str(case.frames)
+    ]
+    # 与真实录像相同的 yuv420p，关键帧间隔 2 秒，使分段提取与渲染可以切分
+    cmd += [
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p", "-g",
+        str(case.fps * 2), "-c:a", "aac", output
+    ]
+    return cmd
+
+
+def synthetic_video(case: BenchCase, version: int, work_dir: str | PathLike) -> Path:
+    """生成（或复用已生成的）合成录像"""
+    path = Path(work_dir) / (f"synthetic_v{SYNTHETIC_VERSION}_rot{version}_"
+                             f"{case.width}x{case.height}_{case.fps}fps_{case.duration:g}s.mp4")
+    if path.exists():
+        return path
+    log.info(f"Generating {path.name}")
+    temp = path.with_name(path.stem + ".tmp.mp4")
+    proc = subprocess.run(synthetic_video_cmd(case, version, temp), stderr=subprocess.PIPE)
+    if proc.returncode != 0:
+        temp.unlink(missing_ok=True)
+        raise FFMpegError(proc.stderr.decode("utf-8", errors="replace"))
+    os.replace(temp, path)
+    return path
+
+
+def stage_result(record, **extra) -> dict:
+    return {
+        "wall": record.wall,
+        "frames": record.frames,
+        "fps": record.fps,
+        "peak_rss": record.peak_rss,
+        "children_peak_rss": record.children_peak_rss,
+        **extra
+    }
+
+
+def measure_extract(video: str, case: BenchCase, version: int, segments: int | None,
+                    profile: str) -> dict:
+    """提取旋转角度，测量速度与解码精度（在子进程中运行）"""
+    profiler = StageProfiler(True)
+    calc = RotationCalc(version, segments=segments, profile=profile)
+    # fast 配置的捷径校验每个视频只做一次，单独计时，不计入提取速度
+    validate_start = time.perf_counter()
+    shortcuts = calc.resolve_shortcuts(video, case.fps, None)
+    validate_wall = time.perf_counter() - validate_start
+    with profiler.stage("extract") as record:
+        angles = np.concatenate([np.empty(0), *calc.export_blocks(video, case.fps)])
+        record.frames = len(angles)
+
+    expected = expected_angles(version, case.frames)
+    count = min(len(angles), len(expected))
+    error = np.abs((angles[:count] - expected[:count] + 180) % 360 - 180)
+    return stage_result(record,
+                        shortcuts=list(shortcuts),
+                        validate_wall=validate_wall,
+                        frame_mismatch=len(angles) - len(expected),
+                        max_error=float(error.max()) if count else None,
+                        mean_error=float(error.mean()) if count else None,
+                        exact=float((error < angle_quantum(version) / 2).mean())
+                        if count else None)
+
+
+def measure_render(video: str, layout: dict, output: str, encoder: str | None,
+                   decoder: str | None, using_hardware_acc: bool) -> dict:
+    """按布局渲染，测量渲染速度（在子进程中运行）"""
+    from rich.progress import Progress
+
+    from . import Rotaeno
+
+    rotaeno = Rotaeno(profile=True, **layout)
+    rotaeno.run(video,
+                output_video=output,
+                ensure_rewrite=True,
+                use_cache=False,
+                encoder=encoder,
+                decoder=decoder,
+                using_hardware_acc=using_hardware_acc,
+                progress=Progress(disable=True))
+    records = {record.name: record for record in rotaeno.profiler.records}
+    total = records["total"]
+    return stage_result(records["render"],
+                        total_wall=total.wall,
+                        peak_rss=total.peak_rss,
+                        children_peak_rss=total.children_peak_rss)
+
+
+def isolated(func, *args) -> dict:
+    """在新进程中运行一项测量"""
+    with multiprocessing.get_context("spawn").Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def repeated(repeat: int, func, *args) -> dict:
+    """重复测量，取速度为中位数的一次，峰值内存取最大值"""
+    results = [isolated(func, *args) for _ in range(max(repeat, 1))]
+    results.sort(key=lambda r: r["fps"] or 0)
+    result = results[len(results) // 2]
+    for key in ("peak_rss", "children_peak_rss"):
+        values = [r[key] for r in results if r[key] is not None]
+        result[key] = max(values) if values else None
+    result["runs"] = [r["fps"] for r in results]
+    return result
+
+
+def run_benchmark(cases: list[BenchCase],
+                  work_dir: str | PathLike,
+                  layouts: list[str] | None = None,
+                  versions: list[int] | None = None,
+                  repeat: int = 1,
+                  extract_segments: int | None = None,
+                  extract_profile: str = "accurate",
+                  encoder: str | None = "libx264",
+                  decoder: str | None = None,
+                  using_hardware_acc: bool = False) -> dict:
+    """运行基准测试，返回可保存为 JSON 的结果
+
+    Args:
+        cases (list[BenchCase]): 合成录像的规格
+        work_dir (str | PathLike): 合成录像与渲染输出的位置，合成录像在多次运行间复用
+        layouts (list[str] | None, optional): 渲染的布局（LAYOUTS 的键），None 为全部. Defaults to None.
+        versions (list[int] | None, optional): 测量提取的直播模式版本，None 为 [1, 2]. Defaults to None.
+        repeat (int, optional): 每项重复次数. Defaults to 1.
+        extract_segments (int | None, optional): 旋转提取的并行段数，None 为 CPU 核心数. Defaults to None.
+        extract_profile (str, optional): 旋转提取配置，"accurate" 或 "fast". Defaults to "accurate".
+        encoder (str | None, optional): 渲染使用的编码器，None 为自动选择. Defaults to "libx264".
+        decoder (str | None, optional): 渲染使用的解码器，None 为自动选择. Defaults to None.
+        using_hardware_acc (bool, optional): 自动选择时是否考虑硬件编解码器. Defaults to False.
+    """
+    work_dir = Path(work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    layouts = list(LAYOUTS) if layouts is None else layouts
+    versions = [1, 2] if versions is None else versions
+
+    results = []
+    for case in cases:
+        for version in versions:
+            video = synthetic_video(case, version, work_dir)
+            log.info(f"Extract {case.name} v{version}")
+            results.append({
+                "kind": "extract",
+                "case": case.name,
+                "version": version,
+                **repeated(repeat, measure_extract, str(video), case, version, extract_segments,
+                           extract_profile)
+            })
+
+        # 渲染与直播模式版本无关，使用 V2 录像
+        video = synthetic_video(case, 2, work_dir)
+        for layout in layouts:
+            log.info(f"Render {case.name} {layout}")
+            output = work_dir / f"render_{layout}.mp4"
+            results.append({
+                "kind": "render",
+                "case": case.name,
+                "layout": layout,
+                **repeated(repeat, measure_render, str(video), LAYOUTS[layout], str(output),
+                           encoder, decoder, using_hardware_acc)
+            })
+            output.unlink(missing_ok=True)
+            output.with_name(output.stem + ".profile.json").unlink(missing_ok=True)
+
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "ffmpeg": FFMpegCapabilities(use_cache=False).version,
+            "synthetic_version": SYNTHETIC_VERSION,
+            "cases": [asdict(case) for case in cases],
+            "repeat": repeat,
+            "extract_segments": extract_segments,
+            "extract_profile": extract_profile,
+            "encoder": encoder,
+            "decoder": decoder,
+        },
+        "results": results
+    }
+
+
+def result_key(result: dict) -> tuple:
+    return (result["kind"], result["case"], result.get("version", result.get("layout")))
+
+
+def compare_results(base: dict, new: dict, threshold: float = 0.1) -> list[dict]:
+    """逐项对比两次结果，返回变化列表；相对变化超过 threshold 的退化标记为 regression
+
+    max_error 以编码的最小角度间隔为容差，frame_mismatch 只要绝对值变大即为退化。
+    """
+    base_results = {result_key(r): r for r in base["results"]}
+    changes = []
+    for result in new["results"]:
+        key = result_key(result)
+        old = base_results.get(key)
+        if old is None:
+            continue
+        for metric, direction in METRICS.items():
+            before, after = old.get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            if metric == "max_error":
+                regression = after - before > angle_quantum(result["version"]) / 2
+            elif metric == "frame_mismatch":
+                regression = abs(after) > abs(before)
+            else:
+                regression = before > 0 and (after - before) / before * direction < -threshold
+            changes.append({
+                "key": key,
+                "metric": metric,
+                "before": before,
+                "after": after,
+                "change": (after - before) / before if before else None,
+                "regression": regression
+            })
+    return changes
+
+
+def format_value(metric: str, value: float) -> str:
+    if metric in ("peak_rss", "children_peak_rss"):
+        return f"{value / (1 << 20):.1f} MB"
+    if metric == "max_error":
+        return f"{value:.3f}°"
+    if metric == "frame_mismatch":
+        return f"{value:+d}"
+    return f"{value:.1f}"
+
+
+def results_table(data: dict) -> Table:
+    table = Table(title="Benchmark")
+    for column in ("Kind", "Case", "Version / Layout", "FPS", "Max Error", "Exact",
+                   "Frame Δ", "Peak RSS", "FFmpeg Peak RSS"):
+        table.add_column(column, justify="left" if column in ("Kind", "Case") else "right")
+    for result in data["results"]:
+        kind, case, variant = result_key(result)
+        table.add_row(
+            kind, case, str(variant),
+            format_value("fps", result["fps"]) if result["fps"] else "-",
+            format_value("max_error", result["max_error"])
+            if result.get("max_error") is not None else "-",
+            f"{result['exact']:.1%}" if result.get("exact") is not None else "-",
+            format_value("frame_mismatch", result["frame_mismatch"])
+            if result.get("frame_mismatch") is not None else "-",
+            format_value("peak_rss", result["peak_rss"]) if result["peak_rss"] else "-",
+            format_value("children_peak_rss", result["children_peak_rss"])
+            if result["children_peak_rss"] else "-")
+    return table
+
+
+def compare_table(changes: list[dict]) -> Table:
+    table = Table(title="Benchmark Compare")
+    for column in ("Item", "Metric", "Before", "After", "Change"):
+        table.add_column(column, justify="left" if column in ("Item", "Metric") else "right")
+    for change in changes:
+        style = "[red]" if change["regression"] else ""
+        table.add_row(" ".join(map(str, change["key"])), change["metric"],
+                      format_value(change["metric"], change["before"]),
+                      format_value(change["metric"], change["after"]),
+                      style + (f"{change['change']:+.1%}" if change["change"] is not None else "-"))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotaeno benchmark")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="运行基准测试")
+    run.add_argument("-o", "--output", type=str, default="benchmark.json")
+    run.add_argument("--case", action="append", default=None,
+                     help="合成录像规格，可多次指定，如 1920x1080@60:10")
+    run.add_argument("--quick", action="store_true", help="只测一个小规格，用于快速检查")
+    run.add_argument("--layout", choices=list(LAYOUTS), action="append", default=None)
+    run.add_argument("--version", type=int, choices=[1, 2], action="append", default=None,
+                     help="测量提取的直播模式版本")
+    run.add_argument("--repeat", type=int, default=1)
+    run.add_argument("--extract-segments", type=int, default=None)
+    run.add_argument("--extract-profile", choices=EXTRACT_PROFILES, default="accurate")
+    run.add_argument("--encoder", type=str, default="libx264")
+    run.add_argument("--decoder", type=str, default=None)
+    run.add_argument("--hwaccel", action="store_true", help="自动选择时考虑硬件编解码器")
+    run.add_argument("--work-dir", type=str,
+                     default=str(Path(tempfile.gettempdir()) / "rotaeno_benchmark"),
+                     help="合成录像的位置，多次运行间复用")
+    compare = sub.add_parser("compare", help="对比两次结果")
+    compare.add_argument("base")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float, default=0.1,
+                         help="视为退化的相对变化")
+    args = parser.parse_args()
+
+    console = get_console()
+    if args.command == "run":
+        specs = args.case or (QUICK_CASES if args.quick else DEFAULT_CASES)
+        data = run_benchmark([BenchCase.from_spec(spec) for spec in specs],
+                             args.work_dir,
+                             layouts=args.layout,
+                             versions=args.version,
+                             repeat=args.repeat,
+                             extract_segments=args.extract_segments,
+                             extract_profile=args.extract_profile,
+                             encoder=args.encoder or None,
+                             decoder=args.decoder,
+                             using_hardware_acc=args.hwaccel)
+        Path(args.output).write_text(json.dumps(data, indent=2, ensure_ascii=False),
+                                     encoding="utf-8")
+        console.print(results_table(data))
+        log.info(f"Benchmark result saved in {args.output}")
+    else:
+        base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+        new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+        changes = compare_results(base, new, args.threshold)
+        console.print(compare_table(changes))
+        regressions = [c for c in changes if c["regression"]]
+        if regressions:
+            log.error(f"{len(regressions)} regression(s) found")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
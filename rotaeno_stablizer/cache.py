@@ -0,0 +1,343 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import uuid
+from contextlib import contextmanager
+from os import PathLike, fspath
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterable
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+    from .background import PaintMsg
+
+log = logging.getLogger("rich")
+
+
+def default_cache_dir() -> Path:
+    """系统缓存目录（Windows 为 %LOCALAPPDATA%，其余为 $XDG_CACHE_HOME 或 ~/.cache）"""
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", Path.home() / "AppData" / "Local")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")
+    return Path(base) / "rotaeno_stablizer"
+
+
+# 本程序在缓存根目录下创建的子目录，根目录可能是用户指定的已有文件夹，清空时只删除这些
+CACHE_NAMES = ("rotation", "assets", "covers", "probe", "ffmpeg")
+
+
+def clear_cache(root: str | PathLike | None = None):
+    """清空全部缓存（只删除本程序创建的缓存子目录）"""
+    for name in CACHE_NAMES:
+        DiskCache(name, 0, root).clear()
+    log.info(f"Cache cleared: {Path(root) if root else default_cache_dir()}")
+
+
+def file_identity(path: str | PathLike, content_hash: bool = False) -> dict:
+    """文件身份：绝对路径、大小、修改时间，可选地加上内容抽样哈希"""
+    path = Path(path).resolve()
+    stat = path.stat()
+    identity: dict[str, Any] = {
+        "path": str(path),
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns
+    }
+    if content_hash:
+        # 只读取首、中、尾各 4 MiB，避免对数 GB 的录像做全文件哈希
+        chunk = 4 << 20
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for offset in (0, max(stat.st_size // 2 - chunk // 2, 0),
+                           max(stat.st_size - chunk, 0)):
+                f.seek(offset)
+                digest.update(f.read(chunk))
+        identity["hash"] = digest.hexdigest()
+    return identity
+
+
+def file_digest(path: str | PathLike) -> str:
+    """文件内容的完整哈希，用于封面等小文件"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cover_identity(cover: str | PathLike | None,
+                   root: str | PathLike | None = None) -> str | None:
+    """封面内容的哈希，远程封面先经 CoverCache 向服务器确认，更新后哈希随之改变"""
+    if cover is None:
+        return None
+    cover = fspath(cover)
+    if cover.startswith(("http://", "https://")):
+        return CoverCache(root).fetch(cover)[1]["digest"]
+    return file_digest(cover)
+
+
+class DiskCache:
+    """以键保存文件的磁盘缓存，总大小超出上限时淘汰最久未使用的条目"""
+
+    def __init__(self,
+                 name: str,
+                 max_size: int,
+                 root: str | PathLike | None = None) -> None:
+        """
+        Args:
+            name (str): 缓存子目录名
+            max_size (int): 缓存大小上限（字节）
+            root (str | PathLike | None, optional): 缓存根目录，None 为系统缓存目录. Defaults to None.
+        """
+        self.root = Path(root) if root else default_cache_dir()
+        self.directory = self.root / name
+        self.max_size = max_size
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(
+            json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def path(self, key: str, suffix: str = "") -> Path:
+        return self.directory / f"{key}{suffix}"
+
+    def get(self, key: str, suffix: str = "") -> Path | None:
+        """命中时返回缓存文件路径，并刷新其使用时间"""
+        path = self.path(key, suffix)
+        try:
+            os.utime(path)
+        except OSError:
+            return None
+        log.debug(f"Cache hit: {path}")
+        return path
+
+    @contextmanager
+    def put(self, key: str, suffix: str = "") -> Generator[Path, Any, None]:
+        """写入缓存：调用方写入给出的临时文件，正常退出后才原子地替换为正式条目"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        temp = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        try:
+            yield temp
+            os.replace(temp, self.path(key, suffix))
+        finally:
+            temp.unlink(missing_ok=True)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            log.debug(f"Cache evicted: {path}")
+
+    def clear(self):
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+
+
+class RotationCache(DiskCache):
+    """旋转角度缓存，按输入视频身份、帧率、直播模式版本、取样区域以及提取配置索引
+
+    fast 配置实际启用的捷径在提取完成后才确定，作为旁注（.json）与条目一同保存。
+    """
+
+    suffix = ".f64"
+    meta_suffix = ".json"
+    block_frames = 8192
+
+    def __init__(self,
+                 root: str | PathLike | None = None,
+                 max_size: int = 512 << 20,
+                 content_hash: bool = False) -> None:
+        super().__init__("rotation", max_size, root)
+        self.content_hash = content_hash
+
+    def key(self,
+            video: str | PathLike,
+            fps: float,
+            version: int,
+            area: int,
+            profile: str = "accurate") -> str:
+        return self.make_key(file_identity(video, self.content_hash), repr(fps), version,
+                             area, profile)
+
+    def load(self, key: str) -> Generator[np.ndarray, Any, None] | None:
+        """命中时按块返回旋转角度，未命中返回 None"""
+        path = self.get(key, self.suffix)
+        if path is None:
+            return None
+        if path.stat().st_size == 0:
+            return (block for block in ())
+        angles = np.memmap(path, dtype="<f8", mode="r")
+
+        def blocks():
+            for start in range(0, len(angles), self.block_frames):
+                yield np.array(angles[start:start + self.block_frames])
+
+        return blocks()
+
+    def load_meta(self, key: str) -> dict | None:
+        path = self.get(key, self.meta_suffix)
+        if path is None:
+            return None
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def store(self,
+              key: str,
+              blocks: Iterable[np.ndarray],
+              meta: Callable[[], dict] | None = None) -> Generator[np.ndarray, Any, None]:
+        """边输出边写入缓存，只有完整迭代结束后才会生成缓存条目
+
+        Args:
+            meta: 迭代结束后调用，返回值作为旁注与条目一同保存
+        """
+        with self.put(key, self.suffix) as temp, temp.open("wb") as f:
+            for block in blocks:
+                f.write(block.astype("<f8").tobytes())
+                yield block
+        if meta is not None:
+            with self.put(key, self.meta_suffix) as temp:
+                temp.write_text(json.dumps(meta()), encoding="utf-8")
+
+
+class AssetCache(DiskCache):
+    """背景与遮罩图片缓存，条目为 gzip 压缩的原始像素，命中时解压到交给 ffmpeg 的位置
+
+    原始像素较大（2160×2160 的背景约 14 MB），而背景大部分是纯色，压缩后通常只有几百 KB。
+    背景按输出尺寸、圆环半径与粗细以及封面内容索引，遮罩只取决于裁切尺寸。
+    """
+
+    suffix = ".raw.gz"
+
+    def __init__(self, root: str | PathLike | None = None, max_size: int = 64 << 20) -> None:
+        super().__init__("assets", max_size, root)
+
+    def background_key(self, paint_msg: "PaintMsg") -> str:
+        return self.make_key("background", paint_msg.output_size, paint_msg.circle_radius,
+                             paint_msg.circle_thickness,
+                             paint_msg.cover_identity)
+
+    def alpha_key(self, paint_msg: "PaintMsg") -> str:
+        return self.make_key("alpha", paint_msg.video_crop)
+
+    def save(self, paint_msg: "PaintMsg", background: str | PathLike, alpha: str | PathLike):
+        """将背景与遮罩写到指定位置，命中时直接复制，未命中时才绘制并写入缓存"""
+        for key, name, dest in ((self.background_key(paint_msg), "background", background),
+                                (self.alpha_key(paint_msg), "image_alpha", alpha)):
+            path = self.get(key, self.suffix)
+            if path is not None:
+                with gzip.open(path, "rb") as src, open(dest, "wb") as f:
+                    shutil.copyfileobj(src, f, 1 << 20)
+                continue
+            Path(dest).write_bytes(getattr(paint_msg, name).tobytes())
+            with (self.put(key, self.suffix) as temp, open(dest, "rb") as src,
+                  gzip.open(temp, "wb", compresslevel=1) as f):
+                shutil.copyfileobj(src, f, 1 << 20)
+
+
+class CoverCache(DiskCache):
+    """远程封面缓存，按网址索引，再次使用时以 ETag / Last-Modified 向服务器确认是否更新
+
+    除原图外，还按直径保存缩放后的图片（未压缩的 TIFF，读取时无需解码），
+    缩放结果以原图内容哈希索引，原图更新后自动失效。
+    """
+
+    def __init__(self,
+                 root: str | PathLike | None = None,
+                 max_size: int = 64 << 20,
+                 timeout: float = 10.) -> None:
+        super().__init__("covers", max_size, root)
+        self.timeout = timeout
+
+    def fetch(self, url: str) -> tuple[Path, dict]:
+        """返回原图的缓存路径与其元数据（etag、last_modified、digest）
+
+        网络错误、超时或服务器出错时，已有缓存则沿用缓存，否则抛出异常。
+        """
+        import urllib.error
+        import urllib.request
+
+        key = self.make_key(url)
+        path, meta_path = self.get(key, ".img"), self.get(key, ".json")
+        meta: dict = {}
+        headers = {}
+        if path is not None and meta_path is not None:
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                meta = {}
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers),
+                                        timeout=self.timeout) as r:
+                with self.put(key, ".img") as temp:
+                    with temp.open("wb") as f:
+                        shutil.copyfileobj(r, f)
+                    digest = file_digest(temp)
+                meta = {
+                    "etag": r.headers.get("ETag"),
+                    "last_modified": r.headers.get("Last-Modified"),
+                    "digest": digest
+                }
+        except urllib.error.HTTPError as e:
+            if not meta:
+                raise
+            assert path is not None
+            if e.code == 304:
+                log.debug(f"Cover not modified: {url}")
+            else:
+                log.warning(f"Cannot revalidate cover (HTTP {e.code}), use cached one: {url}")
+            return path, meta
+        except OSError as e:
+            # 连接失败（URLError）、读取超时（TimeoutError）等网络错误
+            if not meta:
+                raise
+            log.warning(f"Cannot revalidate cover ({getattr(e, 'reason', e)}), "
+                        f"use cached one: {url}")
+            assert path is not None
+            return path, meta
+
+        with self.put(key, ".json") as temp:
+            temp.write_text(json.dumps(meta), encoding="utf-8")
+        return self.path(key, ".img"), meta
+
+    def picture(self, url: str, diameter: int | None = None) -> "Image.Image":
+        """读取远程封面，diameter 不为 None 时返回缩放为该边长正方形的图片"""
+        from PIL import Image
+
+        path, meta = self.fetch(url)
+        if diameter is None:
+            return Image.open(path)
+
+        key = self.make_key(meta["digest"], diameter)
+        if (resized_path := self.get(key, ".tiff")) is not None:
+            return Image.open(resized_path)
+        resized = Image.open(path).resize((diameter, diameter))
+        with self.put(key, ".tiff") as temp:
+            resized.save(temp, format="TIFF")
+        return resized
@@ -49,10 +49,21 @@ def ui():
                       auto_crop=config_data["video"]["auto_crop"],
                       display_all=config_data["video"]["display_all"],
                       background=config_data["video"]["background"],
-                      height=config_data["video"]["height"])
+                      height=config_data["video"]["height"],
+                      extract_segments=config_data["performance"]["extract_segments"],
+                      cache_dir=config_data["performance"]["cache_dir"] or None,
+                      rotation_cache_size=config_data["performance"]["rotation_cache_size"],
+                      asset_cache_size=config_data["performance"]["asset_cache_size"],
+                      scratch_dir=config_data["performance"]["scratch_dir"] or None,
+                      cache_content_hash=config_data["performance"]["cache_content_hash"],
+                      cmd_tolerance=config_data["performance"]["cmd_tolerance"],
+                      engine=config_data["performance"]["engine"],
+                      extract_profile=config_data["performance"]["extract_profile"],
+                      render_segments=config_data["performance"]["render_segments"])
     rotaeno.run(input_video=input_file,
                 output_video=output_file,
                 output_mask=output_mask,
                 output_cmd=output_cmd,
                 encoder=config_data["codec"]["encoder"],
-                bitrate=config_data["codec"]["bitrate"])
+                bitrate=config_data["codec"]["bitrate"],
+                use_cache=config_data["performance"]["cache"])
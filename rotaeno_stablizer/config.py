@@ -28,9 +28,55 @@ ask_for_config = true # 在直接运行时，是否询问、
 ask_for_output = false # 是否需要询问输出文件
 loglevel = "info" # 日志等级
 default_gui = true # （无参数情况下）启用 GUI 界面
-show_warning = true # 展示非官方警告"""
+show_warning = true # 展示非官方警告
+
+[performance]
+extract_segments = 0 # 旋转提取的并行段数（0 为 CPU 核心数，1 为不并行）
+cache = true # 是否缓存旋转数据
+cache_dir = "" # 缓存目录（空为系统缓存目录）
+rotation_cache_size = 512 # 旋转数据缓存上限（MB）
+asset_cache_size = 64 # 背景与遮罩图片缓存上限（MB）
+cache_content_hash = false # 缓存时是否校验输入视频内容（抽样哈希）
+cmd_tolerance = 0.0 # 合并相邻旋转指令时允许的角度误差（度），0 为只合并相同角度
+engine = "ffmpeg" # 渲染引擎：ffmpeg（滤镜渲染）或 python（单次解码，适合纯 CPU 机器）
+extract_profile = "accurate" # 旋转提取配置：accurate（完整解码）或 fast（跳过环路滤波等解码捷径，与 accurate 校验一致时才启用）
+render_segments = 1 # 按关键帧分段并行渲染的段数（1 为不分段，0 为 CPU 核心数）
+scratch_dir = "" # 临时文件（背景、遮罩、旋转指令等）的位置，可设为内存文件系统（空为系统临时目录）
+
+[watch] # 监视文件夹模式
+watch_dir = "" # 监视的文件夹
+output_dir = "" # 输出文件夹（空为监视文件夹下的 output）
+done_dir = "" # 处理成功的录像移动到此（空为监视文件夹下的 done）
+failed_dir = "" # 处理失败的录像移动到此（空为监视文件夹下的 failed）
+background = "" # 背景图片（空为纯黑背景）
+extensions = [".mp4", ".mkv", ".mov", ".m4v", ".flv", ".avi"] # 监视的文件类型
+interval = 2.0 # 扫描间隔（秒）
+stable_seconds = 5.0 # 文件大小保持不变多久后视为写入完成（秒）
+
+[distributed] # 分布式渲染
+host = "127.0.0.1" # 协调端监听地址（没有认证，需要其他机器连接时改为 0.0.0.0，仅在可信网络中使用）
+port = 8765 # 协调端监听端口
+url = "http://127.0.0.1:8765" # 工作端连接的协调端地址
+segments = 16 # 分段数（实际段数受关键帧与最短时长限制）
+shared = false # 共享文件夹模式：工作端按相同的绝对路径直接读写文件，不经网络传输
+work_dir = "" # 任务临时文件位置（空为 [performance] scratch_dir，共享模式下需要工作端可访问）
+lease_timeout = 60.0 # 工作端多久没有心跳视为失联（秒），其分段重新分配
+heartbeat = 5.0 # 工作端心跳间隔（秒）"""
+
+
+
+def merge_config(default: dict, user: dict) -> dict:
+    """将用户配置覆盖到默认配置上，使旧版 config.toml 缺少的新选项使用默认值"""
+    for key, value in user.items():
+        if isinstance(value, dict) and isinstance(default.get(key), dict):
+            merge_config(default[key], value)
+        else:
+            default[key] = value
+    return default
+
 
 config_path = Path("config.toml")
-config_data = tomllib.loads(
-    config_path.read_text(encoding="UTF-8") \
-    if config_path.exists() else default_toml)
+config_data = merge_config(
+    tomllib.loads(default_toml),
+    tomllib.loads(config_path.read_text(encoding="UTF-8"))
+    if config_path.exists() else {})
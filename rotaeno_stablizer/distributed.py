@@ -0,0 +1,666 @@
+"""分布式渲染
+
+协调端探测视频、绘制背景、提取旋转轨道并按关键帧分段，通过 HTTP 分发分段任务；
+工作端领取分段，用 generate_ffmpeg_cmd 渲染后上传结果（共享文件夹模式下直接写入任务文件夹），
+协调端收齐后无损拼接并复制音频。
+工作端渲染时定时发送心跳，超时未更新的分段会重新分配给其他工作端。
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+import urllib.request
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import PathLike
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from threading import Condition, Event, Thread
+from urllib.parse import quote, unquote
+
+from rich.progress import (
+    BarColumn,
+    MofNCompleteColumn,
+    Progress,
+    SpinnerColumn,
+    TextColumn,
+    TimeRemainingColumn,
+)
+
+from . import Rotaeno
+from .background import ALPHA_FILE, BACKGROUND_FILE, cached_paint_msg
+from .batch import rotaeno_from_config, run_kwargs_from_config
+from .config import config_data
+from .ffmpeg import FFMpegCapabilities, FFMpegProgress, VideoInfo, audio_copy, concat_videos
+from .rotation_calc import ExtractSegment, RotationCalc, angles_to_intervals, format_cmd
+from .track import read_track
+
+log = logging.getLogger("rich")
+
+HW_CODER_MARKS = ("nvenc", "vaapi", "qsv", "amf", "videotoolbox", "cuvid")
+
+
+@dataclass
+class SegmentTask:
+    index: int
+    segment: ExtractSegment
+    status: str = "pending"  # pending / running / done / failed
+    worker: str | None = None
+    deadline: float = 0.
+    attempts: int = 0
+    frames: int = 0
+
+
+def write_segment_cmds(track: str | PathLike, fps: float, tolerance: float | None,
+                       segments: list[ExtractSegment], paths: list[Path]):
+    """从旋转轨道为每个分段写入只包含该段（及边界相邻）指令的 sendcmd 文件"""
+    _, blocks = read_track(track)
+    files = [path.open("w", encoding="utf-8", buffering=1 << 20) for path in paths]
+    try:
+        frame_count = 0
+        for (start, end), rotate, count in angles_to_intervals(blocks, fps, tolerance):
+            for f, segment in zip(files, segments):
+                if segment.touches(frame_count, count):
+                    f.write(format_cmd(start, end, rotate) + "\n")
+            frame_count += count
+    finally:
+        for f in files:
+            f.close()
+
+
+class Coordinator:
+
+    def __init__(self,
+                 rotaeno: Rotaeno,
+                 input_video: str | PathLike,
+                 output_video: str | PathLike,
+                 host: str = "127.0.0.1",
+                 port: int = 8765,
+                 segments: int = 16,
+                 shared: bool = False,
+                 work_dir: str | PathLike | None = None,
+                 lease_timeout: float = 60.,
+                 max_attempts: int = 3,
+                 encoder: str | None = None,
+                 decoder: str | None = None,
+                 bitrate: str | None = None,
+                 use_cache: bool = True) -> None:
+        """
+        Args:
+            rotaeno (Rotaeno): 提供画面设置并负责旋转提取的实例
+            input_video (str | PathLike): 输入视频
+            output_video (str | PathLike): 输出视频
+            host (str, optional): 监听地址，协调端没有认证且会提供输入视频，需要其他机器连接时才改为 0.0.0.0 等对外地址. Defaults to "127.0.0.1".
+            port (int, optional): 监听端口. Defaults to 8765.
+            segments (int, optional): 分段数（实际段数受关键帧与最短时长限制）. Defaults to 16.
+            shared (bool, optional): 共享文件夹模式，工作端按相同的绝对路径直接读写文件，不经网络传输. Defaults to False.
+            work_dir (str | PathLike | None, optional): 任务文件夹的位置，共享模式下需要工作端可访问，None 为实例的 scratch_dir. Defaults to None.
+            lease_timeout (float, optional): 工作端多久没有心跳视为失联（秒），其分段重新分配. Defaults to 60.
+            max_attempts (int, optional): 每个分段最多分配几次. Defaults to 3.
+            encoder (str | None, optional): 编码器，各段必须相同才能无损拼接，None 为本机可用的软件编码器. Defaults to None.
+            decoder (str | None, optional): 解码器，None 则由各工作端自行选择. Defaults to None.
+            bitrate (str | None, optional): 码率. Defaults to None.
+            use_cache (bool, optional): 使用缓存. Defaults to True.
+        """
+        self.rotaeno = rotaeno
+        self.input_video = Path(input_video).absolute()
+        self.output_video = Path(output_video)
+        self.host = host
+        self.port = port
+        self.segments = segments
+        self.shared = shared
+        self.work_dir = work_dir if work_dir is not None else rotaeno.scratch_dir
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.encoder = encoder
+        self.decoder = decoder
+        self.bitrate = bitrate
+        self.use_cache = use_cache
+
+        self.job_id = uuid.uuid4().hex
+        self.job_dir = Path()
+        self.job: dict = {}
+        self.files: dict[str, Path] = {}
+        self.tasks: list[SegmentTask] = []
+        self.error: str | None = None
+        self.condition = Condition()
+
+    def prepare(self, job_dir: Path):
+        """提取旋转、绘制背景并写入各分段的指令文件"""
+        self.job_dir = job_dir.absolute()
+        track = job_dir / "rotation.rtrk"
+        self.rotaeno.run(self.input_video,
+                         output_track=track,
+                         ensure_rewrite=True,
+                         decoder=self.decoder,
+                         encoder=self.encoder,
+                         use_cache=self.use_cache)
+        input_video_info, _, _, _ = self.rotaeno.infomation_get(self.input_video,
+                                                               job_dir,
+                                                               using_hardware_acc=False,
+                                                               use_cache=self.use_cache)
+        assert self.rotaeno.fps is not None
+
+        encoder = self.encoder
+        if encoder is None:
+            encoders, _ = FFMpegCapabilities.shared(self.rotaeno.cache_dir,
+                                                    self.use_cache).hw_codecs(
+                                                        input_video_info.codec)
+            # 工作端的硬件各不相同，默认使用都能运行的软件编码器；都不可用时交给 ffmpeg 选择
+            encoder = next(
+                (e for e in encoders if not any(mark in e for mark in HW_CODER_MARKS)),
+                encoders[-1] if encoders else None)
+            log.info(f"Use encoder {encoder} on all workers")
+
+        segments = RotationCalc(self.rotaeno.rotation_version,
+                                segments=self.segments,
+                                cache_dir=self.rotaeno.cache_dir,
+                                use_cache=self.use_cache).plan_segments(
+                                    self.input_video, self.rotaeno.fps)
+        if not segments:
+            segments = [ExtractSegment(None, 0, None)]
+        cmd_paths = [job_dir / f"rotation_s{i}.ffmpeg.cmd" for i in range(len(segments))]
+        write_segment_cmds(track, self.rotaeno.fps, self.rotaeno.cmd_tolerance, segments,
+                           cmd_paths)
+        self.tasks = [SegmentTask(i, segment) for i, segment in enumerate(segments)]
+        log.info(f"Split into {len(segments)} segments")
+
+        self.files = {
+            "input": self.input_video,
+            BACKGROUND_FILE: self.job_dir / BACKGROUND_FILE,
+            ALPHA_FILE: self.job_dir / ALPHA_FILE,
+            **{path.name: path.absolute() for path in cmd_paths}
+        }
+        self.job = {
+            "id": self.job_id,
+            "shared": self.shared,
+            "input_suffix": self.input_video.suffix,
+            "output_suffix": self.output_video.suffix,
+            "fps": self.rotaeno.fps,
+            "height": self.rotaeno.height,
+            "circle_crop": self.rotaeno.circle_crop,
+            "auto_crop": self.rotaeno.auto_crop,
+            "display_all": self.rotaeno.display_all,
+            "encoder": encoder,
+            "decoder": self.decoder,
+            "bitrate": self.bitrate,
+        }
+        if self.shared:
+            self.job["files"] = {name: str(path) for name, path in self.files.items()}
+
+    def part_path(self, task: SegmentTask) -> Path:
+        # 每次分配使用不同的文件，失联的工作端迟到的结果不会覆盖新的结果
+        return self.job_dir / f"segment_{task.index}_{task.attempts}{self.output_video.suffix}"
+
+    def final_path(self, task: SegmentTask) -> Path:
+        return self.job_dir / f"segment_{task.index}{self.output_video.suffix}"
+
+    def release(self, task: SegmentTask, reason: str):
+        """收回分段，重新排队；分配次数用尽则整个任务失败"""
+        task.worker = None
+        task.frames = 0
+        if task.attempts >= self.max_attempts:
+            task.status = "failed"
+            self.error = f"Segment {task.index} failed {task.attempts} times: {reason}"
+            log.error(self.error)
+        else:
+            task.status = "pending"
+            log.warning(f"Reassign segment {task.index}: {reason}")
+        self.condition.notify_all()
+
+    def expire_leases(self):
+        now = time.monotonic()
+        for task in self.tasks:
+            if task.status == "running" and task.deadline < now:
+                self.release(task, f"worker {task.worker} timed out")
+
+    def finished(self) -> bool:
+        return self.error is not None or all(task.status == "done" for task in self.tasks)
+
+    def rendered_frames(self, total_frame: int) -> int:
+        frames = 0
+        for task in self.tasks:
+            if task.status == "done":
+                frames += (task.segment.end or total_frame) - task.segment.start
+            elif task.status == "running":
+                frames += task.frames
+        return frames
+
+    def claim(self, worker: str) -> dict:
+        with self.condition:
+            self.expire_leases()
+            if self.finished():
+                return {"finished": True}
+            task = next((task for task in self.tasks if task.status == "pending"), None)
+            if task is None:
+                return {"wait": True}
+            task.status = "running"
+            task.worker = worker
+            task.attempts += 1
+            task.deadline = time.monotonic() + self.lease_timeout
+            log.info(f"Segment {task.index} -> {worker}")
+            claimed = {
+                "index": task.index,
+                "attempt": task.attempts,
+                "seek": task.segment.seek,
+                "start": task.segment.start,
+                "end": task.segment.end,
+                "cmd": f"rotation_s{task.index}.ffmpeg.cmd",
+            }
+            if self.shared:
+                claimed["output"] = str(self.part_path(task))
+            return claimed
+
+    def owned(self, worker: str, index: int, attempt: int) -> SegmentTask | None:
+        """返回该工作端当前持有的分段，已被收回时为 None"""
+        if not 0 <= index < len(self.tasks):
+            return None
+        task = self.tasks[index]
+        if task.status != "running" or task.worker != worker or task.attempts != attempt:
+            return None
+        return task
+
+    def heartbeat(self, worker: str, index: int, attempt: int, frames: int) -> dict:
+        with self.condition:
+            task = self.owned(worker, index, attempt)
+            if task is None:
+                return {"ok": False}
+            task.deadline = time.monotonic() + self.lease_timeout
+            task.frames = frames
+            self.condition.notify_all()
+            return {"ok": True}
+
+    def fail(self, worker: str, index: int, attempt: int, error: str) -> dict:
+        with self.condition:
+            task = self.owned(worker, index, attempt)
+            if task is not None:
+                self.release(task, f"worker {worker} failed: {error}")
+            return {"ok": True}
+
+    def complete(self, worker: str, index: int, attempt: int) -> dict:
+        """结果已在 part_path 中，接受第一份完成的结果"""
+        with self.condition:
+            if not 0 <= index < len(self.tasks):
+                return {"ok": False}
+            task = self.tasks[index]
+            part = self.job_dir / f"segment_{index}_{attempt}{self.output_video.suffix}"
+            if task.status == "done" or not part.exists():
+                part.unlink(missing_ok=True)
+                return {"ok": False}
+            os.replace(part, self.final_path(task))
+            task.status = "done"
+            task.worker = None
+            log.info(f"Segment {index} done by {worker}")
+            self.condition.notify_all()
+            return {"ok": True}
+
+    def serve(self) -> ThreadingHTTPServer:
+        coordinator = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                log.debug(f"{self.address_string()} {format % args}")
+
+            def send_json(self, data: dict, status: int = 200):
+                body = json.dumps(data).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def read_json(self) -> dict:
+                length = int(self.headers.get("Content-Length", 0))
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def do_GET(self):
+                if self.path == "/job":
+                    return self.send_json(coordinator.job)
+                name = unquote(self.path.removeprefix("/files/"))
+                path = coordinator.files.get(name)
+                if path is None or not path.exists():
+                    return self.send_json({"error": "not found"}, 404)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/octet-stream")
+                # 背景与遮罩是未压缩的原始像素，大部分为纯色，压缩后再传输
+                if (name in (BACKGROUND_FILE, ALPHA_FILE)
+                        and "gzip" in self.headers.get("Accept-Encoding", "")):
+                    self.send_header("Content-Encoding", "gzip")
+                    self.end_headers()
+                    with (path.open("rb") as f,
+                          gzip.GzipFile(fileobj=self.wfile, mode="wb", compresslevel=1) as out):
+                        shutil.copyfileobj(f, out, 1 << 20)
+                    return
+                self.send_header("Content-Length", str(path.stat().st_size))
+                self.end_headers()
+                with path.open("rb") as f:
+                    shutil.copyfileobj(f, self.wfile, 1 << 20)
+
+            def do_POST(self):
+                data = self.read_json()
+                if self.path == "/claim":
+                    return self.send_json(coordinator.claim(data["worker"]))
+                args = (data["worker"], data["index"], data["attempt"])
+                if self.path == "/heartbeat":
+                    return self.send_json(coordinator.heartbeat(*args, data.get("frames", 0)))
+                if self.path == "/fail":
+                    return self.send_json(coordinator.fail(*args, data.get("error", "")))
+                if self.path == "/complete":
+                    return self.send_json(coordinator.complete(*args))
+                self.send_json({"error": "not found"}, 404)
+
+            def do_PUT(self):
+                # /result/<index>/<attempt>/<worker>
+                parts = self.path.removeprefix("/").split("/", 3)
+                if len(parts) != 4 or parts[0] != "result":
+                    return self.send_json({"error": "not found"}, 404)
+                try:
+                    index, attempt = int(parts[1]), int(parts[2])
+                    length = int(self.headers["Content-Length"])
+                except (TypeError, ValueError):
+                    return self.send_json({"error": "bad request"}, 400)
+                if not 0 <= index < len(coordinator.tasks):
+                    return self.send_json({"error": "not found"}, 404)
+                # 工作端名称在路径中经过转义
+                worker = unquote(parts[3])
+                with coordinator.condition:
+                    task = coordinator.owned(worker, index, attempt)
+                    part = coordinator.part_path(task) if task is not None else None
+                if part is None:
+                    return self.send_json({"ok": False})
+                with part.open("wb") as f:
+                    while length > 0:
+                        chunk = self.rfile.read(min(length, 1 << 20))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        length -= len(chunk)
+                if length > 0:
+                    part.unlink(missing_ok=True)
+                    return self.send_json({"error": "incomplete upload"}, 400)
+                self.send_json(coordinator.complete(worker, index, attempt))
+
+        server = ThreadingHTTPServer((self.host, self.port), Handler)
+        server.daemon_threads = True
+        Thread(target=server.serve_forever, daemon=True).start()
+        log.info(f"Coordinator listening on http://{self.host}:{server.server_port}")
+        return server
+
+    def run(self):
+        with TemporaryDirectory(dir=self.work_dir) as temp_dir_str:
+            self.prepare(Path(temp_dir_str))
+            total_frame = int(VideoInfo(self.input_video).duration * self.job["fps"])
+            progress = Progress(SpinnerColumn(),
+                                TextColumn("[progress.description]{task.description}"),
+                                BarColumn(), MofNCompleteColumn(),
+                                TimeRemainingColumn(elapsed_when_finished=True))
+            server = self.serve()
+            try:
+                with progress:
+                    task_id = progress.add_task("Distributed Render", total=total_frame)
+                    with self.condition:
+                        while not self.finished():
+                            self.condition.wait(1)
+                            self.expire_leases()
+                            progress.update(task_id, completed=self.rendered_frames(total_frame))
+                    progress.update(task_id, completed=total_frame)
+            finally:
+                server.shutdown()
+                server.server_close()
+            if self.error is not None:
+                raise RuntimeError(self.error)
+
+            concat_videos([self.final_path(task) for task in self.tasks], self.output_video)
+            audio_copy(self.input_video, self.output_video)
+        log.info("Task Finish")
+
+
+class Worker:
+
+    def __init__(self,
+                 url: str,
+                 name: str | None = None,
+                 work_dir: str | PathLike | None = None,
+                 heartbeat: float = 5.,
+                 poll: float = 2.,
+                 decoder: str | None = None,
+                 use_cache: bool = True) -> None:
+        """
+        Args:
+            url (str): 协调端地址，如 http://127.0.0.1:8765
+            name (str | None, optional): 工作端名称，None 为 主机名-进程号. Defaults to None.
+            work_dir (str | PathLike | None, optional): 下载与渲染的临时文件位置，None 为系统临时目录. Defaults to None.
+            heartbeat (float, optional): 心跳间隔（秒），需明显小于协调端的 lease_timeout. Defaults to 5.
+            poll (float, optional): 没有任务时的轮询间隔（秒）. Defaults to 2.
+            decoder (str | None, optional): 任务未指定解码器时使用的解码器，None 为本机测试结果. Defaults to None.
+            use_cache (bool, optional): 使用缓存的硬件测试结果. Defaults to True.
+        """
+        self.url = url.rstrip("/")
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.work_dir = work_dir
+        self.heartbeat = heartbeat
+        self.poll = poll
+        self.decoder = decoder
+        self.use_cache = use_cache
+
+    def request(self, path: str, data: dict | None = None) -> dict:
+        body = json.dumps(data).encode("utf-8") if data is not None else None
+        req = urllib.request.Request(self.url + path,
+                                     data=body,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            return json.loads(resp.read())
+
+    def download(self, name: str, path: Path):
+        temp = path.with_name(path.name + ".part")
+        req = urllib.request.Request(f"{self.url}/files/{quote(name)}",
+                                     headers={"Accept-Encoding": "gzip"})
+        with urllib.request.urlopen(req, timeout=30) as resp, temp.open("wb") as f:
+            source = (gzip.GzipFile(fileobj=resp, mode="rb")
+                      if resp.headers.get("Content-Encoding") == "gzip" else resp)
+            shutil.copyfileobj(source, f, 1 << 20)
+        os.replace(temp, path)
+
+    def upload(self, claimed: dict, path: Path) -> dict:
+        with path.open("rb") as f:
+            req = urllib.request.Request(
+                f"{self.url}/result/{claimed['index']}/{claimed['attempt']}/{quote(self.name)}",
+                data=f,
+                method="PUT",
+                headers={"Content-Length": str(path.stat().st_size)})
+            with urllib.request.urlopen(req) as resp:
+                return json.loads(resp.read())
+
+    def job_files(self, job: dict, job_dir: Path) -> dict[str, Path]:
+        """共享模式直接使用协调端的路径，否则下载一次（输入视频较大，同一任务内复用）"""
+        if job["shared"]:
+            return {name: Path(path) for name, path in job["files"].items()}
+        files = {
+            "input": job_dir / f"input{job['input_suffix']}",
+            BACKGROUND_FILE: job_dir / BACKGROUND_FILE,
+            ALPHA_FILE: job_dir / ALPHA_FILE
+        }
+        for name, path in files.items():
+            if not path.exists():
+                log.info(f"Downloading {name}")
+                self.download(name, path)
+        return files
+
+    def render(self, job: dict, files: dict[str, Path], claimed: dict, job_dir: Path):
+        input_video_info = VideoInfo(files["input"])
+        paint_msg = cached_paint_msg(input_video_info.height, input_video_info.width,
+                                     job["height"], None, job["circle_crop"],
+                                     job["auto_crop"], job["display_all"])
+        decoder = job["decoder"] or self.decoder
+        if decoder is None:
+            _, decoders = FFMpegCapabilities.shared(
+                use_cache=self.use_cache).hw_codecs(input_video_info.codec)
+            decoder = decoders[0] if decoders else None
+
+        if job["shared"]:
+            cmd_path = files[claimed["cmd"]]
+            output = Path(claimed["output"])
+        else:
+            cmd_path = job_dir / claimed["cmd"]
+            self.download(claimed["cmd"], cmd_path)
+            output = job_dir / f"segment_{claimed['index']}{job['output_suffix']}"
+
+        rotaeno = Rotaeno(fps=job["fps"])
+        commands = rotaeno.generate_ffmpeg_cmd(
+            input_video=files["input"],
+            output_video=output,
+            background=files[BACKGROUND_FILE],
+            alpha=files[ALPHA_FILE],
+            input_video_info=input_video_info,
+            paint_msg=paint_msg,
+            sendcmd_path=cmd_path,
+            bitrate=job["bitrate"],
+            encoder=job["encoder"],
+            decoder=decoder,
+            mask_output=False,
+            segment=ExtractSegment(claimed["seek"], claimed["start"], claimed["end"]))
+
+        # 心跳与渲染、上传并行，直到结果交给协调端
+        frames = [0]
+        done = Event()
+        heartbeat_args = {
+            "worker": self.name,
+            "index": claimed["index"],
+            "attempt": claimed["attempt"]
+        }
+
+        def beat():
+            while not done.wait(self.heartbeat):
+                try:
+                    result = self.request("/heartbeat", {**heartbeat_args, "frames": frames[0]})
+                    if not result["ok"]:
+                        log.warning(f"Segment {claimed['index']} was reassigned")
+                except OSError as e:
+                    log.debug(f"Heartbeat failed: {e}")
+
+        beater = Thread(target=beat, daemon=True)
+        beater.start()
+        try:
+            for frames[0] in FFMpegProgress(commands).process():
+                pass
+            if job["shared"]:
+                result = self.request("/complete", heartbeat_args)
+            else:
+                result = self.upload(claimed, output)
+                output.unlink()
+            if not result["ok"]:
+                log.warning(f"Result of segment {claimed['index']} was discarded")
+        finally:
+            done.set()
+            beater.join()
+
+    def run(self, stop: Event | None = None, once: bool = False):
+        """持续领取分段，直到 stop 被设置；once 为 True 时一个任务结束后退出"""
+        stop = stop or Event()
+        job_dirs: dict[str, TemporaryDirectory] = {}
+        worked = False
+        log.info(f"Worker {self.name} -> {self.url}")
+        try:
+            while not stop.is_set():
+                try:
+                    job = self.request("/job")
+                    claimed = self.request("/claim", {"worker": self.name})
+                except (OSError, ValueError) as e:
+                    # 协调端尚未启动或已结束
+                    log.debug(f"Coordinator unavailable: {e}")
+                    if once and worked:
+                        break
+                    stop.wait(self.poll)
+                    continue
+
+                if "index" not in claimed:
+                    if claimed.get("finished") and once:
+                        break
+                    stop.wait(self.poll)
+                    continue
+
+                worked = True
+                if job["id"] not in job_dirs:
+                    for old in job_dirs.values():
+                        old.cleanup()
+                    job_dirs = {job["id"]: TemporaryDirectory(dir=self.work_dir)}
+                job_dir = Path(job_dirs[job["id"]].name)
+
+                log.info(f"Rendering segment {claimed['index']}")
+                try:
+                    self.render(job, self.job_files(job, job_dir), claimed, job_dir)
+                except Exception as e:
+                    log.exception(f"Segment {claimed['index']} failed")
+                    try:
+                        self.request("/fail", {
+                            "worker": self.name,
+                            "index": claimed["index"],
+                            "attempt": claimed["attempt"],
+                            "error": str(e)[-500:]
+                        })
+                    except OSError:
+                        pass
+        finally:
+            for job_dir in job_dirs.values():
+                job_dir.cleanup()
+
+
+def main():
+    dist_config = config_data["distributed"]
+    parser = argparse.ArgumentParser(description="Rotaeno distributed render")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    coordinator = subparsers.add_parser("coordinator", help="提取旋转并分发分段任务")
+    coordinator.add_argument("input_video")
+    coordinator.add_argument("output_video")
+    coordinator.add_argument("-bg", "--background", type=str, default=None, help="歌曲封面照片路径")
+    coordinator.add_argument("--host", default=dist_config["host"])
+    coordinator.add_argument("--port", type=int, default=dist_config["port"])
+    coordinator.add_argument("--segments", type=int, default=dist_config["segments"])
+    coordinator.add_argument("--shared",
+                             action=argparse.BooleanOptionalAction,
+                             default=dist_config["shared"],
+                             help="共享文件夹模式（工作端按相同路径直接读写文件）")
+
+    worker = subparsers.add_parser("worker", help="领取并渲染分段")
+    worker.add_argument("url", nargs="?", default=dist_config["url"])
+    worker.add_argument("--name", default=None)
+    worker.add_argument("--once", action="store_true", help="一个任务结束后退出")
+    args = parser.parse_args()
+
+    run_kwargs = run_kwargs_from_config()
+    try:
+        if args.command == "coordinator":
+            Coordinator(rotaeno_from_config(args.background),
+                        args.input_video,
+                        args.output_video,
+                        host=args.host,
+                        port=args.port,
+                        segments=args.segments,
+                        shared=args.shared,
+                        work_dir=dist_config["work_dir"] or None,
+                        lease_timeout=dist_config["lease_timeout"],
+                        encoder=run_kwargs["encoder"],
+                        decoder=run_kwargs["decoder"],
+                        bitrate=run_kwargs["bitrate"],
+                        use_cache=run_kwargs["use_cache"]).run()
+        else:
+            Worker(args.url,
+                   name=args.name,
+                   work_dir=(dist_config["work_dir"]
+                             or config_data["performance"]["scratch_dir"] or None),
+                   heartbeat=dist_config["heartbeat"],
+                   decoder=run_kwargs["decoder"],
+                   use_cache=run_kwargs["use_cache"]).run(once=args.once)
+    except KeyboardInterrupt:
+        log.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import logging
+import subprocess
+from contextlib import suppress
+from os import PathLike
+from queue import Queue
+from subprocess import DEVNULL, PIPE
+from threading import Thread
+from typing import Any, Generator
+
+import numpy as np
+from PIL import Image
+from rich.markup import escape
+
+from .background import PaintMsg
+from .ffmpeg import FFMpegError, VideoInfo, get_ffmpeg, tail_stderr
+from .rotation_calc import FRAME_SIZE, RotationCalc
+
+log = logging.getLogger("rich")
+
+
+class FrameRenderer:
+    """单次解码渲染引擎
+
+    ffmpeg 只解码一次：缩放裁切后的画面与四角取样拼在同一帧里（最后一行的前 4 个像素），
+    通过可复用的环形缓冲区读入 Python，逐帧计算角度、旋转并与背景合成，
+    再直接送入编码进程。
+    """
+
+    def __init__(self,
+                 rotation_calc: RotationCalc,
+                 paint_msg: PaintMsg,
+                 input_video_info: VideoInfo,
+                 fps: float,
+                 ring_size: int = 8) -> None:
+        self.rotation_calc = rotation_calc
+        self.paint_msg = paint_msg
+        self.input_video_info = input_video_info
+        self.fps = fps
+        self.ring_size = ring_size
+
+        self.width, self.height = paint_msg.video_crop
+        # 输入帧多出的一行用于存放四角取样
+        self.frame_bytes = self.width * (self.height + 1) * 3
+
+        # 静态素材只准备一次
+        side = self.width
+        self.offset = (0, (side - self.height) // 2)
+        self.square_alpha = Image.new("L", (side, side))
+        self.square_alpha.paste(paint_msg.image_alpha, self.offset)
+        self.background = paint_msg.background.convert("RGB")
+
+    def decode_cmd(self, input_video: str | PathLike, decoder: str | None = None) -> list:
+        commands = [get_ffmpeg(), "-loglevel", "error"]
+        if decoder is not None:
+            commands += ["-c:v", decoder]
+        commands += ["-i", input_video]
+
+        video_process = "[0:v]split=2[corner][video];"
+        video_process += self.rotation_calc.corner_filter("[corner]")
+        video_process += f",format=rgb24,pad={self.width}:1[rotation];[video]"
+        if self.paint_msg.video_resize != self.input_video_info.size:
+            video_process += ("scale="
+                              f"{self.paint_msg.video_resize[0]}:{self.paint_msg.video_resize[1]},")
+        if self.paint_msg.video_crop != self.paint_msg.video_resize:
+            video_process += f"crop={self.width}:{self.height},"
+        # fps 与提取时一样放在拼接之后，帧数与 ffmpeg 引擎提取的旋转数据一致
+        video_process += ("format=rgb24[frame];[frame][rotation]vstack=inputs=2,"
+                          f"fps={self.fps}[output]")
+
+        commands += [
+            "-filter_complex", video_process, "-map", "[output]", "-f", "rawvideo",
+            "-pix_fmt", "rgb24", "pipe:"
+        ]
+        return commands
+
+    def encode_cmd(self,
+                   input_video: str | PathLike,
+                   output: str | PathLike,
+                   size: tuple[int, int],
+                   pix_fmt: str,
+                   encoder: str | None = None,
+                   bitrate: str | None = None,
+                   audio: bool = True) -> list:
+        commands = [
+            get_ffmpeg(), "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", pix_fmt,
+            "-s", f"{size[0]}x{size[1]}", "-framerate",
+            str(self.fps), "-i", "pipe:"
+        ]
+        if audio:
+            commands += ["-i", input_video, "-map", "0:v", "-map", "1:a"]
+        if encoder is not None:
+            commands += ["-c:v", encoder]
+        if bitrate is not None:
+            commands += ["-b:v", bitrate]
+        if audio:
+            commands += ["-c:a", "copy"]
+        commands += [output, "-y"]
+        return commands
+
+    def read_frames(self, stream, ring: list[bytearray], free: Queue, ready: Queue):
+        """读取线程：将解码帧直接读入空闲的环形缓冲区"""
+        try:
+            while True:
+                index = free.get()
+                view = memoryview(ring[index])
+                filled = 0
+                while filled < self.frame_bytes:
+                    n = stream.readinto(view[filled:])
+                    if not n:
+                        break
+                    filled += n
+                if filled < self.frame_bytes:
+                    if filled:
+                        log.warning(f"Dropped incomplete trailing frame "
+                                    f"({filled}/{self.frame_bytes} bytes)")
+                    break
+                ready.put(index)
+        finally:
+            ready.put(None)
+
+    def compose(self, buffer: bytearray, rotate: float) -> tuple[bytes, Image.Image]:
+        """旋转并合成一帧，返回输出画面与旋转后的遮罩"""
+        frame = Image.frombuffer("RGB", (self.width, self.height), buffer, "raw", "RGB", 0,
+                                 1)
+        square = Image.new("RGBA", self.square_alpha.size)
+        square.paste(frame, self.offset)
+        square.putalpha(self.square_alpha)
+        # ffmpeg 的 rotate 正角度为顺时针，PIL 为逆时针
+        rotated = square.rotate(-rotate, resample=Image.Resampling.BILINEAR)
+        output = self.background.copy()
+        output.paste(rotated, (0, 0), rotated)
+        return output.tobytes(), rotated.getchannel("A")
+
+    def render(self,
+               input_video: str | PathLike,
+               output_video: str | PathLike | None = None,
+               output_mask: str | PathLike | None = None,
+               encoder: str | None = None,
+               decoder: str | None = None,
+               bitrate: str | None = None,
+               block_frames: int = 64) -> Generator[np.ndarray, Any, None]:
+        """渲染视频和/或遮罩，按块返回每帧的旋转角度"""
+        encoders: list[tuple[subprocess.Popen, Any]] = []
+        if output_video is not None:
+            commands = self.encode_cmd(input_video, output_video, self.paint_msg.output_size,
+                                       "rgb24", encoder, bitrate)
+            log.debug("Running Commands: [bold green]" +
+                      escape(" ".join(map(str, commands))),
+                      extra={"markup": True})
+            encoders.append(
+                (subprocess.Popen(commands, stdin=PIPE, stdout=DEVNULL,
+                                  stderr=PIPE), "video"))
+        if output_mask is not None:
+            commands = self.encode_cmd(input_video, output_mask, self.square_alpha.size,
+                                       "gray", encoder, bitrate, audio=False)
+            log.debug("Running Commands: [bold green]" +
+                      escape(" ".join(map(str, commands))),
+                      extra={"markup": True})
+            encoders.append(
+                (subprocess.Popen(commands, stdin=PIPE, stdout=DEVNULL,
+                                  stderr=PIPE), "mask"))
+
+        commands = self.decode_cmd(input_video, decoder)
+        log.debug("Running Commands: [bold green]" + escape(" ".join(map(str, commands))),
+                  extra={"markup": True})
+        decode = subprocess.Popen(commands, stdout=PIPE, stderr=PIPE, bufsize=0)
+        assert decode.stdout is not None
+        pipes = [decode] + [pipe for pipe, _ in encoders]
+        tails = [tail_stderr(pipe) for pipe in pipes]
+
+        ring = [bytearray(self.frame_bytes) for _ in range(self.ring_size)]
+        free: Queue[int] = Queue()
+        ready: Queue[int | None] = Queue()
+        for i in range(self.ring_size):
+            free.put(i)
+        reader = Thread(target=self.read_frames,
+                        args=(decode.stdout, ring, free, ready),
+                        daemon=True)
+        reader.start()
+
+        corner_start = self.width * self.height * 3
+        angles = []
+        killed = broken = False
+        try:
+            while (index := ready.get()) is not None:
+                buffer = ring[index]
+                corners = np.frombuffer(buffer, dtype=np.uint8, count=FRAME_SIZE,
+                                        offset=corner_start).reshape(1, FRAME_SIZE)
+                rotate = float(self.rotation_calc.batch_method(corners)[0])
+                output, mask = self.compose(buffer, rotate)
+                free.put(index)
+
+                try:
+                    for pipe, kind in encoders:
+                        assert pipe.stdin is not None
+                        pipe.stdin.write(output if kind == "video" else mask.tobytes())
+                except BrokenPipeError:
+                    # 编码进程已退出，错误信息在下方按其 stderr 报告
+                    broken = True
+                    break
+                angles.append(rotate)
+                if len(angles) >= block_frames:
+                    yield np.array(angles)
+                    angles = []
+            else:
+                if angles:
+                    yield np.array(angles)
+        finally:
+            # 先结束解码进程并唤醒读取线程，关闭已退出的编码进程的管道时可能出错
+            if decode.poll() is None:
+                decode.kill()
+                killed = True
+            free.put(0)
+            decode.wait()
+            for pipe, _ in encoders:
+                assert pipe.stdin is not None
+                with suppress(BrokenPipeError, OSError):
+                    pipe.stdin.close()
+            for pipe in pipes:
+                pipe.wait()
+            for _, stderr_reader in tails:
+                stderr_reader.join()
+
+        # 编码进程的错误优先报告：它退出后解码进程是被这里结束的
+        for pipe, (stderr, _) in reversed(list(zip(pipes, tails))):
+            if pipe.returncode != 0 and not (pipe is decode and killed):
+                raise FFMpegError(f"Error running command {pipe.args}: " +
+                                  b"".join(stderr).decode("utf-8", errors="replace"))
+        if broken:
+            raise FFMpegError("Encoder closed its input before all frames were written")
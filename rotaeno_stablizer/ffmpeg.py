@@ -2,15 +2,22 @@ import itertools
 import json
 import logging
 import re
+import os
 import subprocess
-import uuid
+import tempfile
+from collections import deque
 from contextlib import contextmanager
 from dataclasses import InitVar, dataclass, field
+from fractions import Fraction
 from multiprocessing.pool import ThreadPool
 from os import PathLike
 from pathlib import Path
 from shutil import which
 from subprocess import PIPE, STDOUT
+from threading import Event, Thread
+from typing import Any, Generator, Iterable
+
+from .cache import DiskCache, file_identity
 
 log = logging.getLogger("rich")
 
@@ -53,75 +60,292 @@ def get_ffprobe():
     return "ffprobe"
 
 
+def tail_stderr(pipe: subprocess.Popen, lines: int = 20) -> tuple[deque[bytes], Thread]:
+    """在后台线程中持续读取进程的 stderr，只保留最后几行，避免管道写满导致进程阻塞"""
+    assert pipe.stderr is not None
+    tail: deque[bytes] = deque(maxlen=lines)
+    reader = Thread(target=tail.extend, args=(pipe.stderr,), daemon=True)
+    reader.start()
+    return tail, reader
+
+
 def audio_copy(audio_from: str | PathLike, audio_to: str | PathLike):
+    """将 audio_from 的音频流复制进 audio_to（只有视频流），均不重新编码"""
     audio_from = Path(audio_from)
     audio_to = Path(audio_to)
     audio_temp = audio_to.with_stem(audio_to.stem + "_video")
     audio_to.rename(audio_temp)
-    stderr = None
+    proc = subprocess.run([
+        get_ffmpeg(), "-y", "-i", audio_temp, "-i", audio_from, "-map", "0:v", "-map",
+        "1:a?", "-c", "copy", audio_to
+    ],
+                          stdout=PIPE,
+                          stderr=PIPE)
+    if proc.returncode != 0:
+        # 好不容易出来的视频，炸了就先别删
+        raise FFMpegError(f"Error copying audio, video is kept in {audio_temp}: " +
+                          proc.stderr.decode("utf-8", errors="replace"))
+
+    audio_temp.unlink()
+
+
+def raw_image_input(path: str | PathLike, size: tuple[int, int], pix_fmt: str) -> list:
+    """以未压缩的单帧图片作为输入，省去 PNG 的压缩与解码"""
+    return ["-f", "rawvideo", "-pix_fmt", pix_fmt, "-s", f"{size[0]}x{size[1]}", "-i", path]
+
+
+def concat_videos(inputs: list[Path], output: str | PathLike):
+    """用 concat 分离器无损拼接编码参数相同的视频"""
+    list_path = Path(inputs[0]).with_name("concat.txt")
+    # concat 列表中的单引号需要转义为 '\''
+    list_path.write_text("".join(
+        "file '" + str(Path(p).absolute()).replace("'", "'\\''") + "'\n" for p in inputs),
+                         encoding="utf-8")
     try:
-        pipe = subprocess.Popen([
-            get_ffmpeg(), "-y", "-i", audio_from, "-i", audio_temp, "-map", "0:a",
-            "-map", "1:v", "-c", "copy", audio_to
+        proc = subprocess.run([
+            get_ffmpeg(), "-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy",
+            output
         ],
-                                stderr=PIPE)
-        _, stderr = pipe.communicate()
-    except Exception as e:
-        if stderr is None:
-            raise e
-        raise OSError(stderr) from e
-
-    # 不用 finally，好不容易出来的视频，炸了就先别删
-    audio_temp.unlink()
+                              stdout=PIPE,
+                              stderr=PIPE)
+    finally:
+        list_path.unlink(missing_ok=True)
+    if proc.returncode != 0:
+        raise FFMpegError("Error concatenating segments: " +
+                          proc.stderr.decode("utf-8", errors="replace"))
+
+
+# 进程内的关键帧扫描结果缓存，键为文件身份（路径、大小、修改时间）
+keyframe_memo: dict[tuple, tuple[list[float], float]] = {}
+
+
+def get_keyframes(video_path: str | PathLike,
+                  cache_root: str | PathLike | None = None,
+                  disk_cache: bool = False) -> tuple[list[float], float]:
+    """扫描视频流的数据包（不解码），返回关键帧时间以及最后一个数据包的时间
+
+    与 probe_video 相同，结果在进程内按文件身份缓存，disk_cache 为 True 时同时写入磁盘缓存。
+    """
+    identity = file_identity(video_path)
+    memo_key = (identity["path"], identity["size"], identity["mtime"])
+    if memo_key in keyframe_memo:
+        return keyframe_memo[memo_key]
+
+    cache = DiskCache("probe", 16 << 20, cache_root) if disk_cache else None
+    cache_key = DiskCache.make_key(identity, "keyframes")
+    if cache is not None and (path := cache.get(cache_key, ".json")):
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+            keyframe_memo[memo_key] = (data["keyframes"], data["last"])
+            return keyframe_memo[memo_key]
+        except (OSError, ValueError, KeyError):
+            log.debug(f"Broken keyframe cache: {path}")
+
+    commands = [
+        get_ffprobe(), "-v", "error", "-select_streams", "v:0", "-show_entries",
+        "packet=pts_time,flags", "-of", "csv=p=0", video_path
+    ]
+    proc = subprocess.run(commands, stdout=PIPE, stderr=PIPE)
+    if proc.returncode != 0:
+        raise FFMpegError(proc.stderr.decode("utf-8", errors="replace"))
+
+    keyframes = []
+    last = 0.
+    for line in proc.stdout.decode("utf-8", errors="replace").splitlines():
+        pts_time, _, flags = line.partition(",")
+        try:
+            pts = float(pts_time)
+        except ValueError:
+            continue
+        last = max(last, pts)
+        if "K" in flags:
+            keyframes.append(pts)
+    keyframes.sort()
+
+    keyframe_memo[memo_key] = (keyframes, last)
+    if cache is not None:
+        with cache.put(cache_key, ".json") as temp:
+            temp.write_text(json.dumps({"keyframes": keyframes, "last": last}),
+                            encoding="utf-8")
+    return keyframes, last
+
+
+# 进程内的探测结果缓存，键为文件身份（路径、大小、修改时间）
+probe_memo: dict[tuple, dict] = {}
+
+
+def parse_rate(rate: str | None) -> float | None:
+    """解析 ffprobe 的 "30000/1001" 形式帧率，无效时返回 None"""
+    try:
+        value = Fraction(rate) if rate else None
+    except (ValueError, ZeroDivisionError):
+        return None
+    return float(value) if value else None
+
+
+def probe_video(video_path: str | PathLike,
+                count_frames: bool = False,
+                cache_root: str | PathLike | None = None,
+                disk_cache: bool = False) -> dict:
+    """只读取第一个视频流所需的字段
+
+    count_frames 为 True 时通过统计数据包（不解码）得到准确帧数。
+    结果在进程内按文件身份缓存，disk_cache 为 True 时同时写入磁盘缓存。
+    """
+    identity = file_identity(video_path)
+    memo_key = (identity["path"], identity["size"], identity["mtime"], count_frames)
+    if memo_key in probe_memo:
+        return probe_memo[memo_key]
+
+    cache = DiskCache("probe", 16 << 20, cache_root) if disk_cache else None
+    cache_key = DiskCache.make_key(identity, count_frames)
+    if cache is not None and (path := cache.get(cache_key, ".json")):
+        try:
+            info = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            info = None
+        if info is not None:
+            probe_memo[memo_key] = info
+            return info
+
+    entries = ("stream=codec_name,width,height,nb_frames,duration,r_frame_rate,"
+               "avg_frame_rate")
+    commands = [get_ffprobe(), "-v", "error", "-select_streams", "v:0"]
+    if count_frames:
+        commands += ["-count_packets"]
+        entries += ",nb_read_packets"
+    commands += [
+        "-show_entries", entries + ":stream_side_data=rotation:format=duration", "-of",
+        "json", video_path
+    ]
+    proc = subprocess.run(commands, stdout=PIPE, stderr=PIPE)
+    if proc.returncode != 0:
+        raise FFMpegError(proc.stderr.decode("utf-8", errors="replace"))
+    result = json.loads(proc.stdout)
+    if not result.get("streams"):
+        raise ValueError("Cannot found video infomation in Stream.")
+    stream = result["streams"][0]
+
+    def number(value, kind):
+        return kind(value) if value not in (None, "N/A") else None
+
+    stream_duration = number(stream.get("duration"), float)
+    duration = stream_duration or number(result.get("format", {}).get("duration"), float)
+    nb_frames = number(stream.get("nb_frames"), int)
+    frames = number(stream.get("nb_read_packets"), int) or nb_frames
+
+    # 视频流记录了帧数与时长时沿用 nb_frames / duration，
+    # 否则（MKV、TS、分片 MP4 等）回退到 avg_frame_rate / r_frame_rate
+    if nb_frames and stream_duration:
+        fps = nb_frames / stream_duration
+    else:
+        fps = parse_rate(stream.get("avg_frame_rate")) or parse_rate(
+            stream.get("r_frame_rate"))
+    if fps is None:
+        raise ValueError(f"Cannot detect frame rate of {video_path}")
+    if duration is None:
+        if frames is None:
+            raise ValueError(f"Cannot detect duration of {video_path}")
+        duration = frames / fps
+
+    rotation = next((side_data["rotation"] for side_data in stream.get("side_data_list", [])
+                     if "rotation" in side_data), 0)
+    info = {
+        "fps": fps,
+        "width": stream["width"],
+        "height": stream["height"],
+        "duration": duration,
+        "frames": frames,
+        "codec": stream["codec_name"],
+        "rotation": rotation
+    }
+
+    probe_memo[memo_key] = info
+    if cache is not None:
+        with cache.put(cache_key, ".json") as temp:
+            temp.write_text(json.dumps(info), encoding="utf-8")
+    return info
 
 
 @dataclass
 class VideoInfo:
     video_path_m: InitVar[str | PathLike]
+    count_frames: InitVar[bool] = False
+    cache_root: InitVar[str | PathLike | None] = None
+    disk_cache: InitVar[bool] = False
     video_path: Path = field(init=False)
     fps: float = field(init=False)
     height: int = field(init=False)
     width: int = field(init=False)
     duration: float = field(init=False)
+    frames: int | None = field(init=False)
     codec: str = field(init=False)
     size: tuple[int, int] = field(init=False)
 
-    def __post_init__(self, video_path_m):
+    def __post_init__(self, video_path_m, count_frames, cache_root, disk_cache):
         self.video_path = Path(video_path_m)
-        commands = [
-            get_ffprobe(), "-v", "quiet", "-print_format", "json", "-show_streams",
-            self.video_path
-        ]
-        pipe = subprocess.Popen(commands, stdout=PIPE, stderr=PIPE)
-        info = json.loads(pipe.communicate()[0])
-        try:
-            video_info = next(stream for stream in info["streams"]
-                              if stream["codec_type"] == "video")
-        except StopIteration:
-            raise ValueError("Cannot found video infomation in Stream.")
-
-        video_fps = float(video_info["nb_frames"]) / float(video_info["duration"])
-        height, width = video_info["height"], video_info["width"]
-        codec_name = video_info["codec_name"]
-        if ("side_data_list" in video_info
-                and video_info["side_data_list"][0]["rotation"] % 360 in [90, 270]):
+        info = probe_video(self.video_path, count_frames, cache_root, disk_cache)
+
+        height, width = info["height"], info["width"]
+        if info["rotation"] % 360 in [90, 270]:
             height, width = width, height
-        duration = float(video_info["duration"])
 
-        self.fps = video_fps
+        self.fps = info["fps"]
         self.height = height
         self.width = width
-        self.duration = duration
-        self.codec = codec_name
+        self.duration = info["duration"]
+        self.frames = info["frames"]
+        self.codec = info["codec"]
         self.size = (width, height)
 
 
+@dataclass
+class FFMpegProgressEvent:
+    """ffmpeg -progress 输出的一个统计块"""
+    frame: int = 0
+    fps: float | None = None
+    bitrate: float | None = None  # kbit/s
+    total_size: int | None = None  # 字节
+    out_time_us: int | None = None
+    dup_frames: int = 0
+    drop_frames: int = 0
+    speed: float | None = None
+    finished: bool = False
+
+    @classmethod
+    def from_block(cls, block: dict[str, str]) -> "FFMpegProgressEvent":
+
+        def number(key, kind, suffix=""):
+            value = block.get(key, "").strip().removesuffix(suffix)
+            try:
+                return kind(value)
+            except ValueError:
+                return None
+
+        return cls(frame=number("frame", int) or 0,
+                   fps=number("fps", float),
+                   bitrate=number("bitrate", float, "kbits/s"),
+                   total_size=number("total_size", int),
+                   out_time_us=number("out_time_us", int),
+                   dup_frames=number("dup_frames", int) or 0,
+                   drop_frames=number("drop_frames", int) or 0,
+                   speed=number("speed", float, "x"),
+                   finished=block.get("progress") == "end")
+
+
 class FFMpegProgress:
 
-    def __init__(self, cmd: list) -> None:
+    def __init__(self, cmd: list, log_lines: int = 50) -> None:
+        """
+        Args:
+            cmd (list): ffmpeg 命令
+            log_lines (int, optional): 出错时报告的最后几行输出. Defaults to 50.
+        """
         self.cmd = cmd
+        self.log_lines = log_lines
 
-    def process(self):
+    def events(self) -> Generator[FFMpegProgressEvent, Any, None]:
+        """运行命令，每收到一个完整的进度块就返回一个事件，内存占用与渲染时长无关"""
         commands = self.cmd[0:1] + [
             "-progress", "-", "-nostats", "-stats_period", "0.1"
         ] + self.cmd[1:]
@@ -131,26 +355,50 @@ class FFMpegProgress:
                                 stderr=STDOUT,
                                 universal_newlines=False)
 
-        stderr = ""
-        while True:
-            assert pipe.stdout is not None
-
-            line = (pipe.stdout.readline().decode("utf-8", errors="replace").strip())
-            stderr += line
-            if line == "" and pipe.poll() is not None:
-                break
-
-            if line.startswith("frame=") and line[6:].isdigit():
-                yield int(line[6:])
+        tail: deque[str] = deque(maxlen=self.log_lines)
+        block: dict[str, str] = {}
+        assert pipe.stdout is not None
+        for raw in pipe.stdout:
+            line = raw.decode("utf-8", errors="replace").strip()
+            key, sep, value = line.partition("=")
+            if not sep or " " in key:
+                tail.append(line)
+                continue
+            block[key] = value
+            # 每个进度块以 progress=continue/end 结尾
+            if key == "progress":
+                yield FFMpegProgressEvent.from_block(block)
+                block = {}
+        pipe.wait()
 
         if pipe.returncode != 0:
-            raise RuntimeError(f"Error running command {self.cmd}: {stderr}")
+            raise RuntimeError(f"Error running command {self.cmd}: " + "\n".join(tail))
+
+    def process(self):
+        """只返回已处理的帧数"""
+        for event in self.events():
+            yield event.frame
 
 
 class FFMpegHWTest:
 
-    def __init__(self) -> None:
-        ...
+    def __init__(self, timeout: float | None = 10) -> None:
+        """
+        Args:
+            timeout (float | None, optional): 单个编解码器测试的超时时间（秒），超时视为不可用. Defaults to 10.
+        """
+        self.timeout = timeout
+        # 有测试超时的结果可能只是机器繁忙，不应长期缓存
+        self.timed_out = False
+
+    def run_test(self, commands: list) -> bool:
+        try:
+            proc = subprocess.run(commands, stdout=PIPE, stderr=PIPE, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            log.debug(f"Codec test timeout: {commands}")
+            self.timed_out = True
+            return False
+        return not proc.returncode
 
     def get_available_codecs(self, codec: str) -> tuple[list[str], list[str]]:
         commands = [get_ffmpeg(), "-codecs"]
@@ -172,33 +420,33 @@ class FFMpegHWTest:
         return encoders, decoders
 
     @contextmanager
-    def generate_decoder_video(self, encoder):
-        filename = Path(f"temp_{uuid.uuid4()}.mp4")
+    def generate_decoder_video(self, encoder) -> Generator[Path | None, Any, None]:
+        """用 encoder 在临时目录生成一帧的测试视频，编码失败或超时时返回 None"""
+        fd, name = tempfile.mkstemp(prefix="rotaeno_codec_", suffix=".mp4")
+        os.close(fd)
+        filename = Path(name)
         commands = [
             get_ffmpeg(), "-f", "lavfi", "-i", "nullsrc", "-c:v", encoder, "-frames:v",
             "1", filename, "-y"
         ]
-        subprocess.run(commands, stdout=PIPE, stderr=PIPE)
-        yield filename
-        filename.unlink()
+        try:
+            yield filename if self.run_test(commands) else None
+        finally:
+            filename.unlink(missing_ok=True)
 
     def test_encoder(self, encoder: str):
         commands = [
             get_ffmpeg(), "-f", "lavfi", "-i", "nullsrc", "-c:v", encoder, "-frames:v",
             "1", "-f", "null", "-"
         ]
-        proc = subprocess.run(commands, stdout=PIPE, stderr=PIPE)
-
-        return not proc.returncode
+        return self.run_test(commands)
 
     def test_decoder(self, decoder: str, path):
         commands = [
             get_ffmpeg(), "-c:v", decoder, "-i", path, "-frames:v", "1", "-f", "null",
             "-"
         ]
-        proc = subprocess.run(commands, stdout=PIPE, stderr=PIPE)
-
-        return not proc.returncode
+        return self.run_test(commands)
 
     def test_encoders(self, encoders: list[str]):
         with ThreadPool() as pool:
@@ -211,6 +459,8 @@ class FFMpegHWTest:
     def test_decoders(self, decoders: list[str], source_encoder: str):
         with (self.generate_decoder_video(source_encoder) as file, ThreadPool() as
               pool):
+            if file is None:
+                return []
             available_decoders = [
                 decoder for decoder, available in zip(
                     decoders,
@@ -219,6 +469,53 @@ class FFMpegHWTest:
             ]
         return available_decoders
 
+    def iter_tests(self,
+                   encoders: list[str],
+                   decoders: list[str],
+                   cancel: Event | None = None) -> Generator[tuple[str, str, bool], Any, None]:
+        """按完成顺序逐个返回测试结果 (编解码器, "encoder"/"decoder", 是否可用)
+
+        cancel 被设置后不再启动新的测试，也不再返回结果。
+        """
+        cancel = cancel or Event()
+
+        def test(func, coder, *args):
+            return coder, not cancel.is_set() and func(coder, *args)
+
+        available_encoders = set()
+        with ThreadPool() as pool:
+            for encoder, available in pool.imap_unordered(
+                    lambda e: test(self.test_encoder, e), encoders):
+                if cancel.is_set():
+                    return
+                if available:
+                    available_encoders.add(encoder)
+                yield encoder, "encoder", available
+        # 按原顺序选取生成测试视频的编码器，不依赖测试完成的先后
+        available_encoder = next((e for e in encoders if e in available_encoders), None)
+        if available_encoder is None:
+            return
+
+        with (self.generate_decoder_video(available_encoder) as file, ThreadPool() as pool):
+            if file is None:
+                log.debug(f"Cannot generate decoder test video with {available_encoder}")
+                return
+            for decoder, available in pool.imap_unordered(
+                    lambda d: test(self.test_decoder, d, file), decoders):
+                if cancel.is_set():
+                    return
+                yield decoder, "decoder", available
+
+    def collect(self, encoders: list[str], decoders: list[str],
+                results: Iterable[tuple[str, str, bool]]) -> tuple[list[str], list[str]]:
+        """将测试结果整理为按原顺序、硬件优先排序的可用编码器与解码器"""
+        available = {(coder, kind) for coder, kind, ok in results if ok}
+        available_encoders = [e for e in encoders if (e, "encoder") in available]
+        available_decoders = [d for d in decoders if (d, "decoder") in available]
+        self.priority_sort(available_encoders)
+        self.priority_sort(available_decoders)
+        return available_encoders, available_decoders
+
     def priority_sort(self, coders: list):
         priority = {"_cuvid": 4, "_nvenc": 4, "_qsv": 3, "_vaapi": 2}
 
@@ -232,12 +529,141 @@ class FFMpegHWTest:
 
     def run(self, codec: str):
         encoders, decoders = self.get_available_codecs(codec)
+        return self.collect(encoders, decoders, self.iter_tests(encoders, decoders))
 
-        available_encoders = self.test_encoders(encoders)
-        available_decoders = self.test_decoders(decoders, available_encoders[0])
-        self.priority_sort(available_encoders)
-        self.priority_sort(available_decoders)
-        return available_encoders, available_decoders
+
+class FFMpegCapabilities:
+    """ffmpeg 能力探测结果：版本、所需滤镜以及各编码格式可用的编解码器
+
+    结果缓存在磁盘上，以 ffmpeg 程序的路径、修改时间和版本为键，更换 ffmpeg 后自动失效。
+    编解码器探测结果为空或有测试超时时不写入缓存，下次重新探测。
+    """
+
+    required_filters = ("rotate", "sendcmd", "alphamerge")
+    instances: dict[tuple, "FFMpegCapabilities"] = {}
+
+    def __init__(self,
+                 cache_root: str | PathLike | None = None,
+                 use_cache: bool = True) -> None:
+        self.ffmpeg = get_ffmpeg()
+        self.cache = DiskCache("ffmpeg", 1 << 20, cache_root) if use_cache else None
+        self.version = self.get_version()
+        self.key = DiskCache.make_key(*self.binary_identity(), self.version)
+        self.data = self.load()
+
+    @staticmethod
+    def binary_identity() -> tuple[str, int | None]:
+        binary = Path(which(get_ffmpeg()) or get_ffmpeg()).resolve()
+        try:
+            mtime = binary.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        return str(binary), mtime
+
+    @classmethod
+    def shared(cls,
+               cache_root: str | PathLike | None = None,
+               use_cache: bool = True) -> "FFMpegCapabilities":
+        """进程内复用的实例，长时间运行时不必每个任务都重新读取；ffmpeg 程序变化后重新创建"""
+        key = (str(cache_root), use_cache, *cls.binary_identity())
+        if key not in cls.instances:
+            cls.instances[key] = cls(cache_root, use_cache)
+        return cls.instances[key]
+
+    def get_version(self) -> str:
+        proc = subprocess.run([self.ffmpeg, "-version"], stdout=PIPE, stderr=PIPE)
+        if proc.returncode != 0:
+            raise FFMpegError(proc.stderr.decode("utf-8", errors="replace"))
+        return proc.stdout.decode("utf-8", errors="replace").partition("\n")[0]
+
+    def get_filters(self) -> dict[str, bool]:
+        proc = subprocess.run([self.ffmpeg, "-hide_banner", "-filters"],
+                              stdout=PIPE,
+                              stderr=PIPE)
+        names = set()
+        for line in proc.stdout.decode("utf-8", errors="replace").splitlines():
+            parts = line.split()
+            if len(parts) >= 3 and "->" in parts[2]:
+                names.add(parts[1])
+        return {name: name in names for name in self.required_filters}
+
+    def load(self) -> dict:
+        if self.cache is not None and (path := self.cache.get(self.key, ".json")):
+            try:
+                return json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                log.debug(f"Broken ffmpeg capability cache: {path}")
+        return self.probe()
+
+    def probe(self) -> dict:
+        log.debug(f"Probing ffmpeg capabilities: {self.version}")
+        data = {
+            "version": self.version,
+            "filters": self.get_filters(),
+            "codecs": {}
+        }
+        missing = [name for name, available in data["filters"].items() if not available]
+        if missing:
+            log.warning(f"ffmpeg is missing filters: {', '.join(missing)}")
+        self.data = data
+        self.save()
+        return data
+
+    def save(self):
+        if self.cache is None:
+            return
+        with self.cache.put(self.key, ".json") as temp:
+            temp.write_text(json.dumps(self.data), encoding="utf-8")
+
+    def refresh(self):
+        """丢弃缓存，重新探测全部能力"""
+        self.probe()
+
+    def store_codecs(self, codec: str, hw_test: FFMpegHWTest, encoders: list[str],
+                     decoders: list[str]):
+        """只缓存可靠的探测结果：编码器与解码器均非空，且没有测试超时"""
+        if not encoders or not decoders or hw_test.timed_out:
+            log.debug(f"Skip caching hardware codecs for {codec}: "
+                      f"{len(encoders)} encoders, {len(decoders)} decoders, "
+                      f"timed out: {hw_test.timed_out}")
+            return
+        self.data["codecs"][codec] = (encoders, decoders)
+        self.save()
+
+    def hw_codecs(self, codec: str) -> tuple[list[str], list[str]]:
+        """返回该编码格式可用的编码器与解码器（已按硬件优先排序）"""
+        if codec in self.data["codecs"]:
+            log.debug(f"Use cached hardware codecs for {codec}")
+            encoders, decoders = self.data["codecs"][codec]
+            return list(encoders), list(decoders)
+        hw_test = FFMpegHWTest()
+        encoders, decoders = hw_test.run(codec)
+        self.store_codecs(codec, hw_test, encoders, decoders)
+        return list(encoders), list(decoders)
+
+    def iter_hw_codecs(self,
+                       codec: str,
+                       cancel: Event | None = None,
+                       timeout: float | None = 10) -> Generator[tuple[str, str], Any, None]:
+        """逐个返回可用的 (编解码器, "encoder"/"decoder")，未缓存时每项测试完成即返回
+
+        探测完整结束（未被取消）后才写入缓存。
+        """
+        if codec in self.data["codecs"]:
+            encoders, decoders = self.data["codecs"][codec]
+            yield from ((encoder, "encoder") for encoder in encoders)
+            yield from ((decoder, "decoder") for decoder in decoders)
+            return
+
+        hw_test = FFMpegHWTest(timeout)
+        encoders, decoders = hw_test.get_available_codecs(codec)
+        results = []
+        for coder, kind, available in hw_test.iter_tests(encoders, decoders, cancel):
+            results.append((coder, kind, available))
+            if available:
+                yield coder, kind
+        if cancel is None or not cancel.is_set():
+            self.store_codecs(codec, hw_test, *hw_test.collect(encoders, decoders, results))
 
 
 if __name__ == "__main__":
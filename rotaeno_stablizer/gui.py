@@ -1,7 +1,9 @@
 from functools import wraps
 from importlib import resources
 from pathlib import Path
+from queue import Empty, Queue
 import sys
+from threading import Event, Thread
 from tkinter.filedialog import askopenfilename
 from typing import Callable
 from webbrowser import open as webopen
@@ -35,7 +37,7 @@ except ImportError as e:
 
 from . import Rotaeno
 from .config import config_data
-from .ffmpeg import FFMpegHWTest
+from .ffmpeg import FFMpegCapabilities
 
 video_type = [("Video", ".mp4 .m4v .avi .mov .flv .mkv"), ("mp4 video", ".mp4 .m4v"),
               ('avi', '.avi'), ("Mov video", ".mov"),
@@ -363,20 +365,47 @@ class HWTestFrame(CTkFrame):
                               values=[["Codec", "Type"]])
         self.table.pack(fill="both")
         table_frame.grid(row=1, columnspan=3)
+        self.probe_cancel: Event | None = None
 
     def update_table(self, entry_event=None) -> None:
-        codec = self.codec.get()
+        # 取消仍在进行的探测，新的探测在后台线程中运行，界面保持可用
+        if self.probe_cancel is not None:
+            self.probe_cancel.set()
+        cancel = self.probe_cancel = Event()
+        results: Queue = Queue()
+        self.table.delete_rows(range(1, self.table.rows))
+        Thread(target=self.probe, args=(self.codec.get(), cancel, results),
+               daemon=True).start()
+        self.after(50, self.poll_probe, cancel, results)
+
+    def probe(self, codec: str, cancel: Event, results: Queue) -> None:
+        """后台线程：每完成一项测试就放入队列"""
         try:
-            encoders, decoders = FFMpegHWTest().run(codec)
+            capabilities = FFMpegCapabilities(config_data["performance"]["cache_dir"] or None,
+                                              config_data["performance"]["cache"])
+            for coder, kind in capabilities.iter_hw_codecs(codec, cancel):
+                results.put([coder, kind.capitalize()])
         except Exception as e:
-            CTkMessagebox(title="Error", message=str(e), icon="cancel")
-            return
-        self.table.delete_rows(range(1, self.table.rows))
+            results.put(e)
+        finally:
+            results.put(None)
 
-        for i in encoders:
-            self.table.add_row([i, "Encoder"])
-        for i in decoders:
-            self.table.add_row([i, "Decoder"])
+    def poll_probe(self, cancel: Event, results: Queue) -> None:
+        """主线程：将已完成的测试结果加入表格"""
+        if cancel.is_set():
+            return
+        while True:
+            try:
+                item = results.get_nowait()
+            except Empty:
+                break
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                CTkMessagebox(title="Error", message=str(item), icon="cancel")
+                return
+            self.table.add_row(item)
+        self.after(50, self.poll_probe, cancel, results)
 
 
 class AboutWindow(CTkToplevel):
@@ -533,7 +562,17 @@ def main(args):
                       display_all=display_all,
                       background=background if background else None,
                       height=height,
-                      fps=fps if fps else None)
+                      fps=fps if fps else None,
+                      extract_segments=config_data["performance"]["extract_segments"],
+                      cache_dir=config_data["performance"]["cache_dir"] or None,
+                      rotation_cache_size=config_data["performance"]["rotation_cache_size"],
+                      asset_cache_size=config_data["performance"]["asset_cache_size"],
+                      scratch_dir=config_data["performance"]["scratch_dir"] or None,
+                      cache_content_hash=config_data["performance"]["cache_content_hash"],
+                      cmd_tolerance=config_data["performance"]["cmd_tolerance"],
+                      engine=config_data["performance"]["engine"],
+                      extract_profile=config_data["performance"]["extract_profile"],
+                      render_segments=config_data["performance"]["render_segments"])
 
     input_video = Path(input_video)
     rotaeno.run(input_video=input_video,
@@ -544,6 +583,7 @@ def main(args):
                 ensure_rewrite=True,
                 output_mask=output_mask,
                 output_cmd=output_cmd,
+                use_cache=config_data["performance"]["cache"],
             )
 
 
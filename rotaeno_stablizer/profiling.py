@@ -0,0 +1,138 @@
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from os import PathLike
+from pathlib import Path
+from typing import Any, Generator
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+log = logging.getLogger("rich")
+
+# ru_maxrss 在 macOS 上以字节为单位，其余平台为 KB
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+@dataclass
+class StageRecord:
+    name: str
+    wall: float = 0.
+    cpu: float = 0.  # 本进程 CPU 时间（秒）
+    children_cpu: float | None = None  # 已结束的 ffmpeg 子进程 CPU 时间（秒）
+    peak_rss: int | None = None  # 截至阶段结束时本进程的峰值内存（字节）
+    children_peak_rss: int | None = None  # 截至阶段结束时子进程的峰值内存（字节）
+    frames: int | None = None
+
+    @property
+    def fps(self) -> float | None:
+        if not self.frames or not self.wall:
+            return None
+        return self.frames / self.wall
+
+
+def usage() -> tuple[float | None, int | None, int | None]:
+    """返回 (子进程 CPU 时间, 本进程峰值内存, 子进程峰值内存)，不支持的平台为 None"""
+    if resource is None:
+        return None, None, None
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (children.ru_utime + children.ru_stime, self_usage.ru_maxrss * RSS_UNIT,
+            children.ru_maxrss * RSS_UNIT)
+
+
+class StageProfiler:
+    """按阶段记录耗时与资源占用，未启用时不做任何事"""
+
+    def __init__(self, enabled: bool = False, capture: str | None = None) -> None:
+        """
+        Args:
+            enabled (bool, optional): 是否启用. Defaults to False.
+            capture (str | None, optional): 额外采集 Python 热点，"cprofile" 或 "viztracer". Defaults to None.
+        """
+        if capture not in [None, "cprofile", "viztracer"]:
+            raise ValueError(f"Unsupport profile capture: {capture}")
+        self.enabled = enabled
+        self.capture = capture
+        self.records: list[StageRecord] = []
+
+    def reset(self):
+        self.records = []
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[StageRecord, Any, None]:
+        """记录一个阶段，调用方可在阶段内设置 record.frames"""
+        record = StageRecord(name)
+        if not self.enabled:
+            yield record
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        children_cpu, _, _ = usage()
+        try:
+            yield record
+        finally:
+            record.wall = time.perf_counter() - wall
+            record.cpu = time.process_time() - cpu
+            children_cpu_end, record.peak_rss, record.children_peak_rss = usage()
+            if children_cpu is not None and children_cpu_end is not None:
+                record.children_cpu = children_cpu_end - children_cpu
+            self.records.append(record)
+
+    def add(self, name: str, wall: float, frames: int | None = None):
+        """记录与其他阶段交织、只能累计耗时的部分（如边计算边写入的 sendcmd）"""
+        if self.enabled:
+            self.records.append(StageRecord(name, wall=wall, frames=frames))
+
+    @contextmanager
+    def capture_hot_paths(self, path: str | PathLike) -> Generator[None, Any, None]:
+        """采集 Python 热点：cProfile 保存为 .prof，viztracer 保存为 .json"""
+        if not self.enabled or self.capture is None:
+            yield
+            return
+        path = Path(path)
+        if self.capture == "cprofile":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(path.with_suffix(".prof"))
+                log.info(f"Python profile saved in {path.with_suffix('.prof')}")
+        else:
+            try:
+                from viztracer import VizTracer
+            except ImportError as e:
+                raise ImportError(
+                    "Cannot import viztracer, fix it by using `pip install viztracer`") from e
+            tracer = VizTracer(output_file=str(path.with_suffix(".viztracer.json")),
+                               verbose=0)
+            tracer.start()
+            try:
+                yield
+            finally:
+                tracer.stop()
+                tracer.save()
+                log.info(f"Python trace saved in {path.with_suffix('.viztracer.json')}")
+
+    def report(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "stages": [{
+                **asdict(record), "fps": record.fps
+            } for record in self.records]
+        }
+
+    def save(self, path: str | PathLike):
+        if not self.enabled:
+            return
+        Path(path).write_text(json.dumps(self.report(), indent=2, ensure_ascii=False),
+                              encoding="utf-8")
+        log.info(f"Profile report saved in {path}")
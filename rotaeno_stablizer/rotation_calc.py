@@ -1,25 +1,169 @@
 import logging
+import math
+import os
 import subprocess
+from bisect import bisect_left
+from contextlib import closing
+from dataclasses import dataclass
+from functools import cache, partial
 from math import radians
+from multiprocessing.pool import ThreadPool
 from os import PathLike
 from subprocess import PIPE
-from typing import Generator, Any
+from threading import Event
+from typing import Any, BinaryIO, Generator, Iterable
 
+import numpy as np
 from rich.markup import escape
 
-from .ffmpeg import get_ffmpeg
+from .cache import file_identity
+from .ffmpeg import FFMpegError, get_ffmpeg, get_keyframes, probe_video, tail_stderr
 
 log = logging.getLogger("rich")
 
+FRAME_SIZE = 12  # 四个角各一个 RGB 像素
+MIN_SEGMENT_DURATION = 10  # 并行提取时每段的最短时长（秒）
+# 最后一段的帧数与按时长估算的帧数允许相差的帧数（fps 滤镜在结尾可能少输出一帧）
+TAIL_TOLERANCE = 1
+
+EXTRACT_PROFILES = ["accurate", "fast"]
+# fast 配置的解码捷径，校验不一致时从后往前逐个去掉
+SHORTCUTS = ("skip_loop_filter", "lowres")
+LOWRES_CODECS = {"mjpeg", "jpeg2000"}  # 支持降低解码分辨率的解码器
+VALIDATE_SECONDS = 1.  # fast 配置与 accurate 对比的每个窗口的时长（秒）
+VALIDATE_WINDOWS = 4  # 校验窗口数，开头一个，其余均匀分布在视频中的关键帧处
+
+# 进程内的捷径校验结果，键为 (文件身份, 解码器, 帧率, 直播模式版本, 取样区域)
+shortcut_memo: dict[tuple, tuple[str, ...]] = {}
+
+
+@cache
+def sqrt_table() -> np.ndarray:
+    """整数平方根表，与 V1 中 `int ** 0.5` 的结果逐位一致（RGB 距离平方最大为 3 * 255 ** 2）"""
+    return np.array([i**0.5 for i in range(3 * 255**2 + 1)], dtype=np.float64)
+
+
+def read_frame_blocks(stream: BinaryIO,
+                      frame_size: int,
+                      block_frames: int = 8192) -> Generator[np.ndarray, Any, None]:
+    """从无缓冲管道中成块读取定长帧
+
+    每次系统调用最多读取 block_frames 帧，返回 N×frame_size 的 uint8 数组；
+    不完整的帧留到下一次读取时拼接，流结束时仍不完整的尾帧会被丢弃。
+    """
+    buffer = bytearray(frame_size * block_frames)
+    view = memoryview(buffer)
+    filled = 0
+    while n := stream.readinto(view[filled:]):
+        filled += n
+        usable = filled - filled % frame_size
+        if usable == 0:
+            continue
+        yield np.frombuffer(buffer, dtype=np.uint8,
+                            count=usable).reshape(-1, frame_size).copy()
+        buffer[:filled - usable] = buffer[usable:filled]
+        filled -= usable
+    if filled:
+        log.warning(f"Dropped incomplete trailing frame ({filled}/{frame_size} bytes)")
+
+
+def angles_to_num(
+        blocks: Iterable[np.ndarray],
+        fps: float) -> Generator[tuple[tuple[float, float], float], Any, None]:
+    """为逐块的旋转角度加上每帧的起止时间"""
+    i = 0
+    for rotates in blocks:
+        for rotate in rotates.tolist():
+            i_then = i + 1 / fps
+            yield (i, i_then), rotate
+            i = i_then
+
+
+def angles_to_intervals(
+    blocks: Iterable[np.ndarray],
+    fps: float,
+    tolerance: float | None = 0.
+) -> Generator[tuple[tuple[float, float], float, int], Any, None]:
+    """将相邻且角度相同（或与区间首帧相差不超过 tolerance 度）的帧合并为一个区间
+
+    返回 ((开始时间, 结束时间), 角度, 帧数)，区间边界与逐帧输出时完全相同；
+    tolerance 为 None 时不合并。
+    """
+    start = end = angle = None
+    count = 0
+    for (i, i_then), rotate in angles_to_num(blocks, fps):
+        if (tolerance is not None and angle is not None
+                and abs(rotate - angle) <= tolerance):
+            end = i_then
+            count += 1
+            continue
+        if angle is not None:
+            yield (start, end), angle, count
+        start, end, angle, count = i, i_then, rotate, 1
+    if angle is not None:
+        yield (start, end), angle, count
+
+
+def format_cmd(start: float, end: float, rotate: float, target: str = "rotate") -> str:
+    return f"{start}-{end} {target} angle {radians(rotate)};"
+
+
+def angles_to_cmd(blocks: Iterable[np.ndarray],
+                  fps: float,
+                  tolerance: float | None = None) -> Generator[str, Any, None]:
+    """将逐块的旋转角度转为 sendcmd 指令，tolerance 不为 None 时合并相同角度的帧"""
+    for (start, end), rotate, _ in angles_to_intervals(blocks, fps, tolerance):
+        yield format_cmd(start, end, rotate)
+
+
+@dataclass
+class ExtractSegment:
+    """并行提取的一段，start / end 为输出帧序号（左闭右开），seek 为起始关键帧时间"""
+    seek: float | None
+    start: int
+    end: int | None
+
+    def touches(self, frame: int, count: int) -> bool:
+        """从第 frame 帧起的 count 帧是否与本段重叠或相邻
+
+        区间时间是累加得到的，边界帧按时间可能落在相邻的区间内，因此相邻的区间也算在内。
+        """
+        return frame + count >= self.start and (self.end is None or frame <= self.end)
+
 
 class RotationCalc:
     """通过画面计算旋转角度"""
 
-    def __init__(self, version: int = 2, area: int = 8) -> None:
+    def __init__(self,
+                 version: int = 2,
+                 area: int = 8,
+                 segments: int | None = None,
+                 profile: str = "accurate",
+                 cache_dir: str | PathLike | None = None,
+                 use_cache: bool = False) -> None:
+        """
+        Args:
+            version (int, optional): 直播模式版本. Defaults to 2.
+            area (int, optional): 四角取样区域边长. Defaults to 8.
+            segments (int | None, optional): 并行提取段数，None 则为 CPU 核心数. Defaults to None.
+            profile (str, optional): 提取配置，"accurate" 为完整解码，"fast" 使用解码捷径（跳过环路滤波、降低分辨率）并按并行段数分配解码线程，
+                                     捷径先在视频开头及中间的几个窗口与 accurate 对比角度，不一致的自动停用. Defaults to "accurate".
+            cache_dir (str | PathLike | None, optional): 缓存目录，None 为系统缓存目录. Defaults to None.
+            use_cache (bool, optional): 关键帧扫描结果是否写入磁盘缓存. Defaults to False.
+        """
         if version not in [1, 2]:
             raise ValueError("Unsupport Rotation Version")
+        if profile not in EXTRACT_PROFILES:
+            raise ValueError(f"Unsupport extract profile: {profile}")
+        self.version = version
+        self.profile = profile
         self.method = self.compute_rotation_v2 if version == 2 else self.compute_rotation
+        self.batch_method = (self.compute_rotation_v2_batch
+                             if version == 2 else self.compute_rotation_batch)
         self.area = area
+        self.segments = segments if segments else os.cpu_count() or 1
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
 
     def compute_rotation(self, input_data: list[int]) -> float:
         """V1 旋转计算方法（From https://github.com/Lawrenceeeeeeee/python_rotaeno_stabilizer）"""
@@ -59,32 +203,318 @@ class RotationCalc:
 
         return rotation_degree
 
+    def compute_rotation_batch(self, frames: np.ndarray) -> np.ndarray:
+        """V1 旋转计算方法（批量），frames 为 N×12 的 uint8 数组，结果与 compute_rotation 一致"""
+
+        points = frames.astype(np.int64).reshape(-1, 4, 3)
+        left, right, center, sample = (points[:, i] for i in range(4))
+        table = sqrt_table()
+
+        def calculate_distance(point1, point2):
+            return table[((point2 - point1)**2).sum(axis=1)]
+
+        center_dist = calculate_distance(center, sample)
+        left_length = calculate_distance(left, center)
+        left_dist = calculate_distance(left, sample)
+        right_dist = calculate_distance(right, sample)
+
+        dir_ = np.where(left_dist < right_dist, -1, 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            angle = np.where(left_length == 0, 180.0,
+                             (center_dist - left_length) / left_length * 180 * dir_ + 180)
+
+        return -angle
+
+    def compute_rotation_v2_batch(self, frames: np.ndarray) -> np.ndarray:
+        """V2 旋转计算方法（批量），frames 为 N×12 的 uint8 数组，结果与 compute_rotation_v2 一致"""
+
+        weights = 1 << np.arange(frames.shape[1] - 1, -1, -1, dtype=np.int64)
+        color_to_degree = (frames > 127.5) @ weights
+        rotation_degree = color_to_degree / 4096 * -360
+
+        return rotation_degree
+
+    def corner_filter(self, source: str, lowres: int = 0) -> str:
+        """取四角区域并缩放为 1 像素后横向拼接（4×1），返回未加输出标签的滤镜链
+
+        lowres 为解码时降低分辨率的级数，取样区域随之缩小。
+        split 只复制帧的引用，四个分支的裁切与缩放相对解码的开销可以忽略。
+        """
+        cs = max(self.area >> lowres, 1)
+        return (
+            f"{source}split=4[top_left][top_right][bottom_left][bottom_right];"
+            f"[top_left]crop={cs}:{cs}:0:0,scale=1:1:flags=fast_bilinear[top_left];"
+            f"[top_right]crop={cs}:{cs}:iw-{cs}:0,scale=1:1:flags=fast_bilinear[top_right];"
+            f"[bottom_left]crop={cs}:{cs}:0:ih-{cs},scale=1:1:flags=fast_bilinear[bottom_left];"
+            f"[bottom_right]crop={cs}:{cs}:iw-{cs}:ih-{cs},scale=1:1:flags=fast_bilinear[bottom_right];"
+            "[top_left][top_right][bottom_left][bottom_right]hstack=inputs=4")
+
     def export_ffmpeg_cmd(self,
                           video_name: PathLike | str,
                           fps: float | None = None,
-                          codec: str | None = None):
+                          codec: str | None = None,
+                          segment: ExtractSegment | None = None,
+                          shortcuts: Iterable[str] = (),
+                          threads: int | None = None):
+        shortcuts = set(shortcuts)
+        lowres = 1 if "lowres" in shortcuts else 0
         commands = []
         if codec is not None:
             commands += ["-c:v", codec]
+        if "skip_loop_filter" in shortcuts:
+            commands += ["-skip_loop_filter", "all"]
+        if lowres:
+            commands += ["-lowres", str(lowres)]
+        if threads is not None:
+            commands += ["-threads", str(threads)]
+        if segment is not None:
+            # 保留原时间戳，使每段的 fps 采样与整段提取完全一致
+            commands += ["-copyts", "-start_at_zero", "-noaccurate_seek"]
+            if segment.seek is not None:
+                commands += ["-ss", f"{segment.seek + 1e-6:.6f}"]
         commands += ["-i", video_name]
 
-        cs = self.area
+        trim = ""
+        if segment is not None:
+            trim = f",trim=start_pts={segment.start}"
+            if segment.end is not None:
+                trim += f":end_pts={segment.end}"
+
         commands.append("-filter_complex")
-        commands.append("[0:v]split=4[top_left][top_right][bottom_left][bottom_right];")
+        commands.append(
+            self.corner_filter("[0:v]", lowres) +
+            f"{f',fps={fps}' if fps is not None else ''}{trim}[rotation];")
 
-        commands[-1] += (
-            f"[top_left]crop={cs}:{cs}:0:0,scale=1:1:flags=fast_bilinear[top_left];"
-            f"[top_right]crop={cs}:{cs}:iw-{cs}:0,scale=1:1:flags=fast_bilinear[top_right];"
-            f"[bottom_left]crop={cs}:{cs}:0:ih-{cs},scale=1:1:flags=fast_bilinear[bottom_left];"
-            f"[bottom_right]crop={cs}:{cs}:iw-{cs}:ih-{cs},scale=1:1:flags=fast_bilinear[bottom_right];"
-            "[top_left][top_right][bottom_left][bottom_right]hstack=inputs=4"
-            f"{f',fps={fps}' if fps is not None else ''}[rotation];")
+        commands += ["-map", "[rotation]"]
+        if segment is not None:
+            commands += ["-fps_mode", "passthrough"]
+            if segment.end is not None:
+                commands += ["-frames:v", str(segment.end - segment.start)]
+        commands += ["-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:"]
 
-        commands += [
-            "-map", "[rotation]", "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:"
+        return commands
+
+    def plan_segments(self, video_name: str | PathLike, fps: float) -> list[ExtractSegment]:
+        """按关键帧将视频切分为若干段，无法切分时返回空列表"""
+        if self.segments <= 1:
+            return []
+        try:
+            keyframes, duration = get_keyframes(video_name, self.cache_dir, self.use_cache)
+        except (FFMpegError, OSError) as e:
+            log.debug(f"Cannot get keyframes, extract in single process: {e}")
+            return []
+
+        segments = min(self.segments, int(duration // MIN_SEGMENT_DURATION))
+        bounds: list[tuple[float, int]] = []
+        for k in range(1, segments):
+            target = duration * k / segments
+            index = bisect_left(keyframes, target)
+            candidates = keyframes[max(index - 1, 0):index + 1]
+            if not candidates:
+                continue
+            seek = min(candidates, key=lambda t: abs(t - target))
+            # 第一个输出帧必定落在该关键帧（或之后），因此这一段不需要更早的画面
+            start = math.ceil(seek * fps)
+            if seek > 0 and start > (bounds[-1][1] if bounds else 0):
+                bounds.append((seek, start))
+        if not bounds:
+            return []
+
+        starts: list[tuple[float | None, int]] = [(None, 0), *bounds]
+        ends: list[int | None] = [start for _, start in bounds] + [None]
+        return [
+            ExtractSegment(seek, start, end) for (seek, start), end in zip(starts, ends)
         ]
 
-        return commands
+    def run_extraction(self, commands: list) -> Generator[np.ndarray, Any, None]:
+        """运行一个提取进程，按块输出旋转角度"""
+        commands = [get_ffmpeg(), "-loglevel", "error", *commands]
+
+        pipe = subprocess.Popen(commands, stdout=PIPE, stderr=PIPE, bufsize=0)
+        log.debug("Running Commands: [bold green]" +
+                  escape(" ".join(map(str, commands))),
+                  extra={"markup": True})
+        assert pipe.stdout is not None
+        stderr, stderr_reader = tail_stderr(pipe)
+        try:
+            for frames in read_frame_blocks(pipe.stdout, FRAME_SIZE):
+                yield self.batch_method(frames)
+        finally:
+            if pipe.poll() is None:
+                pipe.kill()
+            pipe.wait()
+            stderr_reader.join()
+
+        if pipe.returncode != 0:
+            raise FFMpegError("Error extracting rotation: " +
+                              b"".join(stderr).decode("utf-8", errors="replace"))
+
+    def available_shortcuts(self, video_name: str | PathLike,
+                            codec: str | None) -> list[str]:
+        """该视频可以尝试的捷径，降低分辨率只用于支持的软件解码器"""
+        source_codec = None
+        if codec is None:
+            try:
+                source_codec = probe_video(video_name)["codec"]
+            except (FFMpegError, OSError, ValueError):
+                pass
+        return [s for s in SHORTCUTS if s != "lowres" or source_codec in LOWRES_CODECS]
+
+    def validation_windows(self, video_name: str | PathLike,
+                           fps: float) -> list[ExtractSegment]:
+        """fast 配置的校验窗口：开头以及均匀分布在视频中的关键帧处，各 VALIDATE_SECONDS 秒
+
+        开头往往是静止的片头，只校验开头无法发现随画面内容变化的误差。
+        """
+        length = max(int(fps * VALIDATE_SECONDS), 1)
+        windows = [ExtractSegment(None, 0, length)]
+        try:
+            keyframes, duration = get_keyframes(video_name, self.cache_dir, self.use_cache)
+        except (FFMpegError, OSError) as e:
+            log.debug(f"Cannot get keyframes, validate the beginning only: {e}")
+            return windows
+        for k in range(1, VALIDATE_WINDOWS):
+            target = duration * k / VALIDATE_WINDOWS
+            seek = min(keyframes, key=lambda t: abs(t - target), default=0)
+            start = math.ceil(seek * fps)
+            if seek > 0 and start >= windows[-1].end:
+                windows.append(ExtractSegment(seek, start, start + length))
+        return windows
+
+    def probe_angles(self,
+                     video_name: str | PathLike,
+                     fps: float,
+                     codec: str | None,
+                     windows: list[ExtractSegment],
+                     shortcuts: Iterable[str] = ()) -> list[np.ndarray] | None:
+        """提取各校验窗口的旋转角度，失败时返回 None"""
+        result = []
+        for window in windows:
+            cmd = self.export_ffmpeg_cmd(video_name, fps, codec, window, shortcuts)
+            try:
+                result.append(np.concatenate([np.empty(0), *self.run_extraction(cmd)]))
+            except FFMpegError as e:
+                log.debug(f"Probe {window} with {list(shortcuts)} failed: {e}")
+                return None
+        return result
+
+    def resolve_shortcuts(self, video_name: str | PathLike, fps: float,
+                          codec: str | None) -> tuple[str, ...]:
+        """fast 配置：在多个窗口对比与 accurate 提取的角度，去掉改变了结果的捷径"""
+        if self.profile != "fast":
+            return ()
+        identity = file_identity(video_name)
+        memo_key = (identity["path"], identity["size"], identity["mtime"], codec, fps,
+                    self.version, self.area)
+        if memo_key in shortcut_memo:
+            return shortcut_memo[memo_key]
+
+        shortcuts = self.available_shortcuts(video_name, codec)
+        windows = self.validation_windows(video_name, fps)
+        reference = self.probe_angles(video_name, fps, codec, windows)
+        if reference is None or not any(len(angles) for angles in reference):
+            shortcuts = []
+        while shortcuts:
+            probed = self.probe_angles(video_name, fps, codec, windows, shortcuts)
+            if probed is not None and all(
+                    np.array_equal(a, b) for a, b in zip(probed, reference)):
+                break
+            log.info(f"Extraction shortcut {shortcuts[-1]} changed the corners, disabled")
+            shortcuts.pop()
+        log.debug(f"Extraction shortcuts: {shortcuts} (validated on {len(windows)} windows)")
+        shortcut_memo[memo_key] = tuple(shortcuts)
+        return shortcut_memo[memo_key]
+
+    def expected_frames(self, video_name: str | PathLike, fps: float) -> int | None:
+        """按探测到的时长估算整段提取的帧数，无法探测时返回 None"""
+        try:
+            return round(probe_video(video_name)["duration"] * fps)
+        except (FFMpegError, OSError, ValueError):
+            return None
+
+    def extract_segment(self,
+                        video_name: str | PathLike,
+                        fps: float,
+                        codec: str | None,
+                        segment: ExtractSegment,
+                        shortcuts: Iterable[str] = (),
+                        threads: int | None = None,
+                        total: int | None = None,
+                        cancel: Event | None = None) -> np.ndarray | None:
+        """提取一段的旋转角度，失败、帧数不符或被取消时返回 None
+
+        最后一段（end 为 None）的帧数与 total（整段提取的预计帧数）对比。
+        """
+        cancel = cancel or Event()
+        if cancel.is_set():
+            return None
+        cmd = self.export_ffmpeg_cmd(video_name, fps, codec, segment, shortcuts, threads)
+        blocks = [np.empty(0)]
+        try:
+            with closing(self.run_extraction(cmd)) as extraction:
+                for block in extraction:
+                    # 其他段已经失败时立即结束解码进程
+                    if cancel.is_set():
+                        return None
+                    blocks.append(block)
+        except FFMpegError as e:
+            log.debug(f"Segment {segment} failed: {e}")
+            return None
+        rotates = np.concatenate(blocks)
+        if segment.end is not None:
+            mismatch = len(rotates) != segment.end - segment.start
+        else:
+            mismatch = (total is not None
+                        and abs(len(rotates) - (total - segment.start)) > TAIL_TOLERANCE)
+        if mismatch:
+            log.debug(f"Segment {segment} got {len(rotates)} frames")
+            return None
+        return rotates
+
+    def export_blocks(self,
+                      video_name: str | PathLike,
+                      fps: float,
+                      codec: str | None = None) -> Generator[np.ndarray, Any, None]:
+        """按块输出旋转角度（每块为一维 float64 数组）
+
+        可切分时各段并行提取，按顺序拼接；某段结果异常时，取消其余各段，
+        从该段的起始关键帧开始单进程提取剩余部分。
+        """
+        shortcuts = self.resolve_shortcuts(video_name, fps, codec)
+        plan = self.plan_segments(video_name, fps)
+        fallback = None
+        if plan:
+            log.debug(f"Extract rotation in {len(plan)} segments")
+            # fast 配置下各段平分 CPU 核心，避免解码线程过多
+            threads = (max((os.cpu_count() or 1) // len(plan), 1)
+                       if self.profile == "fast" else None)
+            cancel = Event()
+            with ThreadPool(len(plan)) as pool:
+                for segment, rotates in zip(
+                        plan,
+                        pool.imap(
+                            partial(self.extract_segment,
+                                    video_name,
+                                    fps,
+                                    codec,
+                                    shortcuts=shortcuts,
+                                    threads=threads,
+                                    total=self.expected_frames(video_name, fps),
+                                    cancel=cancel), plan)):
+                    if rotates is None:
+                        log.warning("Segmented extraction mismatched, "
+                                    "fall back to single process")
+                        cancel.set()
+                        if segment.seek is not None:
+                            fallback = ExtractSegment(segment.seek, segment.start, None)
+                        break
+                    yield rotates
+                else:
+                    return
+
+        for rotates in self.run_extraction(
+                self.export_ffmpeg_cmd(video_name, fps, codec, fallback, shortcuts)):
+            yield rotates
 
     def export_num(
         self,
@@ -92,41 +522,13 @@ class RotationCalc:
         fps: float,
         codec: str | None = None
     ) -> Generator[tuple[tuple[float, float], float], Any, None]:
-        cmd = self.export_ffmpeg_cmd(video_name, fps, codec)
-        commands = [get_ffmpeg(), "-loglevel", "error", *cmd]
-
-        frame_size = 12
-        pipe = subprocess.Popen(commands,
-                                stdout=PIPE,
-                                stderr=PIPE,
-                                bufsize=frame_size + 1)
-        log.debug("Running Commands: [bold green]" +
-                  escape(" ".join(map(str, commands))),
-                  extra={"markup": True})
-        stdout = pipe.stdout
-        assert stdout is not None
-        i = 0
-        import time
-        ts = []
-        while pipe.poll() is None:
-            frame = stdout.read(frame_size)
-            if frame == b"":
-                break
-            a = time.time()
-            rotate = self.method(list(frame))
-            ts.append(time.time() - a)
-            i_then = i + 1 / fps
-            yield (i, i_then), rotate
-            i = i_then
-            stdout.flush()
-        pipe.wait()
+        yield from angles_to_num(self.export_blocks(video_name, fps, codec), fps)
 
     def export_cmd(self,
                    video_name: str | PathLike,
                    fps: float,
                    codec: str | None = None) -> Generator[str, Any, None]:
-        for (i, i_then), rotate in self.export_num(video_name, fps, codec):
-            yield f"{i}-{i_then} rotate angle {radians(rotate)};"
+        yield from angles_to_cmd(self.export_blocks(video_name, fps, codec), fps)
 
 
 if __name__ == "__main__":
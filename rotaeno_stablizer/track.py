@@ -0,0 +1,208 @@
+"""旋转轨道文件（.rtrk）
+
+紧凑的二进制旋转数据格式，可直接内存映射：
+
+    偏移  类型      含义
+    0     4s        魔数 b"RTRK"
+    4     uint16    格式版本
+    6     uint16    直播模式版本
+    8     4s        角度数据类型（b"<u2 " / b"<f4 " / b"<f8 "）
+    12    float64   帧率
+    20    uint64    帧数
+    28    4x        填充
+    32    ...       角度数据
+
+V2 的角度本身就是 4096 级量化的结果，以 uint16 保存时不损失任何精度。
+"""
+import argparse
+import math
+import os
+import re
+import struct
+import uuid
+from dataclasses import dataclass
+from os import PathLike
+from pathlib import Path
+from typing import Any, Generator, Iterable
+
+import numpy as np
+
+from .rotation_calc import angles_to_cmd
+
+MAGIC = b"RTRK"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHH4sdQ4x")
+DTYPES = ("<u2", "<f4", "<f8")
+
+cmd_pattern = re.compile(r"^\s*([\d.e+-]+)-([\d.e+-]+)\s+rotate\s+angle\s+([\d.e+-]+)\s*;")
+
+
+@dataclass
+class TrackInfo:
+    fps: float
+    version: int
+    frames: int
+    dtype: str
+
+
+def default_dtype(version: int) -> str:
+    return "<u2" if version == 2 else "<f4"
+
+
+def encode_angles(angles: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "<u2":
+        return (np.rint(angles / -360 * 4096).astype(np.int64) % 4096).astype(dtype)
+    return angles.astype(dtype)
+
+
+def decode_angles(data: np.ndarray, dtype: str) -> np.ndarray:
+    if dtype == "<u2":
+        return data.astype(np.int64) / 4096 * -360
+    return data.astype(np.float64)
+
+
+def store_track(path: str | PathLike,
+                blocks: Iterable[np.ndarray],
+                fps: float,
+                version: int,
+                dtype: str | None = None) -> Generator[np.ndarray, Any, None]:
+    """边输出边写入旋转轨道，帧数在写完后回填到文件头
+
+    先写入同目录下的临时文件，完整迭代结束后才原子地替换目标文件，
+    中途中断时不会留下不完整的轨道，也不会破坏已有的轨道。
+    """
+    dtype = dtype or default_dtype(version)
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupport track dtype: {dtype}")
+    if dtype == "<u2" and version != 2:
+        raise ValueError("uint16 track is only lossless for rotation version 2")
+
+    def header(frames: int) -> bytes:
+        return HEADER.pack(MAGIC, FORMAT_VERSION, version, dtype.ljust(4).encode(), fps,
+                           frames)
+
+    path = Path(path)
+    temp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    frames = 0
+    try:
+        with temp.open("wb") as f:
+            f.write(header(0))
+            for block in blocks:
+                f.write(encode_angles(block, dtype).tobytes())
+                frames += len(block)
+                yield block
+            f.seek(0)
+            f.write(header(frames))
+        os.replace(temp, path)
+    finally:
+        temp.unlink(missing_ok=True)
+
+
+def write_track(path: str | PathLike,
+                blocks: Iterable[np.ndarray],
+                fps: float,
+                version: int,
+                dtype: str | None = None) -> int:
+    """写入旋转轨道，返回帧数"""
+    return sum(len(block) for block in store_track(path, blocks, fps, version, dtype))
+
+
+def read_track_info(path: str | PathLike) -> TrackInfo:
+    with Path(path).open("rb") as f:
+        header = f.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise ValueError(f"Not a rotation track: {path}")
+    magic, format_version, version, dtype, fps, frames = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"Not a rotation track: {path}")
+    if format_version != FORMAT_VERSION:
+        raise ValueError(f"Unsupport track format version: {format_version}")
+    return TrackInfo(fps, version, frames, dtype.decode().strip())
+
+
+def read_track(path: str | PathLike,
+               block_frames: int = 8192) -> tuple[TrackInfo, Generator[np.ndarray, Any, None]]:
+    """内存映射读取旋转轨道，按块返回 float64 角度"""
+    info = read_track_info(path)
+
+    def blocks():
+        if info.frames == 0:
+            return
+        data = np.memmap(path, dtype=info.dtype, mode="r", offset=HEADER.size,
+                         shape=(info.frames,))
+        for start in range(0, info.frames, block_frames):
+            yield decode_angles(data[start:start + block_frames], info.dtype)
+
+    return info, blocks()
+
+
+def track_to_cmd(track_path: str | PathLike,
+                 cmd_path: str | PathLike,
+                 tolerance: float | None = 0.) -> int:
+    """将旋转轨道转为 sendcmd 文本，返回指令条数"""
+    info, blocks = read_track(track_path)
+    count = 0
+    with Path(cmd_path).open("w", encoding="utf-8", buffering=1 << 20) as f:
+        for line in angles_to_cmd(blocks, info.fps, tolerance):
+            if count:
+                f.write("\n")
+            f.write(line)
+            count += 1
+    return count
+
+
+def parse_cmd(cmd_path: str | PathLike,
+              fps: float,
+              block_frames: int = 8192) -> Generator[np.ndarray, Any, None]:
+    """解析 sendcmd 文本，按帧展开为 float64 角度块（区间按 fps 拆成多帧）"""
+    block: list[float] = []
+    with Path(cmd_path).open(encoding="utf-8") as f:
+        for line in f:
+            match = cmd_pattern.match(line)
+            if match is None:
+                continue
+            start, end, angle = map(float, match.groups())
+            block += [math.degrees(angle)] * max(round((end - start) * fps), 1)
+            if len(block) >= block_frames:
+                yield np.array(block)
+                block = []
+    if block:
+        yield np.array(block)
+
+
+def cmd_to_track(cmd_path: str | PathLike,
+                 track_path: str | PathLike,
+                 fps: float,
+                 version: int = 2,
+                 dtype: str | None = None) -> int:
+    """将 sendcmd 文本转为旋转轨道，返回帧数"""
+    return write_track(track_path, parse_cmd(cmd_path, fps), fps, version, dtype)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rotation track converter")
+    sub = parser.add_subparsers(dest="command", required=True)
+    to_cmd = sub.add_parser("to-cmd", help="旋转轨道 -> sendcmd 文本")
+    to_cmd.add_argument("track")
+    to_cmd.add_argument("cmd")
+    to_cmd.add_argument("--tolerance", type=float, default=0.)
+    from_cmd = sub.add_parser("from-cmd", help="sendcmd 文本 -> 旋转轨道")
+    from_cmd.add_argument("cmd")
+    from_cmd.add_argument("track")
+    from_cmd.add_argument("--fps", type=float, required=True)
+    from_cmd.add_argument("--rotation-version", type=int, default=2)
+    from_cmd.add_argument("--dtype", choices=DTYPES, default=None)
+    info = sub.add_parser("info", help="查看旋转轨道信息")
+    info.add_argument("track")
+    args = parser.parse_args()
+
+    if args.command == "to-cmd":
+        print(f"{track_to_cmd(args.track, args.cmd, args.tolerance)} commands")
+    elif args.command == "from-cmd":
+        print(f"{cmd_to_track(args.cmd, args.track, args.fps, args.rotation_version, args.dtype)} frames")
+    else:
+        print(read_track_info(args.track))
+
+
+if __name__ == "__main__":
+    main()
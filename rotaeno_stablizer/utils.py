@@ -1,5 +1,4 @@
 import sys
-import urllib.request
 from os import PathLike, fspath
 import os.path
 
@@ -8,6 +7,8 @@ from rich import get_console
 from rich.progress import ProgressColumn, Task
 from rich.text import Text
 
+from .cache import CoverCache
+
 
 
 class FPSColumn(ProgressColumn):
@@ -21,7 +22,13 @@ class FPSColumn(ProgressColumn):
         return Text(f"FPS:{speed:>4.0f}", style="progress.data.speed")
 
 
-def get_picture(background: str | PathLike | None) -> Image.Image | None:
+def get_picture(background: str | PathLike | None,
+                diameter: int | None = None,
+                cache_root: str | PathLike | None = None) -> Image.Image | None:
+    """读取封面，diameter 不为 None 时缩放为该边长的正方形
+
+    网址经由本地缓存（见 CoverCache），缓存位于 cache_root，None 为系统缓存目录。
+    """
     if background is None:
         return
 
@@ -29,13 +36,14 @@ def get_picture(background: str | PathLike | None) -> Image.Image | None:
 
     # 判断是网址还是本地路径，并加载图片
     if input_str.startswith(("http://", "https://")):
-        with urllib.request.urlopen(input_str) as r:
-            image = Image.open(r)
+        return CoverCache(cache_root).picture(input_str, diameter)
     elif os.path.isfile(input_str):
         image = Image.open(input_str)
     else:
         raise ValueError("Unknown input")
 
+    if diameter is not None:
+        image = image.resize((diameter, diameter))
     return image
 
 
@@ -0,0 +1,194 @@
+"""监视文件夹模式
+
+定时扫描文件夹，新录像的大小保持不变一段时间后排队处理，
+成功后移动到 done 文件夹，失败则移动到 failed 文件夹。
+排队与处理中的文件记录在状态文件里，守护进程重启后继续处理。
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import shutil
+import time
+from os import PathLike
+from pathlib import Path
+from threading import Event
+
+from . import Rotaeno
+from .batch import rotaeno_from_config, run_kwargs_from_config
+from .config import config_data
+from .profiling import StageProfiler
+
+log = logging.getLogger("rich")
+
+
+class WatchState:
+    """状态文件：文件名 -> "queued" / "running"，按排队顺序保存"""
+
+    def __init__(self, path: str | PathLike) -> None:
+        self.path = Path(path)
+        self.jobs: dict[str, str] = {}
+        if self.path.exists():
+            try:
+                self.jobs = json.loads(self.path.read_text(encoding="utf-8"))["jobs"]
+            except (OSError, ValueError, KeyError):
+                log.warning(f"Broken watch state file, ignored: {self.path}")
+        # 上次退出时正在处理的任务重新排队
+        for name, status in self.jobs.items():
+            if status == "running":
+                log.info(f"Resume interrupted job: {name}")
+                self.jobs[name] = "queued"
+        self.save()
+
+    def save(self):
+        temp = self.path.with_name(self.path.name + ".tmp")
+        temp.write_text(json.dumps({"jobs": self.jobs}, ensure_ascii=False), encoding="utf-8")
+        os.replace(temp, self.path)
+
+    def set(self, name: str, status: str):
+        self.jobs[name] = status
+        self.save()
+
+    def remove(self, name: str):
+        self.jobs.pop(name, None)
+        self.save()
+
+    def next_queued(self) -> str | None:
+        return next((name for name, status in self.jobs.items() if status == "queued"), None)
+
+
+class WatchDaemon:
+
+    def __init__(self,
+                 rotaeno: Rotaeno,
+                 watch_dir: str | PathLike,
+                 output_dir: str | PathLike | None = None,
+                 done_dir: str | PathLike | None = None,
+                 failed_dir: str | PathLike | None = None,
+                 extensions: list[str] | None = None,
+                 interval: float = 2.,
+                 stable_seconds: float = 5.,
+                 mask_output: bool = False,
+                 run_kwargs: dict | None = None) -> None:
+        """
+        Args:
+            rotaeno (Rotaeno): 作为模板的实例，每个任务使用它的副本，探测结果与背景在任务间保持复用
+            watch_dir (str | PathLike): 监视的文件夹
+            output_dir (str | PathLike | None, optional): 输出文件夹，None 为 watch_dir/output. Defaults to None.
+            done_dir (str | PathLike | None, optional): 成功后录像移动到此，None 为 watch_dir/done. Defaults to None.
+            failed_dir (str | PathLike | None, optional): 失败后录像移动到此，None 为 watch_dir/failed. Defaults to None.
+            extensions (list[str] | None, optional): 监视的文件类型，None 为常见视频格式. Defaults to None.
+            interval (float, optional): 扫描间隔（秒）. Defaults to 2.
+            stable_seconds (float, optional): 文件大小保持不变多久后视为写入完成（秒）. Defaults to 5.
+            mask_output (bool, optional): 是否同时输出掩码. Defaults to False.
+            run_kwargs (dict | None, optional): 传给 Rotaeno.run 的其他参数. Defaults to None.
+        """
+        self.rotaeno = rotaeno
+        self.watch_dir = Path(watch_dir)
+        self.output_dir = Path(output_dir) if output_dir else self.watch_dir / "output"
+        self.done_dir = Path(done_dir) if done_dir else self.watch_dir / "done"
+        self.failed_dir = Path(failed_dir) if failed_dir else self.watch_dir / "failed"
+        self.extensions = {
+            e.lower()
+            for e in (extensions or [".mp4", ".mkv", ".mov", ".m4v", ".flv", ".avi"])
+        }
+        self.interval = interval
+        self.stable_seconds = stable_seconds
+        self.mask_output = mask_output
+        self.run_kwargs = run_kwargs or {}
+
+        for directory in (self.output_dir, self.done_dir, self.failed_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        self.state = WatchState(self.watch_dir / ".rotaeno_watch.json")
+        # 文件名 -> (上次看到的大小, 大小开始不变的时间)
+        self.sizes: dict[str, tuple[int, float]] = {}
+
+    def scan(self):
+        """找出大小已稳定的新文件并排队"""
+        now = time.monotonic()
+        for path in sorted(self.watch_dir.iterdir()):
+            name = path.name
+            if (name.startswith(".") or not path.is_file()
+                    or path.suffix.lower() not in self.extensions or name in self.state.jobs):
+                continue
+            try:
+                size = path.stat().st_size
+            except OSError:
+                continue
+            last = self.sizes.get(name)
+            if last is None or last[0] != size:
+                self.sizes[name] = (size, now)
+            elif now - last[1] >= self.stable_seconds:
+                log.info(f"Queued: {name}")
+                del self.sizes[name]
+                self.state.set(name, "queued")
+
+    def process(self, name: str):
+        input_video = self.watch_dir / name
+        if not input_video.exists():
+            log.warning(f"Queued file disappeared: {name}")
+            self.state.remove(name)
+            return
+
+        self.state.set(name, "running")
+        rotaeno = copy.copy(self.rotaeno)
+        rotaeno.profiler = StageProfiler(self.rotaeno.profiler.enabled)
+        try:
+            rotaeno.run(input_video,
+                        output_video=self.output_dir / f"{input_video.stem}_out{input_video.suffix}",
+                        output_mask=(self.output_dir / f"{input_video.stem}_mask{input_video.suffix}"
+                                     if self.mask_output else None),
+                        ensure_rewrite=True,
+                        **self.run_kwargs)
+            destination = self.done_dir
+        except Exception:
+            log.exception(f"Failed: {name}")
+            destination = self.failed_dir
+        shutil.move(input_video, destination / name)
+        self.state.remove(name)
+        log.info(f"Moved {name} to {destination}")
+
+    def run(self, stop: Event | None = None):
+        """持续运行，直到 stop 被设置（或 Ctrl+C）"""
+        stop = stop or Event()
+        log.info(f"Watching {self.watch_dir}")
+        while not stop.is_set():
+            self.scan()
+            name = self.state.next_queued()
+            if name is not None:
+                self.process(name)
+            else:
+                stop.wait(self.interval)
+
+
+def main():
+    watch_config = config_data["watch"]
+    parser = argparse.ArgumentParser(description="Rotaeno watch folder")
+    parser.add_argument("watch_dir", nargs="?", default=watch_config["watch_dir"] or None)
+    parser.add_argument("--mask-output",
+                        action=argparse.BooleanOptionalAction,
+                        default=config_data["video"]["mask_output"],
+                        help="同时输出掩码")
+    args = parser.parse_args()
+    if args.watch_dir is None:
+        parser.error("watch_dir is required (or set [watch] watch_dir in config.toml)")
+
+    daemon = WatchDaemon(rotaeno_from_config(watch_config["background"]),
+                         args.watch_dir,
+                         output_dir=watch_config["output_dir"] or None,
+                         done_dir=watch_config["done_dir"] or None,
+                         failed_dir=watch_config["failed_dir"] or None,
+                         extensions=watch_config["extensions"],
+                         interval=watch_config["interval"],
+                         stable_seconds=watch_config["stable_seconds"],
+                         mask_output=args.mask_output,
+                         run_kwargs=run_kwargs_from_config())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        log.info("Stopped")
+
+
+if __name__ == "__main__":
+    main()
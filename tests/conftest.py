@@ -0,0 +1,18 @@
+from shutil import which
+
+import pytest
+
+from rotaeno_stablizer.benchmark import BenchCase, synthetic_video
+
+
+@pytest.fixture(scope="session")
+def synthetic(tmp_path_factory):
+    """按规格（见 BenchCase.from_spec）与直播模式版本生成合成录像，同一会话内复用"""
+    if which("ffmpeg") is None or which("ffprobe") is None:
+        pytest.skip("ffmpeg not found")
+    work_dir = tmp_path_factory.mktemp("videos")
+
+    def make(spec: str, version: int = 2):
+        return synthetic_video(BenchCase.from_spec(spec), version, work_dir)
+
+    return make
@@ -0,0 +1,158 @@
+import io
+import threading
+import time
+import urllib.error
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from PIL import Image
+
+from rotaeno_stablizer.background import cached_paint_msg
+from rotaeno_stablizer.cache import AssetCache, CoverCache, file_digest
+
+
+class CoverHandler(BaseHTTPRequestHandler):
+    """按 server 上的属性返回封面，并记录每个请求的条件头与响应状态"""
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.headers.get("If-None-Match"),
+                                self.headers.get("If-Modified-Since")))
+        if server.delay:
+            time.sleep(server.delay)
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        etag, last_modified = server.etag, server.last_modified
+        if ((etag and self.headers.get("If-None-Match") == etag) or
+            (last_modified and self.headers.get("If-Modified-Since") == last_modified)):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if etag:
+            self.send_header("ETag", etag)
+        if last_modified:
+            self.send_header("Last-Modified", last_modified)
+        self.send_header("Content-Length", str(len(server.body)))
+        self.end_headers()
+        self.wfile.write(server.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), CoverHandler)
+    httpd.body = b"cover-v1"
+    httpd.etag = '"v1"'
+    httpd.last_modified = None
+    httpd.status = 200
+    httpd.delay = 0.
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/cover.png"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_etag_revalidation(server, tmp_path):
+    cache = CoverCache(tmp_path)
+    path, meta = cache.fetch(server.url)
+    assert path.read_bytes() == b"cover-v1"
+    assert meta["etag"] == '"v1"'
+    assert meta["digest"] == file_digest(path)
+
+    # 未修改：带 If-None-Match 请求，得到 304，沿用缓存
+    assert cache.fetch(server.url) == (path, meta)
+    assert server.requests[-1][0] == '"v1"'
+
+    # 服务器上的封面更新后重新下载，哈希随之改变
+    server.body, server.etag = b"cover-v2", '"v2"'
+    path, updated = cache.fetch(server.url)
+    assert path.read_bytes() == b"cover-v2"
+    assert updated["digest"] != meta["digest"]
+
+
+def test_last_modified_revalidation(server, tmp_path):
+    server.etag = None
+    server.last_modified = "Wed, 21 Oct 2015 07:28:00 GMT"
+    cache = CoverCache(tmp_path)
+    path, meta = cache.fetch(server.url)
+    assert meta["last_modified"] == server.last_modified
+
+    assert cache.fetch(server.url) == (path, meta)
+    assert server.requests[-1] == (None, server.last_modified)
+
+
+def test_server_down_uses_cached(server, tmp_path):
+    cache = CoverCache(tmp_path)
+    path, meta = cache.fetch(server.url)
+    server.shutdown()
+    server.server_close()
+    assert cache.fetch(server.url) == (path, meta)
+    with pytest.raises(urllib.error.URLError):
+        CoverCache(tmp_path / "empty").fetch(server.url)
+
+
+def test_server_error_uses_cached(server, tmp_path):
+    cache = CoverCache(tmp_path)
+    path, meta = cache.fetch(server.url)
+    server.status = 503
+    assert cache.fetch(server.url) == (path, meta)
+    with pytest.raises(urllib.error.HTTPError):
+        CoverCache(tmp_path / "empty").fetch(server.url)
+
+
+def test_timeout_uses_cached(server, tmp_path):
+    cache = CoverCache(tmp_path, timeout=0.2)
+    path, meta = cache.fetch(server.url)
+    server.delay = 1.
+    assert cache.fetch(server.url) == (path, meta)
+
+
+def test_eviction(server, tmp_path):
+    server.body = b"x" * 1024
+    cache = CoverCache(tmp_path, max_size=1500)
+    first, _ = cache.fetch(server.url)
+    time.sleep(0.01)
+    second, _ = cache.fetch(server.url + "?other")
+    assert second.exists()
+    assert not first.exists()
+
+
+def png(color: str) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("remote", [False, True])
+def test_assets_rebuilt_after_cover_change(server, tmp_path, remote):
+    cache_root = tmp_path / "cache"
+    local = tmp_path / "cover.png"
+
+    def update(color: str, etag: str) -> str:
+        if remote:
+            server.body, server.etag = png(color), etag
+            return server.url
+        local.write_bytes(png(color))
+        return str(local)
+
+    def render(cover: str, name: str) -> bytes:
+        paint_msg = cached_paint_msg(240, 320, None, cover, cache_root=cache_root)
+        background = tmp_path / f"{name}.raw"
+        AssetCache(cache_root).save(paint_msg, background, tmp_path / f"{name}_alpha.raw")
+        return background.read_bytes()
+
+    first = render(update("red", '"red"'), "first")
+    assert render(update("red", '"red"'), "again") == first
+    entries = set(AssetCache(cache_root).directory.iterdir())
+
+    # 同一路径或地址上的封面换了内容：重新绘制背景，而不是沿用进程内或磁盘上的旧素材
+    changed = render(update("blue", '"blue"'), "changed")
+    assert changed != first
+    assert len(set(AssetCache(cache_root).directory.iterdir()) - entries) == 1
@@ -0,0 +1,92 @@
+import socket
+from threading import Event, Thread
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from rotaeno_stablizer import Rotaeno
+from rotaeno_stablizer.distributed import Coordinator, SegmentTask, Worker
+from rotaeno_stablizer.ffmpeg import VideoInfo
+from rotaeno_stablizer.rotation_calc import ExtractSegment
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_localhost_workers(synthetic, tmp_path):
+    video = synthetic("320x240@30:25")
+    output = tmp_path / "output.mp4"
+    port = free_port()
+    coordinator = Coordinator(Rotaeno(cache_dir=tmp_path / "cache",
+                                      scratch_dir=tmp_path,
+                                      extract_segments=1),
+                              video,
+                              output,
+                              port=port,
+                              segments=3,
+                              encoder="libx264",
+                              decoder="h264")
+    errors = []
+
+    def run_coordinator():
+        try:
+            coordinator.run()
+        except BaseException as e:
+            errors.append(e)
+
+    coordinator_thread = Thread(target=run_coordinator)
+    coordinator_thread.start()
+    stop = Event()
+    # 名称含空格与非 ASCII 字符，上传路径中需要转义
+    workers = [
+        Thread(target=Worker(f"http://127.0.0.1:{port}",
+                             name=name,
+                             work_dir=tmp_path,
+                             poll=0.2,
+                             decoder="h264",
+                             use_cache=False).run,
+               kwargs={"stop": stop, "once": True})
+        for name in ("worker one", "工作端 2")
+    ]
+    for worker in workers:
+        worker.start()
+    coordinator_thread.join(120)
+    stop.set()
+    for worker in workers:
+        worker.join(30)
+
+    assert not coordinator_thread.is_alive() and not errors
+    assert len(coordinator.tasks) > 1
+    assert all(task.status == "done" and task.attempts == 1 for task in coordinator.tasks)
+    info = VideoInfo(output, count_frames=True)
+    assert info.frames == round(VideoInfo(video).duration * 30)
+
+
+@pytest.mark.parametrize("path, status", [
+    ("/results/0/1/worker", 404),
+    ("/result/0/1", 404),
+    ("/result/x/1/worker", 400),
+    ("/result/0/one/worker", 400),
+    ("/result/5/1/worker", 404),
+    ("/result/-1/1/worker", 404),
+])
+def test_put_rejects_bad_paths(tmp_path, path, status):
+    coordinator = Coordinator(Rotaeno(scratch_dir=tmp_path),
+                              tmp_path / "input.mp4",
+                              tmp_path / "output.mp4",
+                              port=0)
+    coordinator.tasks = [SegmentTask(0, ExtractSegment(None, 0, None))]
+    server = coordinator.serve()
+    try:
+        request = Request(f"http://127.0.0.1:{server.server_port}{path}", b"data",
+                          method="PUT")
+        with pytest.raises(HTTPError) as e:
+            urlopen(request, timeout=10)
+        assert e.value.code == status
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from rotaeno_stablizer import Rotaeno
+from rotaeno_stablizer.ffmpeg import FFMpegError
+from rotaeno_stablizer.track import read_track
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_engines_produce_identical_tracks(synthetic, tmp_path, version):
+    video = synthetic("320x240@30:4", version)
+    tracks = []
+    for engine in ("ffmpeg", "python"):
+        track = tmp_path / f"{engine}.rtrk"
+        Rotaeno(rotation_version=version,
+                engine=engine,
+                cache_dir=tmp_path / "cache",
+                scratch_dir=tmp_path).run(video,
+                                          tmp_path / f"{engine}.mp4",
+                                          output_track=track,
+                                          using_hardware_acc=False,
+                                          encoder="libx264",
+                                          decoder="h264",
+                                          use_cache=False)
+        _, blocks = read_track(track)
+        tracks.append(np.concatenate([np.empty(0), *blocks]))
+    assert len(tracks[0]) > 0
+    np.testing.assert_array_equal(*tracks)
+
+
+def test_encoder_failure_reports_stderr(synthetic, tmp_path):
+    video = synthetic("320x240@30:2")
+    rotaeno = Rotaeno(engine="python", cache_dir=tmp_path / "cache", scratch_dir=tmp_path)
+    with pytest.raises(FFMpegError, match="no_such_encoder"):
+        rotaeno.run(video, tmp_path / "output.mp4", using_hardware_acc=False,
+                    encoder="no_such_encoder", decoder="h264")
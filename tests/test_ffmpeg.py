@@ -0,0 +1,44 @@
+from threading import Event
+
+import pytest
+
+from rotaeno_stablizer.ffmpeg import FFMpegCapabilities, FFMpegProgress, get_ffmpeg
+
+
+def test_progress_events(synthetic):
+    video = synthetic("320x240@30:4")
+    events = list(FFMpegProgress([get_ffmpeg(), "-i", video, "-f", "null", "-"]).events())
+    frames = [event.frame for event in events]
+    assert frames == sorted(frames)
+    assert events[-1].finished and not any(event.finished for event in events[:-1])
+    assert events[-1].frame == 120
+    assert events[-1].out_time_us and events[-1].speed
+
+
+def test_progress_error_keeps_tail(tmp_path):
+    missing = tmp_path / "missing.mp4"
+    with pytest.raises(RuntimeError) as e:
+        list(FFMpegProgress([get_ffmpeg(), "-i", missing, "-f", "null", "-"],
+                            log_lines=2).events())
+    tail = str(e.value).partition(": ")[2]
+    assert "missing.mp4" in tail and len(tail.splitlines()) <= 2
+
+
+def test_hw_probe_cancel_is_not_cached(synthetic, tmp_path):
+    # synthetic 用于在没有 ffmpeg 时跳过
+    synthetic("320x240@30:1")
+    capabilities = FFMpegCapabilities(tmp_path)
+    cancel = Event()
+    probe = capabilities.iter_hw_codecs("h264", cancel)
+    first = next(probe, None)
+    if first is None:
+        pytest.skip("no h264 encoder available")
+    cancel.set()
+    assert list(probe) == []
+    assert "h264" not in capabilities.data["codecs"]
+    assert FFMpegCapabilities(tmp_path).data["codecs"] == {}
+
+    # 完整探测后写入缓存，新实例直接读取
+    coders = list(capabilities.iter_hw_codecs("h264"))
+    assert first in coders
+    assert "h264" in FFMpegCapabilities(tmp_path).data["codecs"]
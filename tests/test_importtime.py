@@ -0,0 +1,53 @@
+"""命令行启动的导入耗时
+
+用 `python -X importtime` 导入 rotaeno_stablizer.__main__（不运行），
+要求不加载界面、PIL 与进度条模块，且累计导入耗时（多次取中位数）不超过预算。
+"""
+import re
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+TARGET = "rotaeno_stablizer.__main__"
+BUDGET_MS = 400.  # 累计导入耗时预算（毫秒）
+RUNS = 5  # 测量次数，取中位数
+# 命令行路径上不应出现的模块（顶层包名）
+FORBIDDEN = ["customtkinter", "CTkTable", "CTkMessagebox", "CTkMenuBar", "tkinter", "PIL",
+             "rich.progress"]
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def measure(target: str) -> tuple[int, set[str]]:
+    """返回 (导入 target 的累计耗时（微秒）, 加载的模块)"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {target}"],
+                            cwd=ROOT,
+                            capture_output=True,
+                            text=True,
+                            check=True)
+    modules = set()
+    total = 0
+    for line in result.stderr.splitlines():
+        if (match := LINE.match(line)) is None:
+            continue
+        _, cumulative, _, name = match.groups()
+        modules.add(name)
+        if name == target:
+            total = int(cumulative)
+    return total, modules
+
+
+def test_cli_skips_gui_modules():
+    _, modules = measure(TARGET)
+    loaded = sorted(m for m in modules
+                    if any(m == f or m.startswith(f + ".") for f in FORBIDDEN))
+    assert not loaded, f"{TARGET} imports {', '.join(loaded)}"
+
+
+def test_cli_import_budget():
+    times = [measure(TARGET)[0] / 1000 for _ in range(RUNS)]
+    median = statistics.median(times)
+    assert median <= BUDGET_MS, (f"{TARGET} import time {median:.1f} ms "
+                                 f"(budget {BUDGET_MS:.0f} ms, runs "
+                                 f"{', '.join(f'{t:.0f}' for t in times)})")
@@ -0,0 +1,148 @@
+import subprocess
+
+import numpy as np
+import pytest
+
+from rotaeno_stablizer.benchmark import QUICK_CASES, BenchCase, angle_quantum, expected_angles
+from rotaeno_stablizer.ffmpeg import get_ffmpeg, keyframe_memo
+from rotaeno_stablizer.rotation_calc import (
+    FRAME_SIZE,
+    RotationCalc,
+    read_frame_blocks,
+    shortcut_memo,
+)
+
+# 至少两段 MIN_SEGMENT_DURATION，才会切分
+SEGMENTED_CASE = "320x240@30:25"
+
+
+def extract(calc: RotationCalc, video, fps: float) -> np.ndarray:
+    return np.concatenate([np.empty(0), *calc.export_blocks(video, fps)])
+
+
+def corner_frames(video, version: int) -> np.ndarray:
+    """提取进程输出的原始四角取样，N×FRAME_SIZE"""
+    commands = [get_ffmpeg(), "-loglevel", "error",
+                *RotationCalc(version).export_ffmpeg_cmd(video, 30)]
+    proc = subprocess.run(commands, stdout=subprocess.PIPE, check=True)
+    return np.frombuffer(proc.stdout, dtype=np.uint8).reshape(-1, FRAME_SIZE)
+
+
+@pytest.mark.parametrize("version", [1, 2])
+def test_batch_matches_scalar(synthetic, version):
+    frames = corner_frames(synthetic("320x240@30:4", version), version)
+    rng = np.random.default_rng(0)
+    frames = np.vstack([
+        frames,
+        rng.integers(0, 256, (1000, FRAME_SIZE), dtype=np.uint8),
+        # V1 左角与中心同色（left_length 为 0）、全黑、全白
+        np.array([[9, 9, 9, 1, 2, 3, 9, 9, 9, 4, 5, 6]], dtype=np.uint8),
+        np.zeros((1, FRAME_SIZE), dtype=np.uint8),
+        np.full((1, FRAME_SIZE), 255, dtype=np.uint8),
+    ])
+    calc = RotationCalc(version)
+    batch = calc.batch_method(frames)
+    scalar = np.array([calc.method(row) for row in frames.tolist()])
+    assert batch.dtype == np.float64
+    # 逐位一致，而不只是数值接近
+    assert batch.tobytes() == scalar.tobytes()
+
+
+class DripStream:
+    """每次 readinto 只返回几个字节的管道，模拟短读"""
+
+    def __init__(self, data: bytes, sizes: list[int]) -> None:
+        self.data = memoryview(data)
+        self.sizes = sizes
+        self.reads = 0
+
+    def readinto(self, buffer) -> int:
+        n = min(self.sizes[self.reads % len(self.sizes)], len(buffer), len(self.data))
+        buffer[:n] = self.data[:n]
+        self.data = self.data[n:]
+        self.reads += 1
+        return n
+
+
+@pytest.mark.parametrize("tail", [0, 1, FRAME_SIZE - 1])
+def test_read_frame_blocks_partial_trailing_frame(synthetic, caplog, tail):
+    frames = corner_frames(synthetic("320x240@30:4"), 2)
+    stream = DripStream(frames.tobytes() + bytes(tail), [5, 12, 7, 100, 1])
+    blocks = list(read_frame_blocks(stream, FRAME_SIZE, block_frames=16))
+    assert all(0 < len(block) <= 16 for block in blocks)
+    np.testing.assert_array_equal(np.vstack(blocks), frames)
+    assert ("incomplete trailing frame" in caplog.text) == bool(tail)
+
+
+def test_segmented_matches_single_process(synthetic):
+    video = synthetic(SEGMENTED_CASE)
+    segmented = RotationCalc(segments=3)
+    assert len(segmented.plan_segments(video, 30)) > 1
+    assert np.array_equal(extract(segmented, video, 30),
+                          extract(RotationCalc(segments=1), video, 30))
+
+
+def test_segment_mismatch_falls_back_from_seek(synthetic, monkeypatch):
+    video = synthetic(SEGMENTED_CASE)
+    calc = RotationCalc(segments=3)
+    plan = calc.plan_segments(video, 30)
+    extract_segment = RotationCalc.extract_segment
+    commands = []
+
+    def fail_second(self, video_name, fps, codec, segment, *args, **kwargs):
+        if segment == plan[1]:
+            return None
+        return extract_segment(self, video_name, fps, codec, segment, *args, **kwargs)
+
+    def record(self, cmd):
+        commands.append(cmd)
+        return run_extraction(self, cmd)
+
+    run_extraction = RotationCalc.run_extraction
+    monkeypatch.setattr(RotationCalc, "extract_segment", fail_second)
+    monkeypatch.setattr(RotationCalc, "run_extraction", record)
+    angles = extract(calc, video, 30)
+    # 单进程提取从失败段的关键帧开始，而不是从头解码
+    assert f"{plan[1].seek + 1e-6:.6f}" in commands[-1]
+    assert np.array_equal(angles, extract(RotationCalc(segments=1), video, 30))
+
+
+@pytest.mark.parametrize("version", [1, 2])
+@pytest.mark.parametrize("spec", QUICK_CASES)
+def test_fast_profile_matches_accurate(synthetic, spec, version):
+    video = synthetic(spec, version)
+    fps = BenchCase.from_spec(spec).fps
+    shortcut_memo.clear()
+    fast = RotationCalc(version, segments=1, profile="fast")
+    angles = extract(fast, video, fps)
+    assert np.array_equal(angles, extract(RotationCalc(version, segments=1), video, fps))
+    if version == 2:
+        # V2 的四角为纯黑白色块，捷径应当通过校验，确实测到了 fast 的解码路径
+        assert fast.resolve_shortcuts(video, fps, None)
+    # V1 的灰度在有损编码后可能偏差一级
+    error = np.abs((angles - expected_angles(version, len(angles)) + 180) % 360 - 180)
+    assert error.max() <= angle_quantum(version) + 1e-9
+
+
+def test_keyframes_scanned_once(synthetic, tmp_path, monkeypatch):
+    video = synthetic(SEGMENTED_CASE)
+    scans = []
+    run = subprocess.run
+
+    def counting_run(commands, *args, **kwargs):
+        if "packet=pts_time,flags" in commands:
+            scans.append(commands)
+        return run(commands, *args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", counting_run)
+    keyframe_memo.clear()
+    calc = RotationCalc(segments=3, profile="fast", cache_dir=tmp_path, use_cache=True)
+    segments = calc.plan_segments(video, 30)
+    calc.validation_windows(video, 30)
+    RotationCalc(segments=3).plan_segments(video, 30)
+    assert len(scans) == 1
+
+    # 进程内缓存清空后从磁盘缓存读取
+    keyframe_memo.clear()
+    assert calc.plan_segments(video, 30) == segments
+    assert len(scans) == 1
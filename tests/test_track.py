@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from rotaeno_stablizer.track import read_track, read_track_info, store_track, write_track
+
+
+def aborted(blocks):
+    yield from blocks
+    raise RuntimeError("extraction aborted")
+
+
+def test_store_track_roundtrip(tmp_path):
+    path = tmp_path / "video.rtrk"
+    angles = np.arange(100) / 4096 * -360
+    assert write_track(path, [angles[:60], angles[60:]], 60., 2) == 100
+    info, blocks = read_track(path)
+    assert (info.fps, info.version, info.frames) == (60., 2, 100)
+    np.testing.assert_array_equal(np.concatenate(list(blocks)), angles)
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
+
+
+def test_aborted_store_leaves_no_track(tmp_path):
+    path = tmp_path / "video.rtrk"
+    with pytest.raises(RuntimeError):
+        for _ in store_track(path, aborted([np.zeros(10)]), 60., 2):
+            pass
+    assert not any(tmp_path.iterdir())
+
+
+def test_aborted_store_keeps_previous_track(tmp_path):
+    path = tmp_path / "video.rtrk"
+    write_track(path, [np.zeros(10)], 60., 2)
+    with pytest.raises(RuntimeError):
+        write_track(path, aborted([np.ones(5)]), 60., 2)
+    # 消费者提前停止迭代同样不会替换已有轨道
+    blocks = store_track(path, [np.ones(5), np.ones(5)], 60., 2)
+    next(blocks)
+    blocks.close()
+    assert read_track_info(path).frames == 10
+    assert [p.name for p in tmp_path.iterdir()] == [path.name]
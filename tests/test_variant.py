@@ -0,0 +1,36 @@
+from dataclasses import fields
+from pathlib import Path
+
+import pytest
+
+from rotaeno_stablizer import VARIANT_OPTIONS, OutputVariant
+
+
+def test_from_spec():
+    variant = OutputVariant.from_spec(
+        "out_720.mp4,height=720,display-all=false,circle_crop=yes,encoder= libx264 ")
+    assert variant == OutputVariant(Path("out_720.mp4"),
+                                    circle_crop=True,
+                                    display_all=False,
+                                    height=720,
+                                    encoder="libx264")
+
+
+@pytest.mark.parametrize("path", [
+    r"D:\录屏,2024\out_720.mp4",
+    "clips/a,b/out,720.mp4",
+])
+def test_from_spec_keeps_commas_in_path(path):
+    variant = OutputVariant.from_spec(f"{path},height=720, bitrate=6M")
+    assert variant == OutputVariant(Path(path), height=720, bitrate="6M")
+    assert OutputVariant.from_spec(path) == OutputVariant(Path(path))
+
+
+def test_options_cover_fields():
+    assert set(VARIANT_OPTIONS) == {f.name for f in fields(OutputVariant)} - {"output_video"}
+
+
+@pytest.mark.parametrize("spec", ["out.mp4,output_video=x.mp4", "out.mp4,size=720"])
+def test_unknown_option(spec):
+    with pytest.raises(ValueError):
+        OutputVariant.from_spec(spec)